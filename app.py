@@ -4,27 +4,35 @@ import json
 import logging
 from datetime import datetime
 import io
+import hmac
 import time 
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, render_template, request, session, redirect, url_for, flash, send_file
-import requests
-from playwright.sync_api import sync_playwright
+from flask import Flask, render_template, request, session, redirect, url_for, flash, send_file, Response, stream_with_context, jsonify
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from sqlalchemy import func 
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 # MODÜLLER
 from config import BASE_PROMPT, CATEGORIES, PETITION_HTML_TEMPLATE
-from ocr_service import extract_text_from_file
-from models import db, User, Petition
-from logic_services import search_legal_docs, check_rules
+from ocr_service import extract_text_from_file, receive_upload, spool_upload, active_engine, UploadRequest, MAX_FILE_SIZE, TOO_LARGE_ERROR
+from ocr_jobs import ocr_queue, QueueFullError
+from models import db, User, Petition, PetitionRollup, ensure_columns, ensure_indexes, petition_page, encode_cursor, decode_cursor, backfill_rollup, rollup_summary, database_config
+from logic_services import search_legal_docs, check_rules, knowledge_reloader
+from cache_service import LLMResponseCache, SHARED_STATE_URL, shared_cache
+from tracing import traced, trace_context, stage, current_timings, render_metrics, render_info, METRICS_CONTENT_TYPE
+from pdf_service import html_to_pdf, cached_pdf, html_etag
+from llm_service import LLMClient, LLMUnavailable, JsonFieldStreamer, iter_chat_stream, sse, LLM_DEADLINE
 
 load_dotenv()
 
 app = Flask(__name__)
+# Yüklenen dosyanın türü/boyutu gövde ağdan geldikçe denetlenir, küçük dosyalar önbellek kontrolüne kadar bellekte kalır
+app.request_class = UploadRequest
 app.secret_key = os.getenv("FLASK_SECRET", "bitirme2025_gizli_anahtar")
 
 # ========================
@@ -35,14 +43,17 @@ limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["200 per day", "50 per hour"], # Genel sınır
-    storage_uri="memory://" # Basitlik için hafızada tutuyoruz
+    storage_uri=SHARED_STATE_URL # Sayaçlar tüm worker'larda ortak (cache_service.py); memory:// = worker başına
 )
 
 # ========================
 # VERİTABANI VE LOGIN
 # ========================
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+# Bağlantı adresi DATABASE_URL ortam değişkeninden (varsayılan: yerel SQLite); havuz ve SQLite PRAGMA'ları models.py'de
+app.config['SQLALCHEMY_DATABASE_URI'], app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database_config()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Dosya sınırının üstündeki istekler Content-Length'e bakılarak gövde okunmadan reddedilir (form alanları için pay bırakılır)
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + 1024 * 1024
 db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -51,23 +62,51 @@ login_manager.login_view = "auth"
 with app.app_context():
     try:
         db.create_all()
+        ensure_columns()
+        ensure_indexes()
+        # Özet tablo yeni eklendiyse geçmiş bir kez doldurulur (sonrasında her kayıtla artımlı güncellenir)
+        if PetitionRollup.query.first() is None and Petition.query.first() is not None: backfill_rollup()
     except Exception as e:
         print(f"Veritabanı başlatma hatası: {e}")
+    finally:
+        # gunicorn --preload: ana süreçte açılan bağlantılar fork ile worker'lara devredilmesin
+        db.session.remove()
+        db.engine.dispose()
 
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        return User.query.get(int(user_id))
+        return db.session.get(User, int(user_id))
     except:
         return None
 
 logging.basicConfig(level=logging.INFO, handlers=[logging.FileHandler("app.log"), logging.StreamHandler()])
 logger = logging.getLogger(__name__)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+LLM_MODEL = "gpt-4o-mini"
+LLM_TEMPERATURE = 0.1
+
+# Aynı bağlam (kategori + açıklama + OCR + kurallar + RAG) için LLM'e tekrar gidilmez
+llm_cache = LLMResponseCache(os.getenv("LLM_CACHE_PATH", "llm_cache.db"), max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")))
+# Worker başına tek keep-alive bağlantı havuzu + devre kesici
+llm_client = LLMClient(OPENAI_API_KEY)
+# Akışlı üretim için hazırlanan bağlamlar (cookie session'a sığmayacak kadar büyük olabilir).
+# Formu alan worker ile /stream'e bağlanan worker farklı olabileceği için ortak depoda tutulur
+stream_jobs = shared_cache("stream_jobs", maxsize=256, ttl=300)
+# Akışlı üretim SSE bağlantısından bağımsız arka plan thread'inde koşar (istemci koparsa da tamamlanıp kaydedilir)
+stream_executor = ThreadPoolExecutor(max_workers=int(os.getenv("STREAM_WORKERS", "8")), thread_name_prefix="stream-job")
+STREAM_FLUSH_INTERVAL = 0.2                # Üretilen metin ortak depoya en sık bu aralıkla yazılır (sn)
+STREAM_POLL_INTERVAL = 0.1                 # /stream ortak depoyu bu aralıkla okur (sn)
+STREAM_JOB_TIMEOUT = LLM_DEADLINE + 30     # Üretimi yapan worker ölürse /stream en geç bu sürede vazgeçer
+STREAM_BROKEN_MESSAGE = "Dilekçe üretimi yarıda kesildi. Lütfen tekrar deneyin."
+# tesserocr kurulamadıysa auto modu sessizce pytesseract'a düşer; hangi motorun çalıştığı log ve /metrics'te görünür
+OCR_ACTIVE_ENGINE = active_engine()
+logger.info(f"OCR motoru: {OCR_ACTIVE_ENGINE}")
 
 # --- MOCK DATA ---
-def get_mock_response(user_text="", ocr_text="", rules_feedback="", rag_context=""):
-    time.sleep(0.8)
+def get_mock_response(user_text="", ocr_text="", rules_feedback="", rag_context="", delay=0.8):
+    # delay: demo modunda gerçek API'yi taklit eder; hata fallback'lerinde 0 verilir ki worker boşuna beklemesin
+    if delay: time.sleep(delay)
     mock_usage = {"total_tokens": 450, "processing_time": 0.85}
     total_len = len(str(user_text)) + len(str(ocr_text))
     if total_len < 30:
@@ -91,38 +130,176 @@ def call_llm(prompt_context, user_text="", ocr_text="", rules="", rag="") -> dic
         return get_mock_response(user_text, ocr_text, rules, rag)
 
     full_prompt = BASE_PROMPT.format(context_data=prompt_context)
+    cache_key = llm_cache.make_key(LLM_MODEL, LLM_TEMPERATURE, full_prompt)
+    cached = llm_cache.get(cache_key)
+    if cached:
+        result, saved_tokens, saved_time = cached
+        result["usage"] = {"total_tokens": 0, "processing_time": round(time.time() - start_time, 4),
+                           "cache_hit": True, "saved_tokens": saved_tokens, "saved_time": saved_time}
+        return result
+
     payload = {
-        "model": "gpt-4o-mini",
+        "model": LLM_MODEL,
         "messages": [{"role": "user", "content": full_prompt}],
-        "temperature": 0.1,
+        "temperature": LLM_TEMPERATURE,
         "response_format": {"type": "json_object"}
     }
     
     result = {}
     tokens = 0
+    from_api = False
     try:
-        r = requests.post("https://api.openai.com/v1/chat/completions", headers={"Authorization": f"Bearer {OPENAI_API_KEY}"}, json=payload, timeout=60)
-        if r.status_code != 200:
-            result = get_mock_response(user_text, ocr_text, rules, rag)
-        else:
-            response_json = r.json()
-            result = json.loads(response_json["choices"][0]["message"]["content"])
-            tokens = response_json.get("usage", {}).get("total_tokens", 0)
+        response_json = llm_client.chat(payload).json()
+        result = json.loads(response_json["choices"][0]["message"]["content"])
+        tokens = response_json.get("usage", {}).get("total_tokens", 0)
+        from_api = True
+    except LLMUnavailable as e:
+        logger.error(f"LLM Erişilemiyor: {e}")
+        result = get_mock_response(user_text, ocr_text, rules, rag, delay=0)
     except Exception as e:
         logger.error(f"LLM Hatası: {e}")
-        result = get_mock_response(user_text, ocr_text, rules, rag)
+        result = get_mock_response(user_text, ocr_text, rules, rag, delay=0)
     
     duration = round(time.time() - start_time, 2)
+    # Sadece gerçek API yanıtları önbelleğe alınır (mock/fallback yanıtlar değil)
+    if from_api: llm_cache.set(cache_key, result, tokens, duration)
     result["usage"] = {"total_tokens": tokens, "processing_time": duration}
     return result
 
+# --- AKIŞLI LLM ÇAĞRISI (SSE) ---
+def stream_llm(prompt_context, user_text="", ocr_text="", rules="", rag=""):
+    """("token", metin) parçaları üretir; en sonda ("done", sonuç dict) verir. Sonuç call_llm ile aynı formattadır.
+    Akış metin gönderdikten sonra koparsa ("error", mesaj) ile biter: gösterilen metin yarımdır, yerine yedek konmaz."""
+    start_time = time.time()
+    if not OPENAI_API_KEY or "benim keyim" in OPENAI_API_KEY:
+        result = get_mock_response(user_text, ocr_text, rules, rag, delay=0)
+        text = result.get("dilekce_metni", "")
+        for i in range(0, len(text), 20):
+            time.sleep(0.02)
+            yield "token", text[i:i + 20]
+        yield "done", result
+        return
+
+    full_prompt = BASE_PROMPT.format(context_data=prompt_context)
+    cache_key = llm_cache.make_key(LLM_MODEL, LLM_TEMPERATURE, full_prompt)
+    cached = llm_cache.get(cache_key)
+    if cached:
+        result, saved_tokens, saved_time = cached
+        yield "token", result.get("dilekce_metni", "")
+        result["usage"] = {"total_tokens": 0, "processing_time": round(time.time() - start_time, 4),
+                           "cache_hit": True, "saved_tokens": saved_tokens, "saved_time": saved_time}
+        yield "done", result
+        return
+
+    payload = {
+        "model": LLM_MODEL,
+        "messages": [{"role": "user", "content": full_prompt}],
+        "temperature": LLM_TEMPERATURE,
+        "response_format": {"type": "json_object"},
+        "stream": True,
+        "stream_options": {"include_usage": True}
+    }
+    content, tokens, first_token_at = [], 0, None
+    field = JsonFieldStreamer("dilekce_metni")
+    try:
+        with llm_client.chat(payload, stream=True) as r:
+            for delta, usage in iter_chat_stream(r):
+                if usage: tokens = usage.get("total_tokens", 0)
+                if not delta: continue
+                content.append(delta)
+                piece = field.feed(delta)
+                if piece:
+                    if first_token_at is None: first_token_at = time.time()
+                    yield "token", piece
+        result = json.loads("".join(content))
+    except Exception as e:
+        logger.error(f"LLM Akış Hatası: {e}")
+        if field.pos is not None:
+            yield "error", STREAM_BROKEN_MESSAGE
+            return
+        # Akış hiç metin üretemeden düştüyse yedek metni tek parça gönder; yedek gerçek dilekçe olarak kaydedilmez
+        result = dict(get_mock_response(user_text, ocr_text, rules, rag, delay=0), fallback=True)
+        yield "token", result.get("dilekce_metni", "")
+        yield "done", result
+        return
+
+    duration = round(time.time() - start_time, 2)
+    if first_token_at: logger.info(f"LLM ilk token süresi: {round(first_token_at - start_time, 2)} sn, toplam: {duration} sn")
+    llm_cache.set(cache_key, result, tokens, duration)
+    result["usage"] = {"total_tokens": tokens, "processing_time": duration}
+    yield "done", result
+
+def save_petition(result, kategori, ocr_text, user_id, stage_timings=None):
+    """DILEKCE_HAZIR sonucunu kaydeder, kayıt id'sini döner (hata olursa None).
+    stage_timings verilmezse aktif istek izindeki aşama süreleri (OCR, kural, RAG, LLM) saklanır."""
+    try:
+        usage = result.get("usage", {})
+        new_petition = Petition(
+            category=CATEGORIES[kategori]["title"],
+            content=result.get("dilekce_metni", ""),
+            advice=result.get("hukuki_oneriler", ""),
+            ocr_data=ocr_text,
+            user_id=user_id,
+            processing_time=usage.get("processing_time", 0.0),
+            token_count=usage.get("total_tokens", 0),
+            cost_usd=(usage.get("total_tokens", 0) * 0.00000015),
+            cache_hit=usage.get("cache_hit", False),
+            saved_tokens=usage.get("saved_tokens", 0),
+            stage_timings=stage_timings if stage_timings is not None else current_timings()
+        )
+        db.session.add(new_petition)
+        # Commit süresi kayda girmeden önce bilinemez; ikinci yazma yapılmaz, yalnızca aşama histogramına düşer
+        with stage("db_commit"): db.session.commit()
+        return new_petition.id
+    except Exception as e:
+        logger.error(f"DB Hatası: {e}")
+        db.session.rollback()
+        return None
+
+def run_stream_job(job_id, job):
+    """Akış işini sonuna kadar üretir ve kaydeder. İlerleme (metin, durum, sonuç) stream_jobs'a yazılır;
+    /stream hangi worker'a düşerse düşsün oradan okur, yeniden bağlanan istemci kaldığı yerden devam eder."""
+    text, result, error, last_flush = [], None, None, time.monotonic()
+    # Üretim istek dışında koştuğu için kendi izini açar: llm ve db_commit aşamaları aynı histogramlara düşer
+    with app.app_context(), trace_context("stream_job", "POST"):
+        try:
+            with stage("llm"):
+                for kind, payload in stream_llm(job["context"], job["aciklama"], job["ocr_text"], job["rules"], job["rag"]):
+                    if kind == "done":
+                        result = payload
+                        continue
+                    if kind == "error":
+                        error = payload
+                        break
+                    text.append(payload)
+                    if time.monotonic() - last_flush >= STREAM_FLUSH_INTERVAL:
+                        stream_jobs.set(job_id, dict(job, state="running", text="".join(text)))
+                        last_flush = time.monotonic()
+        except Exception as e:
+            logger.error(f"Akış İşi Hatası: {e}")
+            if text: error = STREAM_BROKEN_MESSAGE
+        if error:
+            # Kullanıcı yarım gerçek metni gördü; yedek metinle "hazır" dilekçe kaydedilmez
+            stream_jobs.set(job_id, dict(job, state="error", text="".join(text), error=error))
+            return
+        if result is None:
+            # Hiç metin gelmeden düştü: yedek taslak gösterilir ama kaydedilmez
+            result = dict(get_mock_response(job["aciklama"], job["ocr_text"], job["rules"], job["rag"], delay=0), fallback=True)
+            text.append(result.get("dilekce_metni", ""))
+        done = {"status": result.get("status"), "hitap_makam": result.get("hitap_makam", ""),
+                "hukuki_oneriler": result.get("hukuki_oneriler", ""), "questions": result.get("questions", []),
+                "fallback": bool(result.get("fallback"))}
+        if result.get("status") == "DILEKCE_HAZIR" and not result.get("fallback"):
+            # Akışta LLM bu thread'de çalışır; hazırlık aşamaları dilekçe formunu gönderen istekten gelir
+            timings = dict(job.get("timings", {}), **current_timings())
+            done["petition_id"] = save_petition(result, job["kategori"], job["ocr_text"], job["user_id"], timings)
+        # İş, TTL dolana kadar saklanır: done gönderildikten sonra gelen yeniden bağlanma da sonucu alır
+        stream_jobs.set(job_id, dict(job, state="done", text="".join(text), done=done))
+
 def html_to_pdf_playwright(html_content: str) -> bytes:
+    # Her istekte yeni Chromium başlatmak yerine worker'a ait sıcak tarayıcı havuzu kullanılır (pdf_service.py)
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_content(html_content)
-            return page.pdf(format="A4", margin={"top":"2.5cm","right":"2.5cm","bottom":"2.5cm","left":"2.5cm"})
+        return html_to_pdf(html_content)
     except Exception as e:
         logger.error(f"PDF Motoru Hatası: {e}")
         raise e
@@ -178,10 +355,15 @@ def logout():
 @login_required
 def dashboard():
     try:
-        user_petitions = Petition.query.filter_by(user_id=current_user.id).order_by(Petition.date_created.desc()).all()
-        return render_template("dashboard.html", petitions=user_petitions)
+        petitions, next_cursor = petition_page(current_user.id, decode_cursor(request.args.get("before")))
+        return render_template("dashboard.html", petitions=petitions, next_cursor=encode_cursor(next_cursor),
+                               first_page=not request.args.get("before"))
     except: return redirect(url_for("index"))
 
+@app.before_request
+def start_background_workers():
+    knowledge_reloader.start()
+
 @app.route("/admin")
 @login_required
 def admin_panel():
@@ -189,20 +371,34 @@ def admin_panel():
         flash("Yetkisiz alan.", "danger"); return redirect(url_for("dashboard"))
     
     total_users = User.query.count()
-    total_petitions = Petition.query.count()
-    category_stats = db.session.query(Petition.category, func.count(Petition.id)).group_by(Petition.category).all()
-    avg_time = db.session.query(func.avg(Petition.processing_time)).scalar() or 0.0
-    total_tokens = db.session.query(func.sum(Petition.token_count)).scalar() or 0
-    total_cost = db.session.query(func.sum(Petition.cost_usd)).scalar() or 0.0
-    
-    labels = [c[0] for c in category_stats]
-    data = [c[1] for c in category_stats]
+    stats = rollup_summary()
+    labels, data = list(stats["categories"]), list(stats["categories"].values())
     
-    return render_template("admin.html", total_users=total_users, total_petitions=total_petitions, labels=labels, data=data, avg_time=round(avg_time, 2), total_tokens=total_tokens, total_cost=round(total_cost, 5))
+    return render_template("admin.html", total_users=total_users, total_petitions=stats["total_petitions"], labels=labels, data=data,
+                           avg_time=round(stats["avg_time"], 2), p50=round(stats["p50"], 2), p95=round(stats["p95"], 2),
+                           total_tokens=stats["total_tokens"], total_cost=round(stats["total_cost"], 5), cache_hits=stats["cache_hits"],
+                           saved_tokens=stats["saved_tokens"], series=stats["series"], knowledge=knowledge_reloader.stats())
+
+@app.cli.command("rollup-backfill")
+def rollup_backfill_command():
+    """Metrik özet tablosunu dilekçe geçmişinden yeniden kurar: flask --app app rollup-backfill"""
+    print(f"{backfill_rollup()} özet satırı yazıldı.")
+
+@app.route("/admin/reload", methods=["POST"])
+@login_required
+def admin_reload():
+    if current_user.username != "admin":
+        flash("Yetkisiz alan.", "danger"); return redirect(url_for("dashboard"))
+    # Dosyalar değişmemiş olsa da yeniden kurar (ör. embedding deposu elle temizlendiyse). Kurulum bu istekte değil,
+    # her worker'ın yoklama thread'inde yapılır; sonuç admin panelinde görünür
+    knowledge_reloader.request_reload()
+    flash("Yenileme tüm worker'lara iletildi, arka planda kuruluyor.", "success")
+    return redirect(url_for("admin_panel"))
 
 @app.route("/", methods=["GET", "POST"])
 @login_required
 @limiter.limit("10 per minute") # Dilekçe oluşturma sınırı
+@traced("index")
 def index():
     try:
         if request.method == "GET":
@@ -214,10 +410,20 @@ def index():
         
         ocr_text = ""
         uploaded_file = request.files.get("dosya")
+        ocr_job_id = request.form.get("ocr_job_id")
+        res = None
         if uploaded_file and uploaded_file.filename != '':
-            res = extract_text_from_file(uploaded_file)
+            with stage("ocr"): res = extract_text_from_file(uploaded_file)
+        elif ocr_job_id:
+            # Belge form gönderilmeden önce /ocr/upload ile arka planda okunmuştur
+            job = ocr_queue.status(ocr_job_id, current_user.id)
+            if not job: flash("OCR Uyarısı: Belge işlemi bulunamadı veya süresi doldu.", "warning")
+            elif job["status"] in ("queued", "running"): flash("OCR Uyarısı: Belge hâlâ okunuyor, metin eklenmedi.", "warning")
+            else: res = job
+        if res:
             if "error" in res: flash(f"OCR Uyarısı: {res['error']}", "warning")
             elif "text" in res: ocr_text = res["text"]
+            if res.get("warning"): flash(f"OCR Uyarısı: {res['warning']}", "warning")
 
         kategori = request.form.get("kategori")
         aciklama = request.form.get("aciklama", "").strip()
@@ -226,32 +432,30 @@ def index():
             flash("Lütfen açıklama yazın veya belge yükleyin.", "danger")
             return redirect(url_for("index"))
 
-        rules_feedback = check_rules(kategori, aciklama, ocr_text)
-        rag_context = search_legal_docs(aciklama + " " + ocr_text, kategori)
+        with stage("rules"): rules_feedback = check_rules(kategori, aciklama, ocr_text)
+        with stage("rag"): rag_context = search_legal_docs(aciklama + " " + ocr_text, kategori)
         if rules_feedback: flash(f"SİSTEM UYARISI: {rules_feedback}", "warning")
 
         final_context = f"KULLANICI: {aciklama}\nOCR: {ocr_text}\nRULES: {rules_feedback}\nRAG: {rag_context}"
         if kategori not in CATEGORIES: return redirect(url_for("index"))
+
+        # AKIŞ MODU: Metin üretildikçe /stream üzerinden (SSE) gönderilir
+        if request.form.get("stream"):
+            job_id = uuid.uuid4().hex
+            job = {"user_id": current_user.id, "kategori": kategori, "context": final_context, "aciklama": aciklama,
+                   "ocr_text": ocr_text, "rules": rules_feedback, "rag": rag_context, "timings": current_timings(),
+                   "state": "running", "text": ""}
+            stream_jobs.set(job_id, job)
+            stream_executor.submit(run_stream_job, job_id, job)
+            session.pop('current_petition_id', None)
+            data = {"hitap_makam": "", "dilekce_metni": "", "hukuki_oneriler": ""}
+            return render_template("sonuc.html", data=data, ad_soyad=current_user.username, stream_id=job_id)
         
-        result = call_llm(final_context, aciklama, ocr_text, rules_feedback, rag_context)
+        with stage("llm"): result = call_llm(final_context, aciklama, ocr_text, rules_feedback, rag_context)
         
         if result.get("status") == "DILEKCE_HAZIR":
-            try:
-                usage = result.get("usage", {})
-                new_petition = Petition(
-                    category=CATEGORIES[kategori]["title"],
-                    content=result.get("dilekce_metni", ""),
-                    advice=result.get("hukuki_oneriler", ""),
-                    ocr_data=ocr_text,
-                    user_id=current_user.id,
-                    processing_time=usage.get("processing_time", 0.0),
-                    token_count=usage.get("total_tokens", 0),
-                    cost_usd=(usage.get("total_tokens", 0) * 0.00000015)
-                )
-                db.session.add(new_petition)
-                db.session.commit()
-                session['current_petition_id'] = new_petition.id
-            except Exception as e: logger.error(f"DB Hatası: {e}")
+            petition_id = save_petition(result, kategori, ocr_text, current_user.id)
+            if petition_id: session['current_petition_id'] = petition_id
 
         if result.get("status") == "SORGU":
             session["state"] = {"kategori": kategori, "aciklama": final_context, "ad_soyad": current_user.username, "questions": result.get("questions", [])}
@@ -260,6 +464,7 @@ def index():
         session["result"] = result
         return redirect(url_for("sonuc"))
 
+    except RequestEntityTooLarge: raise  # 413 işleyicisi kullanıcıya boyut uyarısı gösterir
     except Exception as e:
         logger.error(f"Index Error: {e}")
         flash("Bir hata oluştu.", "danger")
@@ -268,17 +473,96 @@ def index():
 def cevap_ver():
     return redirect(url_for("sonuc"))
 
+# --- ARKA PLAN OCR ---
+@app.route("/ocr/upload", methods=["POST"])
+@login_required
+@limiter.limit("20 per minute")
+def ocr_upload():
+    uploaded_file = request.files.get("dosya")
+    if not uploaded_file or uploaded_file.filename == '':
+        return jsonify({"error": "Dosya seçilmedi."}), 400
+    upload = receive_upload(uploaded_file)
+    if "error" in upload: return jsonify(upload), 400
+    # Aynı belge daha önce okunduysa kuyruğa girmeden hazır sonuç döner
+    if "result" in upload:
+        job_id = ocr_queue.complete(current_user.id, upload["result"])
+        return jsonify(dict(upload["result"], job_id=job_id, status="done"))
+    try:
+        job_id = ocr_queue.enqueue(current_user.id, spool_upload(upload), upload["cache_key"])
+    except QueueFullError as e:
+        return jsonify({"error": str(e), "suggestion": "Lütfen biraz sonra tekrar deneyin."}), 429
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route("/ocr/status/<job_id>")
+@login_required
+@limiter.exempt
+def ocr_status(job_id):
+    job = ocr_queue.status(job_id, current_user.id)
+    if not job: return jsonify({"error": "İş bulunamadı."}), 404
+    return jsonify(job)
+
+@app.route("/stream/<job_id>")
+@login_required
+def stream(job_id):
+    # Üretim arka planda sürer; bu uç sadece ortak depodaki ilerlemeyi okur. Olay id'si gönderilen karakter sayısıdır,
+    # EventSource yeniden bağlanınca Last-Event-ID ile kaldığı yerden devam edilir
+    job = stream_jobs.get(job_id)
+    if not job or job["user_id"] != current_user.id: return "Akış bulunamadı", 404
+    try: sent = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError: sent = 0
+
+    def generate():
+        nonlocal sent
+        yield sse("start", {"job_id": job_id})
+        deadline = time.monotonic() + STREAM_JOB_TIMEOUT
+        while True:
+            current = stream_jobs.get(job_id)
+            if not current:
+                yield sse("hata", {"message": "Akış bulunamadı veya süresi doldu."})
+                return
+            text = current.get("text", "")
+            if len(text) > sent:
+                yield sse("token", text[sent:], event_id=len(text))
+                sent = len(text)
+            if current.get("state") == "error":
+                yield sse("hata", {"message": current["error"]}, event_id=len(text))
+                return
+            if current.get("state") == "done":
+                done = current["done"]
+                # SORGU: soru formu normal (akışsız) akıştaki gibi oturum durumuyla açılır
+                if done.get("status") == "SORGU": done = dict(done, questions_url=url_for("stream_questions", job_id=job_id))
+                yield sse("done", done, event_id=len(text))
+                return
+            if time.monotonic() > deadline:
+                yield sse("hata", {"message": "Dilekçe üretimi zaman aşımına uğradı."})
+                return
+            time.sleep(STREAM_POLL_INTERVAL)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/stream/<job_id>/sorular")
+@login_required
+def stream_questions(job_id):
+    """Akışlı üretim SORGU ile bittiyse akışsız yoldaki oturum durumu kurulur ve soru formu gösterilir."""
+    job = stream_jobs.get(job_id)
+    if not job or job["user_id"] != current_user.id or job.get("state") != "done" or job["done"].get("status") != "SORGU":
+        return redirect(url_for("index"))
+    questions = job["done"].get("questions", [])
+    session["state"] = {"kategori": job["kategori"], "aciklama": job["context"], "ad_soyad": current_user.username, "questions": questions}
+    return render_template("index.html", mode="questions", sorular=enumerate(questions), ad_soyad=current_user.username)
+
 @app.route("/sonuc")
 @login_required
 def sonuc():
     try:
         p_id = request.args.get('id') or session.get('current_petition_id')
         if p_id:
-            petition = Petition.query.get(p_id)
+            petition = db.session.get(Petition, p_id, options=[db.undefer_group("body")])
             if petition and petition.user_id == current_user.id:
                 data = {"hitap_makam": "KAYITLI DİLEKÇE", "dilekce_metni": petition.content, "hukuki_oneriler": petition.advice}
                 session['result'] = data 
-                return render_template("sonuc.html", data=data, ad_soyad=current_user.username)
+                return render_template("sonuc.html", data=data, ad_soyad=current_user.username, petition_id=petition.id)
 
         data = session.get("result")
         if not data: data = get_mock_response("Kurtarma")
@@ -287,9 +571,17 @@ def sonuc():
 
 @app.route("/pdf")
 @login_required
+@traced("pdf")
 def pdf():
     try:
         data = session.get("result")
+        petition = None
+        p_id = request.args.get("id")
+        if p_id:
+            with stage("db_load"): petition = db.session.get(Petition, p_id, options=[db.undefer_group("body")])
+            if petition and petition.user_id == current_user.id:
+                data = {"hitap_makam": "KAYITLI DİLEKÇE", "dilekce_metni": petition.content, "hukuki_oneriler": petition.advice}
+            else: petition = None
         if not data: data = get_mock_response("")
         html = PETITION_HTML_TEMPLATE.format(
             hitap_makam=data.get("hitap_makam", "MAKAM"),
@@ -298,10 +590,38 @@ def pdf():
             tarih=datetime.now().strftime("%d.%m.%Y"),
             ad_soyad=current_user.username
         )
-        pdf_bytes = html_to_pdf_playwright(html)
+
+        # Kayıtlı dilekçe: diskteki PDF önbelleğinden ETag ile servis edilir
+        if petition:
+            etag = html_etag(html)
+            if etag in request.if_none_match:
+                return Response(status=304, headers={"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"})
+            with stage("pdf_render"): path, etag = cached_pdf(petition.id, html)
+            response = send_file(path, as_attachment=True, download_name="Dilekce.pdf", mimetype="application/pdf", etag=etag, conditional=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        with stage("pdf_render"): pdf_bytes = html_to_pdf_playwright(html)
         return send_file(io.BytesIO(pdf_bytes), as_attachment=True, download_name="Dilekce.pdf", mimetype="application/pdf")
     except: return "PDF Hatası", 500
 
+# --- METRİKLER (PROMETHEUS) ---
+# Aşama süreleri ve OCR motoru anonim kullanıcılara açılmaz: METRICS_TOKEN tanımlıysa scrape isteği
+# "Authorization: Bearer <token>" göndermelidir, tanımlı değilse yalnızca aynı makineden (loopback) gelen istek kabul edilir
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1"}
+
+def metrics_authorized():
+    if METRICS_TOKEN: return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}")
+    return request.remote_addr in LOOPBACK_ADDRESSES
+
+@app.route("/metrics")
+@limiter.exempt
+def metrics():
+    if not metrics_authorized(): return "Yetkisiz", 401
+    engine = render_info("hukuk_ocr_engine_info", "Etkin OCR motoru", {"engine": OCR_ACTIVE_ENGINE})
+    return Response(render_metrics() + engine, content_type=METRICS_CONTENT_TYPE)
+
 @app.template_filter('strftime')
 def _jinja2_filter_strftime(date, fmt=None):
     if not date or date == "now": return datetime.now().strftime(fmt or '%d.%m.%Y')
@@ -313,5 +633,11 @@ def _jinja2_filter_strftime(date, fmt=None):
 def ratelimit_handler(e):
     return "<h1>Çok Fazla İstek Yaptınız!</h1><p>Lütfen biraz bekleyin. Güvenlik nedeniyle işleminiz durduruldu.</p>", 429
 
+@app.errorhandler(413)
+def too_large_handler(e):
+    if request.path.startswith("/ocr/"): return jsonify(TOO_LARGE_ERROR), 413
+    flash(f"OCR Uyarısı: {TOO_LARGE_ERROR['error']}", "warning")
+    return redirect(url_for("index"))
+
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
\ No newline at end of file
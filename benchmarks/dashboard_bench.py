@@ -0,0 +1,65 @@
+# Dashboard listeleme benchmark'ı: tüm dilekçeleri tam metinle çekmek vs keyset sayfa (özet kolonlar + indeks)
+# Kullanım: python -m benchmarks.dashboard_bench [dilekçe_sayısı] [metin_kb]
+import sys
+import time
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import insert, text
+
+from models import db, User, Petition, petition_page, database_config
+
+def build_app(path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"], app.config["SQLALCHEMY_ENGINE_OPTIONS"] = database_config(f"sqlite:///{path}")
+    db.init_app(app)
+    return app
+
+def seed(n, kb):
+    db.create_all()
+    db.session.add_all([User(id=1, username="yogun", password="x"), User(id=2, username="diger", password="x")])
+    db.session.commit()
+    body, start = ("Dilekçe metni deneme satırı. " * (kb * 1024 // 29 + 1))[:kb * 1024], datetime(2020, 1, 1)
+    for offset in range(0, n, 5000):
+        rows = [{"category": "tuketici_haklari", "content": body, "advice": body[:2000], "ocr_data": body,
+                 "date_created": start + timedelta(minutes=i), "user_id": 1 + (i % 10 == 0)}
+                for i in range(offset, min(n, offset + 5000))]
+        db.session.execute(insert(Petition.__table__), rows)
+    db.session.commit()
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+        db.session.expunge_all()
+    return best, result
+
+def old_listing():
+    """Önceki dashboard: tüm satırlar, tüm kolonlar (büyük metinler dahil)."""
+    petitions = Petition.query.options(db.undefer_group("body")).filter_by(user_id=1).order_by(Petition.date_created.desc()).all()
+    return [p.content[:150] for p in petitions]
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    kb = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    tmp = tempfile.mkdtemp()
+    try:
+        with build_app(f"{tmp}/bench.db").app_context():
+            seed(n, kb)
+            print(f"{n} dilekçe (~{kb} KB metin), kullanıcı 1: {Petition.query.filter_by(user_id=1).count()} kayıt")
+            old_t, old = timed(old_listing, repeat=1)
+            print(f"{'Tümü (eski)':<28} {old_t * 1000:>9.1f} ms  {len(old)} satır")
+            first_t, (rows, cursor) = timed(lambda: petition_page(1))
+            print(f"{'Keyset ilk sayfa':<28} {first_t * 1000:>9.1f} ms  {len(rows)} satır")
+            deep = db.session.query(Petition.date_created, Petition.id).filter_by(user_id=1) \
+                .order_by(Petition.date_created.desc(), Petition.id.desc()).offset(n // 2).first()
+            deep_t, (rows, _) = timed(lambda: petition_page(1, tuple(deep)))
+            print(f"{'Keyset derin sayfa (n/2)':<28} {deep_t * 1000:>9.1f} ms  {len(rows)} satır")
+            plan = db.session.execute(text("EXPLAIN QUERY PLAN SELECT id FROM petition WHERE user_id = 1 "
+                                           "ORDER BY date_created DESC, id DESC LIMIT 21")).fetchall()
+            print("Sorgu planı:", " | ".join(row[-1] for row in plan))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,91 @@
+# Eşzamanlı yazma/okuma benchmark'ı: varsayılan SQLite vs WAL + NORMAL sync + busy_timeout + mmap + havuz
+# Yazıcı süreçler Petition ekler (özet tablo hook'u dahil), okuyucu süreçler dashboard ilk sayfasını çeker.
+# Kullanım: python -m benchmarks.db_concurrency_bench [yazıcı] [okuyucu] [süre_sn]
+#           DATABASE_URL=postgresql://... verilirse yalnızca o veritabanı ölçülür
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing as mp
+from datetime import datetime
+
+def worker(role, url, tuned, duration, seed, results):
+    os.environ["SQLITE_TUNING"] = "1" if tuned else "0"
+    from flask import Flask
+    from sqlalchemy.exc import OperationalError
+    from models import db, Petition, petition_page, database_config
+
+    app = Flask(__name__)
+    uri, options = database_config(url)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options if tuned else {}
+    db.init_app(app)
+    latencies, errors, body = [], 0, "Dilekçe metni deneme satırı. " * 70
+    with app.app_context():
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if role == "yaz":
+                    db.session.add(Petition(category="tuketici_haklari", content=body, advice=body[:500], user_id=1 + seed % 2,
+                                            processing_time=1.5, token_count=900, date_created=datetime.utcnow()))
+                    db.session.commit()
+                else:
+                    petition_page(1 + seed % 2)
+                    db.session.rollback()
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    results.put((role, latencies, errors))
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def run(label, url, tuned, writers, readers, duration):
+    from flask import Flask
+    import models
+    from models import db, User, database_config
+    models.SQLITE_TUNING = tuned  # tabloları kuran bağlantı da senaryonun journal modunu kullanmalı
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_config(url)[0]
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(id=1, username="bir", password="x"), User(id=2, username="iki", password="x")])
+        db.session.commit()
+        db.engine.dispose()
+
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(role, url, tuned, duration, i, results))
+             for i, role in enumerate(["yaz"] * writers + ["oku"] * readers)]
+    for p in procs: p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs: p.join()
+    print(label)
+    for role, name in (("yaz", "Ekleme"), ("oku", "Dashboard")):
+        lats = [x for r, values, _ in collected if r == role for x in values]
+        errors = sum(e for r, _, e in collected if r == role)
+        print(f"  {name:<10} {len(lats) / duration:>8.1f} işlem/sn  p50={percentile(lats, 0.5) * 1000:>7.1f} ms  "
+              f"p95={percentile(lats, 0.95) * 1000:>7.1f} ms  p99={percentile(lats, 0.99) * 1000:>7.1f} ms  "
+              f"kilit hatası={errors}")
+
+if __name__ == "__main__":
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    print(f"{writers} yazıcı + {readers} okuyucu süreç, {duration:g} sn")
+    if os.getenv("DATABASE_URL"):
+        run(os.environ["DATABASE_URL"].split("@")[-1], os.environ["DATABASE_URL"], True, writers, readers, duration)
+        sys.exit()
+    tmp = tempfile.mkdtemp()
+    try:
+        # WAL kalıcı bir dosya ayarı olduğundan her senaryo ayrı dosyada çalışır
+        run("Varsayılan SQLite", f"sqlite:///{tmp}/varsayilan.db", False, writers, readers, duration)
+        run("Ayarlı SQLite (WAL)", f"sqlite:///{tmp}/ayarli.db", True, writers, readers, duration)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
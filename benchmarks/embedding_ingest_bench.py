@@ -0,0 +1,39 @@
+# Korpus embedding ingest benchmark'ı: tek tek istek vs batch + eşzamanlılık
+# Kullanım: python -m benchmarks.embedding_ingest_bench [doküman_sayısı] [gecikme_sn]
+import sys
+import shutil
+import tempfile
+from openai import OpenAI
+
+import logic_services
+from logic_services import VectorDatabase
+from benchmarks.stub_embedding_server import StubEmbeddingServer
+
+def write_corpus(path, n_docs):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n_docs):
+            f.write(f"id: madde_{i}\nkategori: kat_{i % 8}\nbaslik: TEST KANUNU (Madde {i})\n"
+                    f"icerik: {'Bu madde deneme amaçlı üretilmiş bir mevzuat metnidir. ' * 8}{i}\n\n")
+
+def run(label, n_docs, latency, batch_size, concurrency):
+    logic_services.EMBED_BATCH_SIZE = batch_size
+    logic_services.EMBED_CONCURRENCY = concurrency
+    tmp = tempfile.mkdtemp()
+    try:
+        write_corpus(f"{tmp}/mevzuat.txt", n_docs)
+        with StubEmbeddingServer(latency=latency) as stub:
+            client = OpenAI(api_key="stub", base_url=stub.base_url, max_retries=0)
+            db = VectorDatabase(f"{tmp}/mevzuat.txt", client=client, store_dir=f"{tmp}/store")
+            stats = db.ingest_stats
+            print(f"{label:<28} istek={stub.requests:<5} süre={stats['seconds']:>7.2f}s  hız={stats['docs_per_sec']:>8.1f} dok/sn")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == "__main__":
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    print(f"{n_docs} doküman, istek başına {latency * 1000:.0f} ms gecikme")
+    run("Tek tek (1 x 1)", n_docs, latency, 1, 1)
+    run("Batch 96 (sıralı)", n_docs, latency, 96, 1)
+    run("Batch 96 x 4 eşzamanlı", n_docs, latency, 96, 4)
+    run("Batch 32 x 4 eşzamanlı", n_docs, latency, 32, 4)
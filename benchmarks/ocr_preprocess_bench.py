@@ -0,0 +1,58 @@
+# Telefon fotoğrafı OCR benchmark'ı: ön işlemeli vs ham görüntü (süre ve karakter doğruluğu)
+# Örnek set deterministik olarak üretilir: bilinen metin, kağıt tonu, gürültü, eğim, 12 MP ve EXIF yönü.
+# Kullanım: python -m benchmarks.ocr_preprocess_bench [örnek_sayısı]   (tesseract + 'tur' dil paketi gerekir)
+import io
+import sys
+import time
+import random
+from difflib import SequenceMatcher
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+import ocr_service
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+SAMPLE_LINES = [
+    "T.C. İSTANBUL VALİLİĞİ İl Emniyet Müdürlüğü",
+    "TRAFİK İDARİ PARA CEZASI KARAR TUTANAĞI",
+    "Plaka: 34 ABC 123  Tarih: 12.03.2024  Saat: 14:35",
+    "2918 sayılı Karayolları Trafik Kanunu 51/2-a maddesi",
+    "Hız sınırını %10 ile %30 arasında aşmak",
+    "Ceza tutarı: 1.865,00 TL  Tebliğ: elden",
+    "Bu karara karşı tebliğden itibaren 15 gün içinde",
+    "Sulh Ceza Hâkimliğine başvurulabilir.",
+]
+
+def make_sample(seed, size=(4000, 3000)):
+    """Dönüş: (JPEG bytes, gerçek metin). Fotoğraf yatay çekilmiş, EXIF Orientation=6 ile işaretlenmiştir."""
+    rnd = random.Random(seed)
+    lines = rnd.sample(SAMPLE_LINES, 6)
+    page = Image.new("RGB", (1240, 1754), (rnd.randint(200, 235), rnd.randint(195, 225), rnd.randint(180, 210)))
+    draw, font = ImageDraw.Draw(page), ImageFont.truetype(FONT_PATH, 34)
+    for i, line in enumerate(lines): draw.text((90, 160 + i * 90), line, fill=(35, 35, 40), font=font)
+    page = page.rotate(rnd.uniform(-4, 4), resample=Image.BICUBIC, expand=True, fillcolor=(120, 110, 100))
+    page = page.filter(ImageFilter.GaussianBlur(0.8)).rotate(90, expand=True).resize(size, Image.BICUBIC)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: 90° saat yönünde döndürülerek gösterilmeli
+    buf = io.BytesIO()
+    page.save(buf, format="JPEG", quality=88, exif=exif)
+    return buf.getvalue(), "\n".join(lines)
+
+def accuracy(expected, actual):
+    return SequenceMatcher(None, " ".join(expected.split()), " ".join(actual.split())).ratio()
+
+def run(label, samples, preprocess):
+    ocr_service.OCR_PREPROCESS = preprocess
+    elapsed, scores = 0.0, []
+    for data, truth in samples:
+        t0 = time.perf_counter()
+        text, _ = ocr_service.ocr_image(io.BytesIO(data))
+        elapsed += time.perf_counter() - t0
+        scores.append(accuracy(truth, text))
+    print(f"{label:<22} süre={elapsed / len(samples):>6.2f}s/resim  doğruluk={sum(scores) / len(scores):>6.1%}")
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    samples = [make_sample(i) for i in range(n)]
+    print(f"{n} örnek, 4000x3000 JPEG (12 MP)")
+    run("Ham görüntü", samples, False)
+    run("Ön işlemeli", samples, True)
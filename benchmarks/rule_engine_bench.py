@@ -0,0 +1,90 @@
+# Kural motoru mikro benchmark'ı: eski (kural başına regex + strptime) vs derlenmiş plan (tek geçiş olgu çıkarımı)
+# Kullanım: python -m benchmarks.rule_engine_bench [metin_kb] [tekrar]
+import re
+import sys
+import json
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from logic_services import RuleEngine, AhoCorasick
+
+SAMPLE_RULES = {
+    "trafik_cezasi": {
+        "itiraz_suresi": {"gun": 15, "uyari_mesaji": "{tarih} tarihinden bu yana {fark_gun} gün geçmiş; 15 günlük itiraz süresi dolmuş olabilir."},
+        "zorunlu_kelimeler": ["tutanak", "plaka", "tebliğ", "makbuz"],
+        "eksik_belge_mesaji": "Ceza tutanağı bilgisi bulunamadı.",
+    },
+    "tuketici_haklari": {
+        "parasal_sinir": {"2025_limit_ilce": 104000, "uyari_mesaji": "{deger} TL, {limit_ilce} TL sınırını aşıyor; Tüketici Mahkemesi'ne başvurulmalı."},
+        "cayma_hakki": {"gun": 14, "uyari_mesaji": "Cayma süresi ({fark_gun} gün) geçmiş olabilir."},
+        "ayipli_mal": {"zaman_asimi_yil": 2, "uyari_mesaji": "Ayıplı mal zamanaşımı ({fark_yil} yıl) dolmuş olabilir."},
+        "zorunlu_kelimeler": ["fatura", "fiş", "sözleşme", "garanti belgesi", "sipariş"],
+        "eksik_belge_mesaji": "Fatura veya sözleşme bilgisi bulunamadı.",
+    },
+}
+
+def make_text(kb, seed=0):
+    """Büyük OCR çıktısını andıran metin: tekrar eden tutarlar, tarihler ve gürültü."""
+    rnd, now, parts, size = random.Random(seed), datetime.now(), [], 0
+    words = "tüketici ürün iade satıcı bedel ayıplı teslim kargo müşteri hizmetleri başvuru dilekçe".split()
+    while size < kb * 1024:
+        line = " ".join(rnd.choice(words) for _ in range(12))
+        if rnd.random() < 0.2: line += f" {(now - timedelta(days=rnd.choice([3, 30, 400]))).strftime('%d.%m.%Y')}"
+        if rnd.random() < 0.2: line += f" {rnd.choice(['50.000', '150.000', '1.250'])} TL"
+        parts.append(line)
+        size += len(line.encode("utf-8")) + 1
+    return "\n".join(parts)
+
+def legacy_check(rules, category, text, ocr_text=""):
+    """Karşılaştırma için önceki RuleEngine.check mantığı."""
+    warnings = []
+    text = (text + " " + ocr_text).lower()
+    cat_rules = rules.get(category, {})
+    if not cat_rules: return ""
+    if "parasal_sinir" in cat_rules:
+        rule = cat_rules["parasal_sinir"]
+        limit = rule.get("2025_limit_ilce", rule.get("limit", 0))
+        for amt in re.findall(r'(\d{1,3}(?:[.,]\d{3})*)\s*(?:tl|türk lirası)', text):
+            val = float(amt.replace('.', '').replace(',', '.'))
+            if val > limit: warnings.append(rule.get("uyari_mesaji", "").format(deger=val, limit_ilce=limit))
+    for key in ["itiraz_suresi", "cayma_hakki", "ise_iade", "savcilik_sikayet", "ayipli_mal"]:
+        if key in cat_rules:
+            rule = cat_rules[key]
+            limit = rule.get("gun") or rule.get("sure_gun") or (rule.get("zaman_asimi_ay", 0)*30) or (rule.get("zaman_asimi_yil", 0)*365)
+            for d in re.findall(r'(\d{2}[./-]\d{2}[./-]\d{4})', text):
+                diff = (datetime.now() - datetime.strptime(d.replace('/', '.').replace('-', '.'), '%d.%m.%Y')).days
+                if 0 < diff > limit and diff < (365*5):
+                    warnings.append(rule.get("uyari_mesaji", "").format(fark_gun=diff, fark_ay=round(diff/30, 1), fark_yil=round(diff/365, 1), tarih=d))
+    if "zorunlu_kelimeler" in cat_rules and not any(k in text for k in cat_rules["zorunlu_kelimeler"]):
+        warnings.append(cat_rules.get("eksik_belge_mesaji", ""))
+    return "\n".join(warnings)
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat): result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+if __name__ == "__main__":
+    kb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8", delete=False) as f:
+        json.dump(SAMPLE_RULES, f, ensure_ascii=False)
+    engine = RuleEngine(f.name)
+    text = make_text(kb)
+    print(f"{kb} KB OCR metni, {repeat} tekrar")
+    for category in SAMPLE_RULES:
+        old_t, old = timed(lambda: legacy_check(SAMPLE_RULES, category, "", text), repeat)
+        new_t, new = timed(lambda: engine.check(category, "", text), repeat)
+        print(f"{category:<18} eski={old_t * 1000:>8.1f} ms ({len(old.splitlines()):>5} uyarı)  "
+              f"derlenmiş={new_t * 1000:>8.1f} ms ({len(new.splitlines()):>3} uyarı)  x{old_t / new_t:.1f}")
+
+    # Anahtar kelime eşleştirme: saf Python Aho-Corasick vs kelime başına `in` (AHO_CORASICK_MIN_KEYWORDS eşiği için)
+    rnd, lowered = random.Random(1), text.lower()
+    for n in (10, 100, 500):
+        words = ["".join(rnd.choice("abcçdefgğhıijklmnoöprsştuüvyz") for _ in range(rnd.randint(5, 12))) for _ in range(n)]
+        automaton = AhoCorasick(words)
+        ac_t, _ = timed(lambda: automaton.find(lowered), repeat)
+        in_t, _ = timed(lambda: {w for w in words if w in lowered}, repeat)
+        print(f"{n:>4} kelime        aho-corasick={ac_t * 1000:>8.1f} ms  in-tarama={in_t * 1000:>8.1f} ms")
@@ -0,0 +1,67 @@
+# Yerel sahte OpenAI embedding sunucusu (test + benchmark için, ağ/API kredisi gerektirmez)
+import json
+import time
+import zlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIM = 64
+
+def fake_embedding(text, dim=DIM):
+    vec = [0.0] * dim
+    for word in text.lower().split():
+        vec[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    return vec
+
+class StubEmbeddingServer:
+    """POST /v1/embeddings uç noktasını taklit eder. İlk `fail_first` istek 429 döner, her istek `latency` sn bekler."""
+    def __init__(self, latency=0.0, fail_first=0, port=0):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.requests = 0
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with stub.lock:
+                    stub.requests += 1
+                    fail = stub.requests <= stub.fail_first
+                if stub.latency: time.sleep(stub.latency)
+                if fail:
+                    return self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"Retry-After": "0"})
+                texts = body.get("input", [])
+                texts = [texts] if isinstance(texts, str) else texts
+                with stub.lock: stub.batch_sizes.append(len(texts))
+                data = [{"object": "embedding", "index": i, "embedding": fake_embedding(t)} for i, t in enumerate(texts)]
+                tokens = sum(len(t.split()) for t in texts)
+                self._send(200, {"object": "list", "data": data, "model": body.get("model"),
+                                 "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+            def _send(self, status, payload, headers=None):
+                raw = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items(): self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args): pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
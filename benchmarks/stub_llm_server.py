@@ -0,0 +1,83 @@
+# Yerel sahte OpenAI chat completions sunucusu (test + benchmark için)
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = {
+    "status": "DILEKCE_HAZIR",
+    "hitap_makam": "İSTANBUL NÖBETÇİ TÜKETİCİ MAHKEMESİNE",
+    "dilekce_metni": "KONU: Ayıplı mal nedeniyle bedel iadesi talebi.\nAçıklamalar: Satın aldığım ürün arızalıdır.",
+    "hukuki_oneriler": "• Faturanızı saklayın.",
+}
+
+class StubLLMServer:
+    """POST /v1/chat/completions uç noktasını taklit eder.
+    statuses: sırayla dönülecek HTTP kodları (bitince hep 200). latency: her istekte bekleme (sn)."""
+    def __init__(self, statuses=None, latency=0.0, content=None, retry_after=None, port=0):
+        self.statuses = list(statuses or [])
+        self.latency = latency
+        self.content = content or DEFAULT_CONTENT
+        self.retry_after = retry_after
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with stub.lock:
+                    stub.requests += 1
+                    stub.connections.add(self.client_address)
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                if stub.latency: time.sleep(stub.latency)
+                if status != 200:
+                    headers = {"Retry-After": str(stub.retry_after)} if stub.retry_after is not None else {}
+                    return self._send(status, {"error": {"message": "stub error"}}, headers)
+                text = json.dumps(stub.content, ensure_ascii=False)
+                if body.get("stream"):
+                    return self._stream(text)
+                self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+                                 "usage": {"total_tokens": len(text) // 4}})
+
+            def _stream(self, text, chunk=12):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for i in range(0, len(text), chunk):
+                    delta = {"choices": [{"index": 0, "delta": {"content": text[i:i + chunk]}}]}
+                    self.wfile.write(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                usage = {"choices": [], "usage": {"total_tokens": len(text) // 4}}
+                self.wfile.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.close_connection = True
+
+            def _send(self, status, payload, headers=None):
+                raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items(): self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args): pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,382 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from contextlib import contextmanager
+from collections import OrderedDict
+from limits.storage import Storage
+
+try:
+    import redis  # İsteğe bağlı: SHARED_STATE_URL=redis://... için
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Worker'lar arası ortak durum: hız sınırı sayaçları ve uygulama önbellekleri burada tutulur.
+# sqlite:///yol (varsayılan, aynı makinedeki tüm worker'lar) | redis://host:6379/0 veya unix:///soket.sock (Redis uyumlu)
+# | memory:// (eski davranış: her worker kendi belleğinde)
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "sqlite:///shared_state.db")
+SHARED_STATE_TIMEOUT = float(os.getenv("SHARED_STATE_TIMEOUT", "5"))
+SHARED_CACHE_TRIM_EVERY = 64  # maxsize sınırı bu kadar yazımda bir uygulanır
+
+# ==========================================
+# SÜRELİ LRU ÖNBELLEK (THREAD-SAFE)
+# ==========================================
+class LRUCache:
+    """Boyut sınırlı LRU önbellek; ttl (saniye) verilirse süresi dolan kayıtlar da düşer.
+    Aynı worker içindeki tüm thread'ler tarafından paylaşılır."""
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (son_gecerlilik, değer)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self.data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.data[key] = (expires_at, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            item = self.data.pop(key, None)
+        if item is None or (item[0] is not None and item[0] < time.monotonic()): return default
+        return item[1]
+
+    def clear(self):
+        with self.lock: self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self.data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+# ==========================================
+# LLM YANIT ÖNBELLEĞİ (SQLITE, İÇERİK ADRESLİ)
+# ==========================================
+def canonicalize_prompt(text):
+    """Unicode NFC + satır sonu/boşluk farklarını sadeleştirir; anlamı değiştirmeyen farklar aynı anahtara düşer."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n")
+    lines = [" ".join(line.split()) for line in text.split("\n")]
+    return "\n".join(lines).strip()
+
+class LLMResponseCache:
+    """Model + sıcaklık + kanonik prompt hash'i ile anahtarlanan disk önbelleği.
+    max_entries aşılınca en uzun süredir kullanılmayan kayıtlar silinir."""
+    def __init__(self, path="llm_cache.db", max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY, response TEXT NOT NULL, tokens INTEGER DEFAULT 0,
+                duration REAL DEFAULT 0, created REAL, last_access REAL, hits INTEGER DEFAULT 0)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_access ON llm_cache(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn: yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(model, temperature, prompt):
+        raw = json.dumps({"model": model, "temperature": temperature, "prompt": canonicalize_prompt(prompt)}, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """(yanıt dict, token, orijinal süre) veya None döner."""
+        try:
+            with self.lock, self._connect() as conn:
+                row = conn.execute("SELECT response, tokens, duration FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is None: return None
+                conn.execute("UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            return json.loads(row[0]), row[1], row[2]
+        except (sqlite3.Error, ValueError):
+            return None
+
+    def set(self, key, response, tokens=0, duration=0.0):
+        now = time.time()
+        payload = json.dumps({k: v for k, v in response.items() if k != "usage"}, ensure_ascii=False)
+        try:
+            with self.lock, self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO llm_cache (key, response, tokens, duration, created, last_access, hits) "
+                             "VALUES (?, ?, ?, ?, ?, ?, 0)", (key, payload, tokens, duration, now, now))
+                conn.execute("DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                             (self.max_entries,))
+        except sqlite3.Error:
+            pass
+
+# ==========================================
+# ORTAK DURUM BACKEND'İ (WORKER'LAR ARASI)
+# ==========================================
+class SQLiteBackend:
+    """(namespace, key) -> değer tablosu; tek dosya, WAL. Her işlem tek SQL cümlesi olduğundan atomiktir.
+    Bağlantılar thread başına açık tutulur (hız sınırı her istekte yazar); fork sonrası yeniden açılır."""
+    name = "sqlite"
+    errors = sqlite3.Error
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self._connection().execute("""CREATE TABLE IF NOT EXISTS shared_kv (
+            namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB, expires_at REAL, PRIMARY KEY (namespace, key))""")
+
+    def _connection(self):
+        if getattr(self.local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=SHARED_STATE_TIMEOUT, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return self.local.conn
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    def get(self, namespace, key):
+        row = self._connection().execute("SELECT value FROM shared_kv WHERE namespace = ? AND key = ? "
+                                         "AND (expires_at IS NULL OR expires_at > ?)", (namespace, key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        self._connection().execute("INSERT OR REPLACE INTO shared_kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                                   (namespace, key, value, self._expires(ttl)))
+
+    def pop(self, namespace, key):
+        row = self._connection().execute("DELETE FROM shared_kv WHERE namespace = ? AND key = ? RETURNING value, expires_at",
+                                         (namespace, key)).fetchone()
+        return row[0] if row and (row[1] is None or row[1] > time.time()) else None
+
+    def delete(self, namespace, key):
+        self._connection().execute("DELETE FROM shared_kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def incr(self, namespace, key, amount, expiry):
+        """Sayaç süresi dolmuşsa `amount`tan, değilse mevcut değerden devam eder. Dönüş: yeni değer."""
+        now = time.time()
+        return self._connection().execute(
+            "INSERT INTO shared_kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET "
+            "value = CASE WHEN shared_kv.expires_at <= ? THEN excluded.value ELSE shared_kv.value + excluded.value END, "
+            "expires_at = CASE WHEN shared_kv.expires_at <= ? THEN excluded.expires_at ELSE shared_kv.expires_at END "
+            "RETURNING value", (namespace, key, amount, now + expiry, now, now)).fetchone()[0]
+
+    def counter(self, namespace, key):
+        """Dönüş: (değer, bitiş zamanı); sayaç yoksa veya süresi dolduysa (0, None)."""
+        row = self._connection().execute("SELECT value, expires_at FROM shared_kv WHERE namespace = ? AND key = ? AND expires_at > ?",
+                                         (namespace, key, time.time())).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def count(self, namespace):
+        return self._connection().execute("SELECT COUNT(*) FROM shared_kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                                          (namespace, time.time())).fetchone()[0]
+
+    def clear(self, namespace):
+        return self._connection().execute("DELETE FROM shared_kv WHERE namespace = ?", (namespace,)).rowcount
+
+    def trim(self, namespace, maxsize):
+        """Süresi dolanları ve en eski yazılanları (rowid sırası) namespace başına `maxsize`a inene kadar siler."""
+        conn = self._connection()
+        conn.execute("DELETE FROM shared_kv WHERE namespace = ? AND expires_at <= ?", (namespace, time.time()))
+        conn.execute("DELETE FROM shared_kv WHERE rowid IN (SELECT rowid FROM shared_kv WHERE namespace = ? "
+                     "ORDER BY rowid DESC LIMIT -1 OFFSET ?)", (namespace, maxsize))
+
+class RedisBackend:
+    """Aynı arayüz Redis (veya Redis protokolü konuşan bir yerel daemon, unix:// soket) üzerinde.
+    Süre dolumu ve bellek sınırı Redis'e (TTL, maxmemory-policy) bırakılır."""
+    name = "redis"
+
+    def __init__(self, url):
+        if redis is None: raise RuntimeError("SHARED_STATE_URL Redis gösteriyor ama 'redis' paketi kurulu değil.")
+        self.client = redis.Redis.from_url(url, socket_timeout=SHARED_STATE_TIMEOUT)
+        self.errors = redis.RedisError
+
+    def get(self, namespace, key):
+        return self.client.get(f"{namespace}:{key}")
+
+    def set(self, namespace, key, value, ttl=None):
+        self.client.set(f"{namespace}:{key}", value, px=int(ttl * 1000) if ttl else None)
+
+    def pop(self, namespace, key):
+        return self.client.getdel(f"{namespace}:{key}")
+
+    def delete(self, namespace, key):
+        self.client.delete(f"{namespace}:{key}")
+
+    def incr(self, namespace, key, amount, expiry):
+        pipe = self.client.pipeline()
+        pipe.incrby(f"{namespace}:{key}", amount)
+        pipe.expire(f"{namespace}:{key}", int(expiry), nx=True)
+        return pipe.execute()[0]
+
+    def counter(self, namespace, key):
+        pipe = self.client.pipeline()
+        pipe.get(f"{namespace}:{key}")
+        pipe.pttl(f"{namespace}:{key}")
+        value, pttl = pipe.execute()
+        return (int(value), time.time() + pttl / 1000) if value is not None and pttl > 0 else (0, None)
+
+    def count(self, namespace):
+        return sum(1 for _ in self.client.scan_iter(match=f"{namespace}:*"))
+
+    def clear(self, namespace):
+        keys = list(self.client.scan_iter(match=f"{namespace}:*"))
+        return self.client.delete(*keys) if keys else 0
+
+    def trim(self, namespace, maxsize):
+        pass
+
+def create_backend(url=None):
+    """memory:// için None döner (ortak durum kapalı)."""
+    url = url or SHARED_STATE_URL
+    if url.startswith("memory://"): return None
+    if url.startswith("sqlite:///"): return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")): return RedisBackend(url)
+    raise ValueError(f"Desteklenmeyen SHARED_STATE_URL: {url}")
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(url=None):
+    """URL başına süreç içinde tek backend nesnesi (bağlantılar yine thread/pid başına açılır)."""
+    url = url or SHARED_STATE_URL
+    with _backends_lock:
+        if url not in _backends: _backends[url] = create_backend(url)
+        return _backends[url]
+
+# ==========================================
+# PAYLAŞIMLI ÖNBELLEK
+# ==========================================
+class SharedCache:
+    """LRUCache ile aynı arayüz; değerler tüm worker'ların gördüğü backend'de pickle olarak saklanır
+    (backend uygulamanın kendi dosyası/Redis'i olduğundan güvenilir kabul edilir).
+    maxsize her SHARED_CACHE_TRIM_EVERY yazımda bir uygulanır ve en eski yazılanları düşürür; okuma sırayı değiştirmez.
+    Backend hatası önbellek ıskası sayılır, istek düşmez. hits/misses bu süreç içindir."""
+    def __init__(self, namespace, maxsize=1024, ttl=None, backend=None):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend or get_backend()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.writes = 0
+
+    def get(self, key, default=None):
+        try:
+            raw = self.backend.get(self.namespace, key)
+        except self.backend.errors as e:
+            logger.warning(f"Ortak önbellek okunamadı ({self.namespace}): {e}")
+            raw, self.errors = None, self.errors + 1
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def set(self, key, value):
+        try:
+            self.backend.set(self.namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), self.ttl)
+            self.writes += 1
+            if self.writes % SHARED_CACHE_TRIM_EVERY == 0: self.backend.trim(self.namespace, self.maxsize)
+        except self.backend.errors as e:
+            logger.warning(f"Ortak önbelleğe yazılamadı ({self.namespace}): {e}")
+            self.errors += 1
+
+    def pop(self, key, default=None):
+        """Okur ve siler (tek işlem): iki worker aynı anahtarı aynı anda alamaz."""
+        try:
+            raw = self.backend.pop(self.namespace, key)
+        except self.backend.errors as e:
+            logger.warning(f"Ortak önbellek okunamadı ({self.namespace}): {e}")
+            raw, self.errors = None, self.errors + 1
+        return default if raw is None else pickle.loads(raw)
+
+    def clear(self):
+        self.backend.clear(self.namespace)
+
+    def __len__(self):
+        return self.backend.count(self.namespace)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses, "errors": self.errors,
+                "backend": self.backend.name, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+def shared_cache(namespace, maxsize=1024, ttl=None):
+    """Ortak durum açıksa SharedCache, SHARED_STATE_URL=memory:// ise süreç içi LRUCache."""
+    backend = get_backend()
+    return SharedCache(namespace, maxsize, ttl, backend) if backend else LRUCache(maxsize=maxsize, ttl=ttl)
+
+# ==========================================
+# HIZ SINIRI DEPOSU (FLASK-LIMITER / LIMITS)
+# ==========================================
+class SharedLimitStorage(Storage):
+    """limits kütüphanesi için sqlite:///yol deposu (sabit pencere stratejisi). Sayaçlar SQLiteBackend'de
+    "limits" namespace'inde tutulur; böylece tüm worker'lar aynı sınırı uygular. Redis için limits'in kendi deposu kullanılır."""
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        self.backend = get_backend(uri)
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, amount=1):
+        return self.backend.incr("limits", key, amount, expiry)
+
+    def get(self, key):
+        return self.backend.counter("limits", key)[0]
+
+    def get_expiry(self, key):
+        return self.backend.counter("limits", key)[1] or time.time()
+
+    def check(self):
+        try:
+            self.backend.count("limits")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self.backend.clear("limits")
+
+    def clear(self, key):
+        self.backend.delete("limits", key)
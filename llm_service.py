@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+LLM_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# Tüm denemeler + beklemeler için üst sınır (sn); gunicorn --timeout (120) altında kalmalı, yoksa worker istek ortasında öldürülür
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# Akışsız yanıt üretim bitene kadar tek bayt göndermez: okuma zaman aşımı tüm üretimi sınırlar, bu yüzden süre sınırı kadardır
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", str(LLM_DEADLINE)))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_MAX_BACKOFF = float(os.getenv("LLM_MAX_BACKOFF", "8"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class LLMUnavailable(Exception):
+    """LLM çağrısı tüm denemelere rağmen başarısız oldu."""
+
+class CircuitOpenError(LLMUnavailable):
+    """Devre açık: upstream sağlıksız, istek hiç gönderilmeden reddedildi."""
+
+# ==========================================
+# DEVRE KESİCİ (CIRCUIT BREAKER)
+# ==========================================
+class CircuitBreaker:
+    """Art arda `threshold` hata sonrası devre açılır; `reset_timeout` sn sonra tek bir deneme isteğine izin verilir (half-open)."""
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_probe = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None: return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout: return "half_open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed": return True
+            if state == "half_open" and not self.half_open_probe:
+                self.half_open_probe = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.half_open_probe = 0, None, False
+
+    def release(self):
+        """Sonucu upstream sağlığı hakkında bilgi vermeyen deneme (ör. yavaş üretim) için yalnızca half-open bayrağını bırakır."""
+        with self.lock:
+            self.half_open_probe = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.half_open_probe = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+# ==========================================
+# HAVUZLU, KEEP-ALIVE HTTP İSTEMCİSİ
+# ==========================================
+def build_session(pool_size=LLM_POOL_SIZE):
+    """Tek TLS bağlantı havuzu; retry'ları kendimiz yaptığımız için adapter retry kapalı."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def backoff_delay(attempt, retry_after=None, base=LLM_BACKOFF_BASE, cap=LLM_MAX_BACKOFF):
+    """Retry-After varsa ona uyar (üst sınırla), yoksa jitter'lı üstel bekleme."""
+    try:
+        if retry_after is not None: return min(float(retry_after), cap)
+    except (TypeError, ValueError): pass
+    return min(cap, base * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+class LLMClient:
+    def __init__(self, api_key, base_url=LLM_BASE_URL, connect_timeout=LLM_CONNECT_TIMEOUT, read_timeout=LLM_READ_TIMEOUT,
+                 max_retries=LLM_MAX_RETRIES, breaker=None, session=None, deadline=LLM_DEADLINE):
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.timeout = (connect_timeout, read_timeout)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = session or build_session()
+
+    def chat(self, payload, stream=False):
+        """Chat completions isteği atar. Başarılıysa requests.Response döner, değilse LLMUnavailable fırlatır.
+        Denemeler ve beklemeler toplamda `deadline` saniyeyi aşmaz; her denemenin zaman aşımı kalan süreye kısaltılır.
+        Yalnızca bağlantı hataları ve 429/5xx tekrar denenir: gönderilmiş bir completion tekrar POST edilirse tokenlar
+        yeniden faturalanır."""
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM devresi açık, istek gönderilmedi.")
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        deadline = time.monotonic() + self.deadline
+        last_error, recorded = "LLM süre sınırı aşıldı", False
+        try:
+            for attempt in range(self.max_retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                retry_after = None
+                try:
+                    timeout = (min(self.timeout[0], remaining), min(self.timeout[1], remaining))
+                    r = self.session.post(self.url, headers=headers, json=payload, timeout=timeout, stream=stream)
+                    if r.status_code == 200:
+                        self.breaker.record_success()
+                        recorded = True
+                        return r
+                    last_error = f"HTTP {r.status_code}"
+                    retry_after = r.headers.get("Retry-After")
+                    r.close()
+                    if r.status_code not in RETRYABLE_STATUS:
+                        # 4xx upstream sağlığıyla ilgili değil; devreyi etkilemez
+                        self.breaker.record_success()
+                        recorded = True
+                        raise LLMUnavailable(last_error)
+                except requests.ConnectionError as e:
+                    # Bağlantı kurulamadı veya yanıt başlamadan koptu (ConnectTimeout dahil): tekrar denenebilir
+                    last_error = str(e)
+                except requests.ReadTimeout as e:
+                    # Üretim upstream'de sürüyor olabilir; yavaş yanıt herkes için devreyi açacak bir arıza sayılmaz
+                    self.breaker.release()
+                    recorded = True
+                    raise LLMUnavailable(f"LLM yanıtı zaman aşımına uğradı: {e}") from e
+                except requests.RequestException as e:
+                    # Gövde okuma hataları (ChunkedEncodingError, ContentDecodingError...): istek işlenmiş olabilir, tekrar gönderilmez
+                    raise LLMUnavailable(str(e)) from e
+                if attempt < self.max_retries:
+                    delay = backoff_delay(attempt, retry_after)
+                    if time.monotonic() + delay >= deadline: break
+                    time.sleep(delay)
+            raise LLMUnavailable(last_error)
+        finally:
+            # Hangi yoldan çıkılırsa çıkılsın sonuç kaydedilir; aksi halde half-open deneme bayrağı açık kalır ve devre hiç kapanmaz
+            if not recorded: self.breaker.record_failure()
+
+# ==========================================
+# AKIŞ (STREAMING) YARDIMCILARI
+# ==========================================
+JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '/': '/', '\\': '\\', '"': '"'}
+
+class JsonFieldStreamer:
+    """Parça parça gelen JSON metninden tek bir string alanın değerini, geldikçe çözerek verir.
+    Yarım kalan kaçış dizileri (\\uXXXX dahil) bir sonraki parçaya bırakılır."""
+    def __init__(self, field):
+        self.marker = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self.buffer = ""
+        self.pos = None
+        self.done = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.done: return ""
+        if self.pos is None:
+            m = self.marker.search(self.buffer)
+            if not m: return ""
+            self.pos = m.end()
+        buf, i, out = self.buffer, self.pos, []
+        while i < len(buf):
+            c = buf[i]
+            if c == '"':
+                self.done = True
+                i += 1
+                break
+            if c != '\\':
+                out.append(c)
+                i += 1
+                continue
+            if i + 1 >= len(buf): break
+            if buf[i + 1] != 'u':
+                out.append(JSON_ESCAPES.get(buf[i + 1], buf[i + 1]))
+                i += 2
+                continue
+            if i + 6 > len(buf): break
+            code = int(buf[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:  # surrogate çifti
+                if i + 12 > len(buf): break
+                low = int(buf[i + 8:i + 12], 16)
+                out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                i += 12
+                continue
+            out.append(chr(code))
+            i += 6
+        self.pos = i
+        return "".join(out)
+
+def iter_chat_stream(response):
+    """OpenAI SSE akışından (içerik parçası, usage) ikilileri üretir."""
+    # SSE yanıtında charset olmayabilir; requests latin-1 varsaymasın diye satırlar UTF-8 olarak çözülür
+    for raw in response.iter_lines():
+        line = raw.decode("utf-8", errors="replace")
+        if not line.startswith("data:"): continue
+        data = line[5:].strip()
+        if data == "[DONE]": break
+        try: event = json.loads(data)
+        except ValueError: continue
+        choices = event.get("choices") or []
+        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+        yield delta or "", event.get("usage")
+
+def sse(event, data, event_id=None):
+    """event_id verilirse EventSource yeniden bağlanırken Last-Event-ID başlığıyla geri gönderir."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -2,27 +2,302 @@ import os
 import re
 import json
 import math
+import time
+import uuid
+import random
+import hashlib
+import logging
+import threading
 from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from openai import OpenAI
+import numpy as np
+from openai import OpenAI, APIConnectionError
+from cache_service import shared_cache
+from tracing import stage
+
+try:
+    import fcntl  # POSIX: worker süreçleri arası embedding deposu kilidi
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embeddings_cache")
+
+# Toplu embedding ayarları (adet ve yaklaşık token bütçesi ile sınırlı batch'ler)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "96"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "8000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "4"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "0.5"))
+
+# Mevzuat parçalama: madde metni fıkra/bent/cümle sınırlarından örtüşmeli parçalara bölünür
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "120"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "1"))            # Bir sonraki parçaya taşınan cümle/bent sayısı
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "400"))   # LLM prompt'una girecek mevzuat metni üst sınırı
+
+# Sorgu embedding önbelleği (SORGU turları / tekrar gönderimlerde embedding isteğini atlar)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))
+query_embedding_cache = shared_cache("query_embedding", maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+# ==========================================
+# 0. KALICI EMBEDDING DEPOSU (DISK CACHE)
+# ==========================================
+class EmbeddingStore:
+    """Doküman vektörlerini diskte saklar. Anahtar: doküman id + içerik hash'i + model adı.
+    Vektörler satır-normalize yazılır; satır sırası arama matrisinin sırasıyla aynıysa VectorDatabase
+    mmap'i kopyalamadan kullanır (sayfalar tüm worker'larda işletim sistemi önbelleğinden paylaşılır).
+    Depoyu aynı anda tek süreç yazar (flock); okuyanlar paylaşımlı kilitle açar, yayın sırasında dosya silinmez."""
+    def __init__(self, path=EMBEDDING_STORE_DIR, model=EMBEDDING_MODEL):
+        self.path = path
+        self.model = model
+        self.index_path = os.path.join(path, "index.json")
+        self.lock_path = os.path.join(path, ".lock")
+        self.entries = {}   # doc_id -> {"hash": ..., "row": ...}
+        self.matrix = None  # float32, memory-mapped (salt okunur)
+        self.normalized = False
+        self.load()
+
+    @staticmethod
+    def content_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def locked(self, shared=False):
+        """Süreçler arası kilit: yazma + yayın + eski dosya temizliği tek süreçte, okuma yayınla çakışmaz."""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try: yield
+            finally: fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self, lock=True):
+        """Yayınlanmış index.json'u açar. Çağıran zaten locked() içindeyse lock=False verilir (flock iç içe alınamaz)."""
+        if not os.path.exists(self.index_path): return
+        if lock:
+            with self.locked(shared=True): return self.load(lock=False)
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f: meta = json.load(f)
+            # Model değiştiyse eski vektörler geçersizdir
+            if meta.get("model") != self.model: return
+            self.matrix = np.load(os.path.join(self.path, meta["matrix"]), mmap_mode="r")
+            self.entries = meta.get("entries", {})
+            self.normalized = meta.get("normalized", False)
+        except Exception:
+            self.entries, self.matrix, self.normalized = {}, None, False
+
+    def get(self, doc_id, text_hash):
+        entry = self.entries.get(doc_id)
+        if entry is None or entry.get("hash") != text_hash or self.matrix is None: return None
+        return self.matrix[entry["row"]]
+
+    def save(self, vectors):
+        """vectors: {doc_id: (hash, vektör)}; satırlar bu sırayla yazılır. Matris önce yazılır, index en son atomik olarak değiştirilir.
+        Çağıran locked() içinde olmalıdır: eski dosyalar ancak o zaman başka bir sürecin yazdığı/açtığı dosya olamaz."""
+        if not vectors: return
+        os.makedirs(self.path, exist_ok=True)
+        ids = list(vectors.keys())
+        matrix = np.asarray([vectors[i][1] for i in ids], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        matrix_name = f"vectors-{uuid.uuid4().hex}.npy"
+        tmp_matrix = os.path.join(self.path, matrix_name + ".tmp")
+        with open(tmp_matrix, "wb") as f: np.save(f, matrix)
+        os.replace(tmp_matrix, os.path.join(self.path, matrix_name))
+
+        meta = {"model": self.model, "matrix": matrix_name, "normalized": True,
+                "entries": {doc_id: {"hash": vectors[doc_id][0], "row": row} for row, doc_id in enumerate(ids)}}
+        tmp_index = self.index_path + ".tmp"
+        with open(tmp_index, "w", encoding="utf-8") as f: json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_index, self.index_path)
+
+        # Eski matris dosyalarını temizle (açık mmap'ler POSIX'te çalışmaya devam eder)
+        for name in os.listdir(self.path):
+            if name.startswith("vectors-") and name.endswith(".npy") and name != matrix_name:
+                try: os.remove(os.path.join(self.path, name))
+                except OSError: pass
+        self.matrix = np.load(os.path.join(self.path, matrix_name), mmap_mode="r")
+        self.entries = meta["entries"]
+        self.normalized = True
+
+# ==========================================
+# 0.1 TÜRKÇE NORMALİZASYON (BM25 İÇİN)
+# ==========================================
+# Hafif ekleri (çoğul, hal) kökten ayırır; uzundan kısaya denenir. Noktalı/noktasız i katlandığı için 'ı' yok.
+# Tek harfli ekler (belirtme hali) kökle karıştığı için bilinçli olarak atlanmıyor.
+TR_SUFFIXES = sorted([
+    "lerin", "larin", "leri", "lari", "ler", "lar",
+    "nin", "nun",
+    "nden", "ndan", "den", "dan", "ten", "tan",
+    "de", "da", "te", "ta", "in", "un", "yi", "yu", "ye", "ya",
+], key=len, reverse=True)
+TR_MIN_STEM = 4
+
+def normalize_tr(text):
+    """Türkçe küçük harfe çevirir (İ/I kuralı) ve noktalı/noktasız i farkını katlar."""
+    return text.replace("İ", "i").replace("I", "ı").lower().replace("ı", "i")
+
+def stem_tr(word):
+    """Basit ek budama: en fazla iki ek atılır, kök TR_MIN_STEM harften kısa kalmaz."""
+    for _ in range(2):
+        for suffix in TR_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= TR_MIN_STEM:
+                word = word[:-len(suffix)]
+                break
+        else:
+            break
+    return word
+
+def tokenize_tr(text):
+    return [stem_tr(w) for w in re.findall(r'\w+', normalize_tr(text))]
+
+def query_cache_key(text, model):
+    """Büyük/küçük harf, noktalama ve boşluk farklarını yok sayan sorgu hash'i."""
+    normalized = " ".join(re.findall(r'\w+', normalize_tr(text)))
+    return hashlib.sha256(f"{model}\x00{normalized}".encode("utf-8")).hexdigest()
+
+# ==========================================
+# 0.2 TOPLU EMBEDDING (BATCH + RETRY)
+# ==========================================
+def estimate_tokens(text):
+    """Tokenizer'sız kaba tahmin: Türkçe metinde ~3 karakter/token."""
+    return len(text) // 3 + 1
+
+def make_batches(texts, max_items=None, max_tokens=None):
+    """Metin indekslerini hem adet hem token bütçesiyle sınırlı gruplara böler."""
+    max_items = max_items or EMBED_BATCH_SIZE
+    max_tokens = max_tokens or EMBED_BATCH_TOKENS
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current: batches.append(current)
+    return batches
+
+def is_retryable(error):
+    """429, 5xx ve bağlantı/zaman aşımı hataları tekrar denenir."""
+    if isinstance(error, APIConnectionError): return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+def retry_delay(error, attempt, base=None):
+    """Retry-After başlığı varsa ona uyar, yoksa jitter'lı üstel bekleme."""
+    base = EMBED_BACKOFF_BASE if base is None else base
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try: return float(headers.get("retry-after"))
+    except (TypeError, ValueError): pass
+    return base * (2 ** attempt) * (0.5 + random.random())
+
+# ==========================================
+# 0.3 YAPISAL PARÇALAMA (CHUNKING)
+# ==========================================
+# Cümle sonu/noktalı virgül ya da "a)", "ç)", "2)" gibi bent işaretlerinden bölünür
+CLAUSE_SPLIT_RE = re.compile(r'\n+|(?<=[.;:!?])\s+|\s+(?=(?:[a-zçğıöşü]|\d{1,2})\)\s)')
+
+def split_clauses(text):
+    return [u.strip() for u in CLAUSE_SPLIT_RE.split(text) if u and u.strip()]
+
+def chunk_document(doc, max_tokens=None, overlap=None):
+    """Maddeyi token sınırlı, örtüşmeli parçalara böler. Her parça madde id/kategori/başlığını taşır;
+    overlap_chars, parçanın başındaki bir önceki parçadan tekrar eden kısmın uzunluğudur."""
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    groups, current, carried = [], [], 0
+    for unit in split_clauses(doc["icerik"]):
+        if len(current) > carried and estimate_tokens(" ".join(current + [unit])) > max_tokens:
+            groups.append((current, carried))
+            # Tek cümlelik parçanın tamamı bir sonrakine taşınmaz (örtüşme, parçanın kendisi olmasın)
+            current = current[-overlap:] if overlap and len(current) > overlap else []
+            carried = len(current)
+        current.append(unit)
+    if len(current) > carried or not groups: groups.append((current, carried))
+
+    meta = {k: v for k, v in doc.items() if k not in ("icerik", "vector")}
+    return [dict(meta, icerik=" ".join(units), chunk=i, chunk_count=len(groups),
+                 overlap_chars=len(" ".join(units[:carried])) + 1 if carried else 0)
+            for i, (units, carried) in enumerate(groups)]
+
+def assemble_context(chunks, budget=None):
+    """Sıralı parçaları token bütçesine sığdırır; aynı maddenin parçaları tek başlık altında metin sırasıyla,
+    örtüşen kısım tekrarlanmadan birleştirilir. Maddeler en iyi parçalarının sırasını korur."""
+    budget = budget or RAG_TOKEN_BUDGET
+    groups, used = {}, 0
+    for chunk in chunks:
+        cost = estimate_tokens(chunk["icerik"])
+        if groups and used + cost > budget: continue
+        groups.setdefault(chunk.get("id"), []).append(chunk)
+        used += cost
+    parts = []
+    for group in groups.values():
+        group.sort(key=lambda c: c.get("chunk", 0))
+        body = group[0]["icerik"]
+        for prev, chunk in zip(group, group[1:]):
+            if chunk.get("chunk") == prev.get("chunk", 0) + 1: body += " " + chunk["icerik"][chunk.get("overlap_chars", 0):]
+            else: body += " [...] " + chunk["icerik"]
+        parts.append(f"KANUN: {group[0].get('baslik')}\nİÇERİK: {body}")
+    return "\n\n".join(parts)
 
 # ==========================================
 # 1. HİBRİT VEKTÖR ARAMA MOTORU (SEMANTIC RAG)
 # ==========================================
 class VectorDatabase:
-    def __init__(self, docs_path="legal_docs/mevzuat.txt"):
+    def __init__(self, docs_path="legal_docs/mevzuat.txt", embed_fn=None, embed_model=EMBEDDING_MODEL, store_dir=EMBEDDING_STORE_DIR,
+                 embed_batch_fn=None, client=None):
         self.docs = []
+        # Arama birimi: maddelerin parçaları (embedding, BM25 ve matris bunlar üzerinden kurulur)
+        self.chunks = []
+        # Semantik arama için: normalize edilmiş, kategoriye göre sıralı tek parça matris
+        self.matrix = None
+        self.matrix_docs = []
+        self.category_slices = {}
+        # Yedek (lexical) arama için ters indeks: terim -> [(doküman sırası, tf)]
+        self.postings = {}
+        self.doc_lens = []
+        self.avgdl = 0.0
         self.api_key = os.getenv("OPENAI_API_KEY")
-        self.client = None
+        self.client = client
+        # embed_fn: metin -> vektör, embed_batch_fn: [metin] -> [vektör].
+        # Verilmezse OpenAI kullanılır (offline test için yerel fonksiyon verilebilir)
+        self.embed_fn = embed_fn
+        self.embed_batch_fn = embed_batch_fn
+        self.embed_model = embed_model
+        self.ingest_stats = {}
         
-        # API Key varsa istemciyi başlat
-        if self.api_key and not "benim keyim" in self.api_key:
-            try:
-                self.client = OpenAI(api_key=self.api_key)
-            except: pass
-            
+        # API Key varsa istemciyi başlat (tekrar denemeyi kendimiz yaptığımız için SDK retry kapalı)
+        if self.embed_fn is None and self.embed_batch_fn is None:
+            if self.client is None and self.api_key and not "benim keyim" in self.api_key:
+                try: self.client = OpenAI(api_key=self.api_key, max_retries=0)
+                except: pass
+            if self.client: self.embed_batch_fn = self._openai_embeddings
+        if self.embed_batch_fn is None and self.embed_fn:
+            self.embed_batch_fn = lambda texts: [self.embed_fn(t) for t in texts]
+        if self.embed_fn is None and self.embed_batch_fn:
+            self.embed_fn = lambda text: self.embed_batch_fn([text])[0]
+
+        self.store = EmbeddingStore(store_dir, model=embed_model) if self.embed_fn else None
+        self.docs_path = docs_path
         self.load_documents(docs_path)
 
+    def rebuild(self, docs_path=None):
+        """Aynı embedding ayarlarıyla yeni bir anlık görüntü kurar. Değişmeyen dokümanların vektörleri
+        diskteki depodan gelir; sadece yeni/değişmiş maddeler embed edilir."""
+        return VectorDatabase(docs_path or self.docs_path, embed_fn=self.embed_fn, embed_model=self.embed_model,
+                              store_dir=self.store.path if self.store else EMBEDDING_STORE_DIR,
+                              embed_batch_fn=self.embed_batch_fn, client=self.client)
+
     def load_documents(self, path):
         if not os.path.exists(path): return
         with open(path, "r", encoding="utf-8") as f: content = f.read()
@@ -42,143 +317,481 @@ class VectorDatabase:
                         doc[parts[0].strip()] = parts[1].strip()
             
             if "icerik" in doc:
-                # Eğer API aktifse, dökümanı yüklerken vektörünü de oluştur (Caching)
-                # Not: Gerçek prodüksiyonda bu vektörler veritabanında saklanır.
-                # Burada demo amaçlı her açılışta (hafızada) oluşturuyoruz.
-                if self.client:
-                    doc["vector"] = self.get_embedding(doc["icerik"] + " " + doc.get("baslik", ""))
                 self.docs.append(doc)
 
+        self.chunks = [chunk for doc in self.docs for chunk in chunk_document(doc)]
+        self.build_lexical_index()
+        if self.embed_fn:
+            self.embed_documents()
+            self.build_matrix()
+
+    @staticmethod
+    def chunk_key(chunk, text_hash):
+        return f"{chunk.get('id') or text_hash}#{chunk.get('chunk', 0)}"
+
+    def embed_documents(self, progress_cb=None):
+        """Vektörleri diskteki depodan alır; sadece yeni veya değişmiş parçaları toplu olarak embed eder.
+        Depo build_matrix'in kategori sırasıyla yazılır ki arama matrisi doğrudan mmap olsun.
+        Depo eksikse tek süreç (kilidi alan) embed edip yayınlar; kilidi bekleyen worker'lar yayınlanan indeksi
+        yeniden açar ve hazır vektörleri kullanır, aynı korpusu tekrar embed etmez."""
+        vectors, missing = self._stored_vectors()
+        if self._store_outdated(vectors, missing):
+            with self.store.locked():
+                self.store.load(lock=False)
+                vectors, missing = self._stored_vectors()
+                if missing:
+                    new_vectors = self.embed_texts([m[2] for m in missing], progress_cb)
+                    for (doc_id, text_hash, _), vec in zip(missing, new_vectors):
+                        if vec is not None: vectors[doc_id] = (text_hash, vec)
+                    order = [chunk["doc_id"] for chunk in sorted(self.chunks, key=lambda d: d.get("kategori", ""))]
+                    vectors = {doc_id: vectors[doc_id] for doc_id in dict.fromkeys(order) if doc_id in vectors}
+                if self._store_outdated(vectors, missing): self.store.save(vectors)
+        for chunk in self.chunks:
+            entry = self.store.entries.get(chunk["doc_id"])
+            vec = self.store.get(chunk["doc_id"], entry["hash"]) if entry else None
+            if vec is not None: chunk["vector"], chunk["row"] = vec, entry["row"]
+
+    def _stored_vectors(self):
+        """Dönüş: ({doc_id: (hash, vektör)} depoda olanlar, [(doc_id, hash, metin)] embed edilmesi gerekenler)."""
+        vectors, missing = {}, []
+        for chunk in sorted(self.chunks, key=lambda d: d.get("kategori", "")):
+            text = (chunk["icerik"] + " " + chunk.get("baslik", "")).replace("\n", " ")
+            text_hash = EmbeddingStore.content_hash(text)
+            doc_id = self.chunk_key(chunk, text_hash)
+            chunk["doc_id"] = doc_id
+            vec = self.store.get(doc_id, text_hash)
+            if vec is None: missing.append((doc_id, text_hash, text))
+            else: vectors[doc_id] = (text_hash, vec)
+        return vectors, missing
+
+    def _store_outdated(self, vectors, missing):
+        # Silinen dokümanlar da depodan düşsün diye id kümesi farkı da değişiklik sayılır; eski (normalize edilmemiş
+        # veya farklı sıralı) depo da embedding istemeden yeniden yazılır
+        in_order = [self.store.entries.get(doc_id, {}).get("row") for doc_id in vectors] == list(range(len(vectors)))
+        return bool(missing) or set(vectors) != set(self.store.entries) or not self.store.normalized or not in_order
+
+    def embed_texts(self, texts, progress_cb=None):
+        """Metinleri batch'ler halinde, sınırlı eşzamanlılıkla embed eder. Başarısız batch'ler None döner."""
+        results = [None] * len(texts)
+        batches = make_batches(texts)
+        stats = {"documents": len(texts), "batches": len(batches), "embedded": 0, "failed": 0, "retries": 0,
+                 "seconds": 0.0, "docs_per_sec": 0.0}
+        self.ingest_stats = stats
+        start = time.time()
+
+        lock = threading.Lock()
+
+        def run(batch):
+            for attempt in range(EMBED_MAX_RETRIES + 1):
+                try:
+                    return self.embed_batch_fn([texts[i] for i in batch])
+                except Exception as e:
+                    if attempt == EMBED_MAX_RETRIES or not is_retryable(e): raise
+                    with lock: stats["retries"] += 1
+                    time.sleep(retry_delay(e, attempt))
+
+        with ThreadPoolExecutor(max_workers=max(1, EMBED_CONCURRENCY)) as pool:
+            futures = {pool.submit(run, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    for i, vec in zip(batch, future.result()): results[i] = vec
+                    stats["embedded"] += len(batch)
+                except Exception as e:
+                    logger.error(f"Embedding batch hatası: {e}")
+                    stats["failed"] += len(batch)
+                if progress_cb: progress_cb(stats["embedded"] + stats["failed"], len(texts))
+
+        stats["seconds"] = round(time.time() - start, 3)
+        stats["docs_per_sec"] = round(stats["embedded"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        logger.info(f"Embedding ingest: {stats}")
+        return results
+
+    def build_matrix(self):
+        """Vektörleri kategoriye göre gruplayıp satır-normalize edilmiş C-contiguous float32 matrise dizer."""
+        vec_docs = sorted((d for d in self.chunks if d.get("vector") is not None), key=lambda d: d.get("kategori", ""))
+        if not vec_docs:
+            self.matrix, self.matrix_docs, self.category_slices = None, [], {}
+            return
+        store_matrix = self.store.matrix if self.store else None
+        if (store_matrix is not None and self.store.normalized and len(store_matrix) == len(vec_docs)
+                and all(d.get("row") == i for i, d in enumerate(vec_docs))):
+            # Depo zaten normalize ve aynı sırada: kopya yok, worker'lar aynı sayfa önbelleğini okur
+            matrix = store_matrix
+        else:
+            matrix = np.ascontiguousarray(np.vstack([np.asarray(d["vector"], dtype=np.float32) for d in vec_docs]))
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+
+        # Sıralı olduğu için her kategori matriste kopyasız bir dilim (view) olur
+        slices, start = {}, 0
+        for i in range(1, len(vec_docs) + 1):
+            if i == len(vec_docs) or vec_docs[i].get("kategori") != vec_docs[start].get("kategori"):
+                slices[vec_docs[start].get("kategori")] = slice(start, i)
+                start = i
+        self.matrix, self.matrix_docs, self.category_slices = matrix, vec_docs, slices
+
+    def _openai_embeddings(self, texts):
+        data = self.client.embeddings.create(input=texts, model=self.embed_model).data
+        return [d.embedding for d in sorted(data, key=lambda d: d.index)]
+
+    def get_query_embedding(self, query):
+        """Sorgu vektörünü önbellekten verir; yoksa embed edip önbelleğe koyar."""
+        key = query_cache_key(query, self.embed_model)
+        vec = query_embedding_cache.get(key)
+        if vec is None:
+            vec = self.get_embedding(query)
+            if vec is None: return None
+            vec = np.asarray(vec, dtype=np.float32)
+            query_embedding_cache.set(key, vec)
+        return vec
+
     def get_embedding(self, text):
-        """Metni OpenAI kullanarak semantik vektöre çevirir."""
+        """Metni semantik vektöre çevirir (varsayılan: OpenAI)."""
         try:
-            if not self.client: return None
+            if not self.embed_fn: return None
             text = text.replace("\n", " ")
-            return self.client.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
+            return self.embed_fn(text)
         except:
             return None
 
-    def cosine_similarity(self, v1, v2):
-        """İki liste (vektör) arasındaki benzerliği hesaplar."""
-        dot_product = sum(a*b for a, b in zip(v1, v2))
-        magnitude1 = math.sqrt(sum(a*a for a in v1))
-        magnitude2 = math.sqrt(sum(b*b for b in v2))
-        if not magnitude1 or not magnitude2: return 0.0
-        return dot_product / (magnitude1 * magnitude2)
-
-    # --- ESKİ USUL (FALLBACK) ---
-    def text_to_counter(self, text):
-        words = re.findall(r'\w+', text.lower())
-        return Counter(words)
-
-    def counter_cosine_similarity(self, vec1, vec2):
-        intersection = set(vec1.keys()) & set(vec2.keys())
-        numerator = sum([vec1[x] * vec2[x] for x in intersection])
-        sum1 = sum([vec1[x]**2 for x in vec1.keys()])
-        sum2 = sum([vec2[x]**2 for x in vec2.keys()])
-        denominator = math.sqrt(sum1) * math.sqrt(sum2)
-        return float(numerator) / denominator if denominator else 0.0
-
-    def search(self, query, category_filter=None):
+    # --- ESKİ USUL (FALLBACK): BM25 ---
+    BM25_K1 = 1.5
+    BM25_B = 0.75
+
+    def build_lexical_index(self):
+        """Korpusu bir kez tokenize edip ters indeksi kurar (sorgu anında doküman taranmaz)."""
+        postings, doc_lens = {}, []
+        for idx, doc in enumerate(self.chunks):
+            terms = Counter(tokenize_tr(doc["icerik"] + " " + doc.get("baslik", "")))
+            doc_lens.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings.setdefault(term, []).append((idx, tf))
+        self.postings, self.doc_lens = postings, doc_lens
+        self.avgdl = (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0
+
+    def lexical_search(self, query, category_filter=None, top_k=None):
+        """Sadece sorgu terimlerinin posting listeleri üzerinden BM25 skoru hesaplar."""
+        n_docs = len(self.doc_lens)
+        if not n_docs: return []
+        scores = {}
+        k1, b = self.BM25_K1, self.BM25_B
+        for term in set(tokenize_tr(query)):
+            plist = self.postings.get(term)
+            if not plist: continue
+            idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for idx, tf in plist:
+                if category_filter and category_filter != self.chunks[idx].get("kategori"): continue
+                norm = k1 * (1 - b + b * self.doc_lens[idx] / self.avgdl)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return [self.chunks[idx] for idx, _ in ranked[:top_k]]
+
+    def semantic_search(self, query_vec, category_filter=None, top_k=None, threshold=0.25):
+        """Tek matris-vektör çarpımı + argpartition ile top-k kosinüs araması."""
+        if self.matrix is None: return []
+        if category_filter:
+            rows = self.category_slices.get(category_filter)
+            if rows is None: return []
+        else:
+            rows = slice(0, len(self.matrix_docs))
+
+        q = np.asarray(query_vec, dtype=np.float32)
+        q_norm = np.linalg.norm(q)
+        if not q_norm: return []
+        scores = self.matrix[rows] @ (q / q_norm)
+
+        candidates = np.flatnonzero(scores > threshold)
+        if top_k and len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [self.matrix_docs[rows.start + i] for i in candidates]
+
+    def search(self, query, category_filter=None, top_k=None):
         # 1. YÖNTEM: SEMANTİK ARAMA (OpenAI Vektörleri)
-        if self.client:
-            query_vec = self.get_embedding(query)
-            if query_vec:
-                results = []
-                for doc in self.docs:
-                    if category_filter and category_filter != doc.get("kategori"): continue
-                    if "vector" in doc:
-                        score = self.cosine_similarity(query_vec, doc["vector"])
-                        if score > 0.25: results.append((score, doc))
-                results.sort(key=lambda x: x[0], reverse=True)
-                return [r[1] for r in results]
+        if self.embed_fn:
+            with stage("embedding"): query_vec = self.get_query_embedding(query)
+            if query_vec is not None:
+                return self.semantic_search(query_vec, category_filter, top_k)
 
         # 2. YÖNTEM: ESKİ USUL (API Yoksa Yedek Sistem)
-        query_cnt = self.text_to_counter(query)
-        results = []
-        for doc in self.docs:
-            if category_filter and category_filter != doc.get("kategori"): continue
-            doc_text = doc["icerik"] + " " + doc.get("baslik", "")
-            score = self.counter_cosine_similarity(query_cnt, self.text_to_counter(doc_text))
-            if score > 0.05: results.append((score, doc))
-        results.sort(key=lambda x: x[0], reverse=True)
-        return [r[1] for r in results]
+        return self.lexical_search(query, category_filter, top_k)
 
 # Global Veritabanını Başlat
 vector_db = VectorDatabase()
 
 def search_legal_docs(query, category):
     if len(query) < 3: return ""
-    results = vector_db.search(query, category)
+    results = vector_db.search(query, category, top_k=RAG_TOP_K)  # global bir kez okunur: yenileme sırasında eski anlık görüntü kullanılmaya devam eder
     if not results: return "Özel bir mevzuat eşleşmesi bulunamadı."
-    best = results[0]
-    return f"KANUN: {best.get('baslik')}\nİÇERİK: {best.get('icerik')}"
+    return assemble_context(results)
 
 # ==========================================
 # 2. UZMAN KURAL MOTORU (RULE ENGINE)
 # ==========================================
+# Kurallar yüklenirken derlenir; metin tek geçişte "olgu"lara (tutar, tarih, anahtar kelime) ayrılır ve tüm kurallar bu olgular üzerinde çalışır
+AMOUNT_RE = re.compile(r'(\d{1,3}(?:[.,]\d{3})*)\s*(?:tl|türk lirası)')
+DATE_RE = re.compile(r'(\d{2})[./-](\d{2})[./-](\d{4})')
+TIME_RULE_KEYS = ("itiraz_suresi", "cayma_hakki", "ise_iade", "savcilik_sikayet", "ayipli_mal")
+MAX_DATE_AGE_DAYS = 365 * 5
+KIRA_ARTISI_KEYWORDS = ("zam", "artış")
+URL_KEYWORD = "http"
+# Saf Python otomat karakter başına çalışır; az kelimede C seviyesindeki `k in text` taramaları daha hızlıdır (ölçüm: ~150 kelime civarı başa baş)
+AHO_CORASICK_MIN_KEYWORDS = int(os.getenv("AHO_CORASICK_MIN_KEYWORDS", "150"))
+
+class AhoCorasick:
+    """Çok sayıda anahtar kelimeyi metinde tek geçişte arar (alt dize eşleşmesi, `k in text` ile aynı anlam)."""
+    def __init__(self, words):
+        self.goto, self.fail, self.out = [{}], [0], [set()]
+        for word in words:
+            if not word: continue
+            node = 0
+            for ch in word:
+                if ch not in self.goto[node]:
+                    self.goto.append({}); self.fail.append(0); self.out.append(set())
+                    self.goto[node][ch] = len(self.goto) - 1
+                node = self.goto[node][ch]
+            self.out[node].add(word)
+        # BFS ile hata bağlantıları: eşleşme koparsa en uzun ortak sonek düğümüne düşülür
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and ch not in self.goto[fail]: fail = self.fail[fail]
+                nxt = self.goto[fail].get(ch, 0)
+                self.fail[child] = nxt if nxt != child else 0
+                self.out[child] |= self.out[self.fail[child]]
+
+    def find(self, text):
+        found, node = set(), 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for ch in text:
+            while node and ch not in goto[node]: node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]: found |= out[node]
+        return found
+
+class KeywordMatcher:
+    """Kelime kümesi büyükse Aho-Corasick ile tek geçiş, küçükse kelime başına C hızında alt dize araması."""
+    def __init__(self, words):
+        self.words = tuple(dict.fromkeys(w for w in words if w))
+        self.automaton = AhoCorasick(self.words) if len(self.words) >= AHO_CORASICK_MIN_KEYWORDS else None
+
+    def find(self, text):
+        if self.automaton: return self.automaton.find(text)
+        return {w for w in self.words if w in text}
+
+def rule_day_limit(rule):
+    return rule.get("gun") or rule.get("sure_gun") or (rule.get("zaman_asimi_ay", 0)*30) or (rule.get("zaman_asimi_yil", 0)*365)
+
 class RuleEngine:
-    def __init__(self, rules_path="legal_docs/rules.json"):
+    def __init__(self, rules_path="legal_docs/rules.json", strict=False):
         self.rules = {}
-        self.load_rules(rules_path)
+        self.plans = {}
+        self.rules_path = rules_path
+        self.load_rules(rules_path, strict)
     
-    def load_rules(self, path):
+    def load_rules(self, path, strict=False):
+        # strict: bozuk JSON sessizce boş kural setine dönüşmesin (sıcak yenilemede eski kurallar korunur)
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
                 try: self.rules = json.load(f)
-                except: pass
+                except:
+                    if strict: raise
+        self.compile()
 
-    def check(self, category, text, ocr_text=""):
-        warnings = []
+    def compile(self):
+        """Kategori başına yürütme planı: sadece kategoride olan kurallar, hazır limit/mesajlar ve kategorinin anahtar kelime eşleştiricisi."""
+        plans = {}
+        for category, cat_rules in self.rules.items():
+            if not cat_rules: continue
+            plan = {"amount": None, "time": [], "required": None, "kira_artisi": None, "url": None}
+            keywords = []
+            if "parasal_sinir" in cat_rules:
+                rule = cat_rules["parasal_sinir"]
+                plan["amount"] = (rule.get("2025_limit_ilce", rule.get("limit", 0)), rule.get("uyari_mesaji", ""))
+            for key in TIME_RULE_KEYS:
+                if key in cat_rules and rule_day_limit(cat_rules[key]) > 0:
+                    plan["time"].append((rule_day_limit(cat_rules[key]), cat_rules[key].get("uyari_mesaji", "")))
+            if "zorunlu_kelimeler" in cat_rules:
+                plan["required"] = (tuple(cat_rules["zorunlu_kelimeler"]), cat_rules.get("eksik_belge_mesaji", ""))
+                keywords.extend(cat_rules["zorunlu_kelimeler"])
+            if category == "kira" and "kira_artisi" in cat_rules:
+                plan["kira_artisi"] = cat_rules["kira_artisi"].get("uyari_mesaji", "")
+                keywords.extend(KIRA_ARTISI_KEYWORDS)
+            if category == "bilişim_suclari" and "url_tespiti" in cat_rules:
+                plan["url"] = cat_rules["url_tespiti"].get("uyari_mesaji", "")
+                keywords.append(URL_KEYWORD)
+            plan["matcher"] = KeywordMatcher(keywords)
+            plans[category] = plan
+        self.plans = plans
+
+    def extract_facts(self, text, plan, now=None):
+        """Metni bir kez tarar. Tekrarlanan tutar/tarihler tek olgu sayılır (aynı tarih için tekrar uyarı üretilmez)."""
+        facts = {"amounts": [], "dates": {}, "keywords": set()}
+        if plan["amount"]:
+            for amt in dict.fromkeys(AMOUNT_RE.findall(text)):
+                try: facts["amounts"].append(float(amt.replace('.', '').replace(',', '.')))
+                except ValueError: pass
+        if plan["time"]:
+            now = now or datetime.now()
+            for m in DATE_RE.finditer(text):
+                if m.group(0) in facts["dates"]: continue
+                try: facts["dates"][m.group(0)] = (now - datetime(int(m.group(3)), int(m.group(2)), int(m.group(1)))).days
+                except ValueError: pass
+        if plan["matcher"].words: facts["keywords"] = plan["matcher"].find(text)
+        return facts
+
+    def check(self, category, text, ocr_text="", now=None):
         text = (text + " " + ocr_text).lower()
-        cat_rules = self.rules.get(category, {})
-        if not cat_rules: return ""
+        plan = self.plans.get(category)
+        if not plan: return ""
+        facts = self.extract_facts(text, plan, now)
+        warnings = []
 
         # A) Parasal Sınır
-        if "parasal_sinir" in cat_rules:
-            rule = cat_rules["parasal_sinir"]
-            limit = rule.get("2025_limit_ilce", rule.get("limit", 0))
-            msg = rule.get("uyari_mesaji", "")
-            amounts = re.findall(r'(\d{1,3}(?:[.,]\d{3})*)\s*(?:tl|türk lirası)', text)
-            for amt in amounts:
-                try:
-                    val = float(amt.replace('.', '').replace(',', '.'))
-                    if val > limit: warnings.append(msg.format(deger=val, limit_ilce=limit))
-                except: pass
+        if plan["amount"]:
+            limit, msg = plan["amount"]
+            for val in facts["amounts"]:
+                if val > limit: warnings.append(msg.format(deger=val, limit_ilce=limit))
 
         # B) Tarih Kontrolleri
-        time_rules = ["itiraz_suresi", "cayma_hakki", "ise_iade", "savcilik_sikayet", "ayipli_mal"]
-        for key in time_rules:
-            if key in cat_rules:
-                rule = cat_rules[key]
-                limit = rule.get("gun") or rule.get("sure_gun") or (rule.get("zaman_asimi_ay", 0)*30) or (rule.get("zaman_asimi_yil", 0)*365)
-                msg = rule.get("uyari_mesaji", "")
-                if limit > 0:
-                    dates = re.findall(r'(\d{2}[./-]\d{2}[./-]\d{4})', text)
-                    for d in dates:
-                        try:
-                            dt = datetime.strptime(d.replace('/', '.').replace('-', '.'), '%d.%m.%Y')
-                            diff = (datetime.now() - dt).days
-                            if 0 < diff > limit and diff < (365*5):
-                                try: warnings.append(msg.format(fark_gun=diff, fark_ay=round(diff/30, 1), fark_yil=round(diff/365, 1)))
-                                except: warnings.append(msg)
-                        except: pass
+        for limit, msg in plan["time"]:
+            for date_str, diff in facts["dates"].items():
+                if 0 < diff and limit < diff < MAX_DATE_AGE_DAYS:
+                    try: warnings.append(msg.format(fark_gun=diff, fark_ay=round(diff/30, 1), fark_yil=round(diff/365, 1), tarih=date_str))
+                    except: warnings.append(msg)
 
         # C) Eksik Belge
-        if "zorunlu_kelimeler" in cat_rules:
-            if not any(k in text for k in cat_rules["zorunlu_kelimeler"]):
-                warnings.append(cat_rules.get("eksik_belge_mesaji", ""))
+        if plan["required"]:
+            required, msg = plan["required"]
+            if not facts["keywords"].intersection(required): warnings.append(msg)
         
         # D) Özel Durumlar
-        if category == "kira" and "kira_artisi" in cat_rules and ("zam" in text or "artış" in text):
-            warnings.append(cat_rules["kira_artisi"].get("uyari_mesaji", "").format(oran="71.5"))
+        if plan["kira_artisi"] is not None and facts["keywords"].intersection(KIRA_ARTISI_KEYWORDS):
+            warnings.append(plan["kira_artisi"].format(oran="71.5"))
         
-        if category == "bilişim_suclari" and "url_tespiti" in cat_rules and "http" not in text:
-            warnings.append(cat_rules["url_tespiti"].get("uyari_mesaji", "").format(url_var_mi="URL"))
+        if plan["url"] is not None and URL_KEYWORD not in facts["keywords"]:
+            warnings.append(plan["url"].format(url_var_mi="URL"))
 
-        return "\n".join(warnings)
+        # Farklı kurallar aynı mesajı üretirse bir kez gösterilir
+        return "\n".join(dict.fromkeys(warnings))
 
 expert_system = RuleEngine()
 
 def check_rules(category, text, ocr_text=""):
-    return expert_system.check(category, text, ocr_text)
\ No newline at end of file
+    return expert_system.check(category, text, ocr_text)  # yenileme globali değiştirse de bu çağrı eski motorla tamamlanır
+
+# ==========================================
+# 3. SICAK YENİLEME (HOT RELOAD)
+# ==========================================
+KNOWLEDGE_RELOAD_INTERVAL = float(os.getenv("KNOWLEDGE_RELOAD_INTERVAL", "30"))  # sn, 0 = kapalı
+# Zorunlu yenileme isteği ve son yayınlanan sürüm tüm worker'ların gördüğü ortak depoda tutulur
+knowledge_state = shared_cache("knowledge", maxsize=16)
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+class KnowledgeReloader:
+    """rules.json ve mevzuat.txt'yi mtime ile yoklar. Değişen dosyanın yeni motorunu arka planda kurar ve
+    modül globalini tek atamayla değiştirir; işlemdeki istekler eski anlık görüntüyle biter.
+    Zorunlu yenileme (admin) ortak depoya yazılır; her worker kendi yoklama thread'inde uygular."""
+    def __init__(self, docs_path, rules_path, interval=KNOWLEDGE_RELOAD_INTERVAL):
+        self.paths = {"mevzuat": docs_path, "rules": rules_path}
+        self.signatures = {name: file_signature(path) for name, path in self.paths.items()}
+        self.interval = interval
+        self.version = 1
+        self.loaded_at = time.time()
+        self.last_reload = {}
+        self.last_error = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.pid = None
+        # Açılıştan önce verilmiş istekler yeni süreçte tekrar uygulanmaz
+        self.forced_at = knowledge_state.get("force_requested", 0)
+
+    def start(self):
+        """Süreç başına bir yoklama thread'i (gunicorn fork'undan sonra yeniden başlatılır)."""
+        if self.interval <= 0 or (self.thread and self.thread.is_alive() and self.pid == os.getpid()): return
+        with self.lock:
+            if self.thread and self.thread.is_alive() and self.pid == os.getpid(): return
+            self.thread, self.pid = threading.Thread(target=self._poll, daemon=True, name="knowledge-reload"), os.getpid()
+            self.thread.start()
+
+    def _poll(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.reload(force=self.force_pending())
+
+    def request_reload(self):
+        """Tüm worker'lardan zorunlu yenileme ister; kurulum istek thread'inde değil yoklama thread'lerinde yapılır."""
+        requested = time.time()
+        knowledge_state.set("force_requested", requested)
+        if self.interval > 0: self.wake.set()  # bu worker beklemeden başlar, diğerleri en geç bir yoklama aralığında
+        else: threading.Thread(target=lambda: self.reload(force=self.force_pending()), daemon=True, name="knowledge-reload").start()
+        return requested
+
+    def force_pending(self):
+        requested = knowledge_state.get("force_requested", 0)
+        if requested <= self.forced_at: return False
+        self.forced_at = requested
+        return True
+
+    def published(self):
+        """Herhangi bir worker'ın en son yayınladığı sürüm (admin paneli tek worker'ın görüşüyle yetinmesin)."""
+        return knowledge_state.get("published")
+
+    def reload(self, force=False):
+        """Değişen bileşenleri yeniden kurar. Dönüş: yenilenen bileşen adları.
+        Başka bir thread zaten kuruyorsa beklemeden [] döner."""
+        global vector_db, expert_system
+        if not self.lock.acquire(blocking=False): return []
+        try:
+            signatures = {name: file_signature(path) for name, path in self.paths.items()}
+            changed = [name for name in self.paths if force or signatures[name] != self.signatures[name]]
+            if not changed: return []
+            timings = {}
+            try:
+                if "rules" in changed:
+                    start = time.time()
+                    new_rules = RuleEngine(self.paths["rules"], strict=True)
+                    timings["rules"] = round(time.time() - start, 3)
+                if "mevzuat" in changed:
+                    start = time.time()
+                    new_db = vector_db.rebuild(self.paths["mevzuat"])
+                    timings["mevzuat"] = round(time.time() - start, 3)
+            except Exception as e:
+                # Yarım kalan yenileme yayınlanmaz; eski sürüm hizmet vermeye devam eder
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Bilgi bankası yenileme hatası: {e}")
+                return []
+            if "rules" in changed: expert_system = new_rules
+            if "mevzuat" in changed: vector_db = new_db
+            self.signatures.update(signatures)
+            self.version += 1
+            self.loaded_at = time.time()
+            self.last_reload = {"changed": changed, "seconds": timings,
+                                "embedded": vector_db.ingest_stats.get("embedded", 0) if "mevzuat" in changed else 0}
+            self.last_error = None
+            knowledge_state.set("published", {"pid": os.getpid(), "loaded_at": datetime.fromtimestamp(self.loaded_at),
+                                              "changed": changed, "documents": len(vector_db.docs)})
+            logger.info(f"Bilgi bankası v{self.version} yüklendi: {self.last_reload}")
+            return changed
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        requested = knowledge_state.get("force_requested", 0)
+        return {"version": self.version, "loaded_at": datetime.fromtimestamp(self.loaded_at), "documents": len(vector_db.docs),
+                "rule_categories": len(expert_system.plans), "last_reload": self.last_reload, "last_error": self.last_error,
+                "pid": os.getpid(), "pending": requested > self.forced_at or self.lock.locked(), "published": self.published()}
+
+knowledge_reloader = KnowledgeReloader(vector_db.docs_path, expert_system.rules_path)
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from ocr_service import extract_text_from_path
+
+logger = logging.getLogger(__name__)
+
+OCR_JOBS_DB = os.getenv("OCR_JOBS_DB", "ocr_jobs.db")
+OCR_JOB_WORKERS = int(os.getenv("OCR_JOB_WORKERS", "2"))        # Süreç başına OCR thread'i
+OCR_QUEUE_MAX_DEPTH = int(os.getenv("OCR_QUEUE_MAX_DEPTH", "50"))  # Sıradaki toplam iş sınırı
+OCR_JOBS_PER_USER = int(os.getenv("OCR_JOBS_PER_USER", "2"))      # Kullanıcı başına aynı anda bekleyen/çalışan iş
+OCR_JOB_TTL = int(os.getenv("OCR_JOB_TTL", "1800"))               # İş kaydı ve sonucu bu süre sonra silinir (sn)
+OCR_POLL_INTERVAL = float(os.getenv("OCR_POLL_INTERVAL", "0.5"))
+# 'running' kalan iş (worker çöktü/yeniden başladı) bu süreden sonra sahipsiz sayılır; OCR_TIME_BUDGET'tan uzun olmalı
+OCR_JOB_LEASE = int(os.getenv("OCR_JOB_LEASE", "300"))
+OCR_JOB_MAX_ATTEMPTS = int(os.getenv("OCR_JOB_MAX_ATTEMPTS", "2"))  # Sahipsiz iş en fazla bu kadar kez denenir
+ABANDONED_ERROR = {"error": "Belge işlenirken sunucu yeniden başladı.", "suggestion": "Lütfen belgeyi tekrar yükleyin."}
+
+class QueueFullError(Exception):
+    """Kuyruk veya kullanıcı limiti dolu."""
+
+# ==========================================
+# SQLITE TABANLI OCR İŞ KUYRUĞU
+# ==========================================
+class OCRJobQueue:
+    """Yüklenen dosyalar için OCR işlerini SQLite'ta tutar; yerel thread havuzu işleri sırayla alır.
+    Kayıtlar SQLite'ta olduğu için durum sorgusu hangi gunicorn worker'ına düşerse düşsün cevaplanır."""
+    def __init__(self, path=OCR_JOBS_DB, workers=OCR_JOB_WORKERS, max_depth=OCR_QUEUE_MAX_DEPTH,
+                 per_user=OCR_JOBS_PER_USER, ttl=OCR_JOB_TTL, processor=None, lease=OCR_JOB_LEASE,
+                 max_attempts=OCR_JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.workers = workers
+        self.max_depth = max_depth
+        self.per_user = per_user
+        self.ttl = ttl
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.processor = processor or extract_text_from_path
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.pid = None
+        self.lock = threading.Lock()
+        self.ready = False  # Tablo ilk kullanımda kurulur: modül import edilince çalışma dizininde dosya açılmaz
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            if not self.ready: self._create_tables(conn)
+            with conn: yield conn
+        finally:
+            conn.close()
+
+    def _create_tables(self, conn):
+        with conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS ocr_jobs (
+                id TEXT PRIMARY KEY, user_id INTEGER, status TEXT NOT NULL, file_path TEXT,
+                result TEXT, created REAL, updated REAL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_ocr_jobs_status ON ocr_jobs(status, created)")
+            for ddl in ("ALTER TABLE ocr_jobs ADD COLUMN cache_key TEXT", "ALTER TABLE ocr_jobs ADD COLUMN attempts INTEGER DEFAULT 0"):
+                try: conn.execute(ddl)
+                except sqlite3.OperationalError: pass  # kolon zaten var
+        self.ready = True
+
+    def start(self):
+        # Thread'ler fork'tan sonra kopyalanmaz; her süreç kendi havuzunu tembel başlatır
+        with self.lock:
+            if self.pid == os.getpid() and all(t.is_alive() for t in self.threads): return
+            self.stopping.clear()
+            with self._connect() as conn: self._reclaim_stale(conn)
+            self.threads = [threading.Thread(target=self._worker, daemon=True, name=f"ocr-job-{i}") for i in range(self.workers)]
+            for t in self.threads: t.start()
+            self.pid = os.getpid()
+
+    def stop(self, timeout=5):
+        """Thread'leri durdurur (çalışan iş bitince çıkarlar); start() ile yeniden açılabilir."""
+        with self.lock:
+            self.stopping.set()
+            self.wakeup.set()
+            for t in self.threads: t.join(timeout)
+            self.threads, self.pid = [], None
+
+    def enqueue(self, user_id, file_path, cache_key=None):
+        """İşi kuyruğa ekler ve id'sini döner. Limit aşılırsa dosyayı silip QueueFullError fırlatır."""
+        self.expire()
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._reclaim_stale(conn)  # çöken worker'dan kalan 'running' iş kullanıcıyı kilitlemesin
+            depth = conn.execute("SELECT COUNT(*) FROM ocr_jobs WHERE status = 'queued'").fetchone()[0]
+            active = conn.execute("SELECT COUNT(*) FROM ocr_jobs WHERE user_id = ? AND status IN ('queued', 'running')",
+                                  (user_id,)).fetchone()[0]
+            if depth >= self.max_depth or active >= self.per_user:
+                if os.path.exists(file_path): os.remove(file_path)
+                raise QueueFullError("Sistem yoğun." if depth >= self.max_depth else "Bekleyen belge işleminiz var.")
+            conn.execute("INSERT INTO ocr_jobs (id, user_id, status, file_path, cache_key, created, updated) VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                         (job_id, user_id, file_path, cache_key, now, now))
+        self.start()
+        self.wakeup.set()
+        return job_id
+
+    def complete(self, user_id, result):
+        """Sonucu hazır olan (ör. OCR önbelleğinden gelen) iş için kuyruğa girmeden 'done' kaydı açar."""
+        now, job_id = time.time(), uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("INSERT INTO ocr_jobs (id, user_id, status, result, created, updated) VALUES (?, ?, 'done', ?, ?, ?)",
+                         (job_id, user_id, json.dumps(result, ensure_ascii=False), now, now))
+        return job_id
+
+    def status(self, job_id, user_id=None):
+        with self._connect() as conn:
+            row = conn.execute("SELECT user_id, status, result, created FROM ocr_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (user_id is not None and row[0] != user_id): return None
+        if time.time() - row[3] > self.ttl: return None
+        job = {"job_id": job_id, "status": row[1]}
+        if row[2]: job.update(json.loads(row[2]))
+        return job
+
+    def _reclaim_stale(self, conn):
+        """Kirası (lease) dolmuş 'running' işleri yeniden sıraya koyar; deneme hakkı bitenleri hatayla kapatır."""
+        now = time.time()
+        cutoff = now - self.lease
+        abandoned = conn.execute("SELECT id, file_path FROM ocr_jobs WHERE status = 'running' AND updated < ? "
+                                 "AND COALESCE(attempts, 0) + 1 >= ?", (cutoff, self.max_attempts)).fetchall()
+        for job_id, file_path in abandoned:
+            # Yol NULL'lanınca expire() dosyayı artık bulamaz; yüklenen dosya burada silinir
+            if file_path and os.path.exists(file_path):
+                try: os.remove(file_path)
+                except OSError: pass
+            conn.execute("UPDATE ocr_jobs SET status = 'error', result = ?, updated = ?, file_path = NULL WHERE id = ?",
+                         (json.dumps(ABANDONED_ERROR, ensure_ascii=False), now, job_id))
+        requeued = conn.execute("UPDATE ocr_jobs SET status = 'queued', attempts = COALESCE(attempts, 0) + 1, updated = ? "
+                                "WHERE status = 'running' AND updated < ?", (now, cutoff)).rowcount
+        if requeued: logger.warning(f"Sahipsiz {requeued} OCR işi yeniden sıraya alındı.")
+
+    def claim(self):
+        """Sıradaki işi atomik olarak 'running' yapar (birden çok süreç aynı işi alamaz)."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._reclaim_stale(conn)
+            row = conn.execute("SELECT id, file_path, cache_key FROM ocr_jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+            if row is None: return None
+            conn.execute("UPDATE ocr_jobs SET status = 'running', updated = ? WHERE id = ?", (time.time(), row[0]))
+        return row
+
+    def finish(self, job_id, result):
+        status = "error" if "error" in result else "done"
+        with self._connect() as conn:
+            conn.execute("UPDATE ocr_jobs SET status = ?, result = ?, updated = ?, file_path = NULL WHERE id = ?",
+                         (status, json.dumps(result, ensure_ascii=False), time.time(), job_id))
+
+    def expire(self):
+        """Süresi dolan işleri (ve hâlâ diskte duran dosyalarını) siler."""
+        cutoff = time.time() - self.ttl
+        with self._connect() as conn:
+            rows = conn.execute("SELECT file_path FROM ocr_jobs WHERE created < ?", (cutoff,)).fetchall()
+            conn.execute("DELETE FROM ocr_jobs WHERE created < ?", (cutoff,))
+        for (file_path,) in rows:
+            if file_path and os.path.exists(file_path):
+                try: os.remove(file_path)
+                except OSError: pass
+
+    def _worker(self):
+        while not self.stopping.is_set():
+            try: job = self.claim()
+            except sqlite3.Error as e:
+                logger.error(f"OCR kuyruk hatası: {e}")
+                job = None
+            if job is None:
+                self.wakeup.wait(OCR_POLL_INTERVAL)
+                self.wakeup.clear()
+                continue
+            job_id, file_path, cache_key = job
+            try: result = self.processor(file_path, cache_key)
+            except Exception as e:
+                logger.error(f"OCR iş hatası ({job_id}): {e}")
+                result = {"error": "Belge işlenemedi.", "suggestion": "Lütfen tekrar deneyin."}
+            self.finish(job_id, result)
+
+ocr_queue = OCRJobQueue()
@@ -1,63 +1,486 @@
+import io
 import os
 import uuid
+import hashlib
 import logging
+import time
+import threading
+import subprocess
+import multiprocessing
+from contextlib import contextmanager
 import pytesseract
 import filetype
-from pdf2image import convert_from_path
-from PIL import Image, UnidentifiedImageError
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image, ImageOps, UnidentifiedImageError
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
+from cache_service import shared_cache
 
 logger = logging.getLogger(__name__)
 
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_MIME_TYPES = ['image/jpeg', 'image/png', 'image/heic', 'application/pdf']
 MAX_FILE_SIZE = 16 * 1024 * 1024  
+IN_MEMORY_MAX = int(os.getenv("OCR_IN_MEMORY_MAX", str(4 * 1024 * 1024)))  # Bu boyutun altındaki yüklemeler önbellek kontrolüne kadar diske yazılmaz
+
+# PDF OCR ayarları
+OCR_LANG = 'tur'
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))                    # Rasterizasyon çözünürlüğü
+OCR_PAGE_CHUNK = int(os.getenv("OCR_PAGE_CHUNK", "4"))        # Bir görevde en fazla kaç sayfa rasterize edilir (bellek sınırı)
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "30"))         # Belge başına OCR'lanacak en fazla sayfa
+OCR_TIME_BUDGET = float(os.getenv("OCR_TIME_BUDGET", "60"))   # Belge başına toplam OCR süresi (sn)
+# Havuz süreçleri çok thread'li gunicorn worker'ından fork edilmez (başka thread'in tuttuğu kilit çocukta kilitli kalır)
+OCR_POOL_START_METHOD = os.getenv("OCR_POOL_START_METHOD", "forkserver")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+
+# Gömülü metin katmanı kalite eşiği: bu eşiğin altındaki sayfalar OCR'a gönderilir
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "40"))
+TEXT_LAYER_MIN_ALNUM = float(os.getenv("TEXT_LAYER_MIN_ALNUM", "0.6"))
+
+# Telefon fotoğrafı ön işleme: EXIF yönü, gri ton, A4 varsayımıyla hedef DPI'ya küçültme, eşikleme ve eğim düzeltme
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") == "1"
+OCR_IMAGE_DPI = int(os.getenv("OCR_IMAGE_DPI", "300"))
+OCR_MAX_SKEW = float(os.getenv("OCR_MAX_SKEW", "5"))          # Aranacak en büyük eğim (derece)
+A4_LONG_SIDE_INCH = 11.69
+
+# Aynı belge tekrar yüklenince OCR atlanır (SHA-256 + OCR ayarları anahtarıyla); sonuçlar worker'lar arasında ortak
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+ocr_cache = shared_cache("ocr_result", maxsize=OCR_CACHE_SIZE)
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def is_file_safe(file_path):
+# ==========================================
+# KALICI TESSERACT MOTORU
+# ==========================================
+try:
+    import tesserocr  # İsteğe bağlı (libtesseract C API); yoksa her resimde tesseract süreci başlatan pytesseract kullanılır
+except ImportError:
+    tesserocr = None
+
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")  # auto | tesserocr | pytesseract
+
+class TesseractEngine:
+    """Dil modelini bir kez yükler, PIL resimlerini geçici dosya olmadan doğrudan OCR'lar. Thread-safe değildir."""
+    name = "tesserocr"
+
+    def __init__(self, lang=OCR_LANG):
+        if tesserocr is None: raise RuntimeError("tesserocr kurulu değil")
+        self.api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def image_to_string(self, image, timeout=None):
+        # C API çağrı başına zaman aşımı sunmaz; süre bütçesi sayfa aralarında uygulanır (ocr_pdf_pages)
+        self.api.SetImage(image)
+        try: return self.api.GetUTF8Text()
+        finally: self.api.Clear()
+
+class SubprocessEngine:
+    """Yedek motor: her çağrıda tesseract süreci başlatılır ve model yeniden yüklenir."""
+    name = "pytesseract"
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+
+    def image_to_string(self, image, timeout=None):
+        # Süre dolarsa pytesseract tesseract sürecini öldürür ve RuntimeError fırlatır
+        return pytesseract.image_to_string(image, lang=self.lang, timeout=timeout or 0)
+
+def create_engine(lang=OCR_LANG):
+    if OCR_ENGINE == "pytesseract" or (OCR_ENGINE == "auto" and tesserocr is None): return SubprocessEngine(lang)
     try:
-        kind = filetype.guess(file_path)
-        if kind is None: return False
-        if kind.mime not in ALLOWED_MIME_TYPES: return False
-        return True
+        return TesseractEngine(lang)
     except Exception as e:
-        logger.error(f"Dosya kontrol hatası: {e}")
-        return False
+        if OCR_ENGINE == "tesserocr": raise
+        logger.warning(f"tesserocr başlatılamadı, pytesseract kullanılacak: {e}")
+        return SubprocessEngine(lang)
 
-def extract_text_from_file(file_storage):
-    # Güvenli dosya adı oluştur
-    ext = os.path.splitext(file_storage.filename)[1].lower()
-    unique_filename = f"{uuid.uuid4()}{ext}"
-    file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-    
+def active_engine(lang=OCR_LANG):
+    """Bu süreçte gerçekten kullanılan motorun adı (auto modunda tesserocr'dan pytesseract'a düşüş dahil)."""
+    with borrow_engine(lang) as engine: return engine.name
+
+_engines = {}
+_engines_pid = None
+_engines_lock = threading.Lock()
+
+@contextmanager
+def borrow_engine(lang=OCR_LANG):
+    """Süreç içi motor havuzu: boşta motor varsa onu verir, yoksa yenisini açar; her motoru aynı anda tek thread kullanır."""
+    global _engines, _engines_pid
+    with _engines_lock:
+        if _engines_pid != os.getpid(): _engines, _engines_pid = {}, os.getpid()  # fork'tan devralınan motorlar kullanılmaz
+        idle = _engines.setdefault(lang, [])
+        engine = idle.pop() if idle else None
+    if engine is None: engine = create_engine(lang)
     try:
-        file_storage.save(file_path)
-        
-        # 1. Boyut Kontrolü
-        if os.path.getsize(file_path) > MAX_FILE_SIZE:
-            os.remove(file_path)
-            return {
-                "error": "Dosya çok büyük (Max 16MB).",
-                "suggestion": "Lütfen dosya boyutunu küçültüp tekrar deneyin veya PDF sayfalarını ayırın."
-            }
-            
-        # 2. Format/Güvenlik Kontrolü
-        if not is_file_safe(file_path):
-            os.remove(file_path)
-            return {
-                "error": "Geçersiz veya desteklenmeyen format.",
-                "suggestion": "Sadece JPG, PNG veya PDF formatında dosyalar yükleyiniz."
-            }
+        yield engine
+    finally:
+        with _engines_lock:
+            if _engines_pid == os.getpid(): _engines.setdefault(lang, []).append(engine)
+
+def run_ocr(image, lang=OCR_LANG, timeout=None):
+    """Dönüş: (metin, OCR süresi sn)."""
+    with borrow_engine(lang) as engine:
+        started = time.perf_counter()
+        text = engine.image_to_string(image, timeout)
+    return text, time.perf_counter() - started
+
+# ==========================================
+# SAYFA BAZLI PARALEL OCR (PROCESS POOL)
+# ==========================================
+_ocr_pool = None
+_ocr_pool_pid = None
+_ocr_pool_lock = threading.Lock()
+
+def _init_ocr_worker():
+    # Her süreç kendi çekirdeğini kullansın; tesseract'ın OpenMP thread'leri çekirdekleri aşırı paylaşmasın
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    # Dil modeli ilk sayfayı beklemeden, süreç açılırken yüklensin
+    try:
+        with borrow_engine(): pass
+    except Exception as e:
+        logger.warning(f"OCR motoru önceden yüklenemedi: {e}")
+
+def get_ocr_pool():
+    """Süreç başına tembel oluşturulan havuz (gunicorn fork'undan sonra yeniden kurulur)."""
+    global _ocr_pool, _ocr_pool_pid
+    with _ocr_pool_lock:
+        if _ocr_pool is None or _ocr_pool_pid != os.getpid():
+            _ocr_pool = ProcessPoolExecutor(max_workers=max(1, OCR_WORKERS), initializer=_init_ocr_worker,
+                                            mp_context=multiprocessing.get_context(OCR_POOL_START_METHOD))
+            _ocr_pool_pid = os.getpid()
+        return _ocr_pool
+
+def recycle_ocr_pool(pool):
+    """Süre bütçesini aşan belgenin işleri havuzda sürerken yeni istekler arkalarında beklemesin:
+    bekleyen işler iptal edilir, yeni istekler taze havuz alır; eski süreçler süre sınırına ulaşınca kapanır."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is pool: _ocr_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def ocr_pdf_pages(file_path, first_page, last_page, dpi=OCR_DPI, lang=OCR_LANG, deadline=None):
+    """Worker süreçte çalışır: sadece kendi sayfa aralığını rasterize edip OCR'lar.
+    deadline (time.time()) geçtiyse kalan sayfalar atlanır, rasterize ve tesseract kalan süreyle sınırlanır.
+    Dönüş: [(metin, süre sn), ...] (süre dolarsa kısmi)"""
+    remaining = lambda: None if deadline is None else deadline - time.time()
+    try:
+        pages = convert_from_path(file_path, dpi=dpi, first_page=first_page, last_page=last_page, timeout=remaining())
+    except Exception as e:
+        if deadline is None or remaining() > 0: raise
+        logger.warning(f"OCR süre sınırı: sayfa {first_page}-{last_page} rasterize edilemedi ({e})")
+        return []
+    results = []
+    for page in pages:
+        if deadline is not None and remaining() <= 0: break
+        try:
+            results.append(run_ocr(page, lang, timeout=remaining()))
+        except RuntimeError:
+            if deadline is None or remaining() > 0: raise
+            break
+    return results
+
+def page_chunks(pages, workers=None, chunk=None):
+    """Sayfaları (sayı ya da sayfa listesi) çekirdeklere yayılacak, ama OCR_PAGE_CHUNK'tan büyük olmayan ardışık aralıklara böler."""
+    pages = list(range(1, pages + 1)) if isinstance(pages, int) else sorted(pages)
+    workers = max(1, workers or OCR_WORKERS)
+    size = max(1, min(chunk or OCR_PAGE_CHUNK, -(-len(pages) // workers)))
+    chunks = []
+    for page in pages:
+        if chunks and page == chunks[-1][1] + 1 and page - chunks[-1][0] < size:
+            chunks[-1] = (chunks[-1][0], page)
+        else:
+            chunks.append((page, page))
+    return chunks
+
+# ==========================================
+# GÖRÜNTÜ ÖN İŞLEME
+# ==========================================
+def target_size(size, dpi=None):
+    """Uzun kenarı A4 @ hedef DPI'ya sığacak boyut; resim zaten küçükse aynen döner."""
+    max_side = int((dpi or OCR_IMAGE_DPI) * A4_LONG_SIDE_INCH)
+    scale = max_side / max(size)
+    if scale >= 1: return size
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+def otsu_threshold(gray):
+    """Gri ton histogramında sınıflar arası varyansı en büyük yapan eşik."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * np.arange(256))
+    total_w, total_mean = weight[-1], mean[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (total_mean * weight - mean * total_w) ** 2 / (weight * (total_w - weight))
+    if np.all(np.isnan(between)): return 127  # tek renkli resim
+    return int(np.nanargmax(between))
+
+def estimate_skew(binary, max_angle=None, step=0.5):
+    """Projeksiyon profili: metin satırları yatayken ardışık satır toplamları arasındaki farklar en keskin olur.
+    Fotoğraf kenarındaki koyu zemin sonucu bozmasın diye orta bölgenin küçültülmüş kopyası kullanılır.
+    Dönüş: düzeltme açısı (derece)."""
+    max_angle = OCR_MAX_SKEW if max_angle is None else max_angle
+    if max_angle <= 0: return 0.0
+    w, h = binary.size
+    small = binary.crop((w // 10, h // 10, w - w // 10, h - h // 10))
+    small.thumbnail((800, 800))
+    ink = ImageOps.invert(small.convert("L"))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rows = np.asarray(ink.rotate(float(angle), resample=Image.NEAREST), dtype=np.float64).sum(axis=1)
+        score = float(np.sum(np.diff(rows) ** 2))
+        if score > best_score: best_angle, best_score = float(angle), score
+    return best_angle
+
+def preprocess_image(image, dpi=None):
+    """EXIF yönü -> gri ton -> küçültme -> Otsu eşikleme -> eğim düzeltme. Tesseract'a siyah-beyaz sayfa verir."""
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L")
+    size = target_size(image.size, dpi)
+    if size != image.size: image = image.resize(size, Image.LANCZOS)
+    gray = np.asarray(image)
+    binary = Image.fromarray(np.where(gray > otsu_threshold(gray), 255, 0).astype(np.uint8))
+    angle = estimate_skew(binary)
+    if angle: binary = binary.rotate(angle, resample=Image.NEAREST, expand=True, fillcolor=255)
+    return binary
+
+def load_image(source, preprocess=None):
+    """Dosya yolu ya da bytes akışından resmi açar. JPEG'lerde draft ile DCT seviyesinde küçültülmüş, gri ton çözümleme yapılır."""
+    preprocess = OCR_PREPROCESS if preprocess is None else preprocess
+    image = Image.open(source)
+    if not preprocess: return image
+    if image.format == "JPEG": image.draft("L", target_size(image.size))
+    return preprocess_image(image)
+
+def ocr_image(source, lang=OCR_LANG):
+    """Dönüş: (metin, OCR süresi sn); ön işleme süresi dahil değildir."""
+    return run_ocr(load_image(source), lang)
+
+# ==========================================
+# GÖMÜLÜ METİN KATMANI (pdftotext)
+# ==========================================
+def extract_text_layer(file_path, last_page):
+    """poppler pdftotext ile sayfa sayfa metin katmanı; sayfalar form feed (\\f) ile ayrılır."""
+    try:
+        out = subprocess.run(["pdftotext", "-layout", "-enc", "UTF-8", "-l", str(last_page), file_path, "-"],
+                             capture_output=True, timeout=30, check=True).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"pdftotext çalışmadı, tüm sayfalar OCR'lanacak: {e}")
+        return []
+    return out.decode("utf-8", errors="replace").split("\f")[:last_page]
 
+def text_layer_ok(text):
+    """Metin katmanı yeterince uzun ve çoğunlukla harf/rakam ise OCR'a gerek yoktur."""
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < TEXT_LAYER_MIN_CHARS: return False
+    return sum(c.isalnum() for c in chars) / len(chars) >= TEXT_LAYER_MIN_ALNUM
+
+def extract_pdf_text(file_path):
+    """Önce gömülü metin katmanını okur; sadece katmanı boş/zayıf sayfaları paralel OCR'lar (sayfa sırası korunur).
+    Sayfa sınırı veya süre bütçesi aşılırsa kısmi metin ve uyarı döner.
+    Dönüş: (metin, uyarı, OCR'lanan sayfalar, {sayfa: OCR süresi sn})"""
+    total_pages = pdfinfo_from_path(file_path)["Pages"]
+    page_count = min(total_pages, OCR_MAX_PAGES)
+    layer = extract_text_layer(file_path, page_count)
+    page_texts = {p: layer[p - 1] for p in range(1, page_count + 1) if p <= len(layer) and text_layer_ok(layer[p - 1])}
+    ocr_pages = [p for p in range(1, page_count + 1) if p not in page_texts]
+
+    timed_out, timings = False, {}
+    if ocr_pages:
+        pool = get_ocr_pool()
+        deadline = time.time() + OCR_TIME_BUDGET
+        futures = {pool.submit(ocr_pdf_pages, file_path, first, last, deadline=deadline): first for first, last in page_chunks(ocr_pages)}
+        try:
+            for future in as_completed(futures, timeout=OCR_TIME_BUDGET):
+                for offset, (text, seconds) in enumerate(future.result()):
+                    page_texts[futures[future] + offset] = text
+                    timings[futures[future] + offset] = seconds
+        except FuturesTimeout:
+            recycle_ocr_pool(pool)
+        # Worker'lar süre dolunca kısmi sonuç döndürebilir
+        timed_out = any(p not in page_texts for p in ocr_pages)
+
+    warning = None
+    if timed_out: warning = f"Süre sınırı nedeniyle belgenin yalnızca {len(page_texts)} sayfası okunabildi."
+    elif total_pages > page_count: warning = f"Belgenin yalnızca ilk {page_count} sayfası okundu ({total_pages} sayfa)."
+    return "\n".join(page_texts[p] for p in sorted(page_texts)), warning, ocr_pages, timings
+
+SYSTEM_ERROR = {
+    "error": "Sistem hatası oluştu.",
+    "suggestion": "Lütfen daha sonra tekrar deneyiniz veya teknik destek ile iletişime geçiniz."
+}
+TOO_LARGE_ERROR = {
+    "error": "Dosya çok büyük (Max 16MB).",
+    "suggestion": "Lütfen dosya boyutunu küçültüp tekrar deneyin veya PDF sayfalarını ayırın."
+}
+INVALID_FORMAT_ERROR = {
+    "error": "Geçersiz veya desteklenmeyen format.",
+    "suggestion": "Sadece JPG, PNG veya PDF formatında dosyalar yükleyiniz."
+}
+
+def sniff_type(head):
+    """İlk baytlardan (magic bytes) dosya türünü bulur; izin verilmeyen türlerde None döner."""
+    kind = filetype.guess(head)
+    if kind is None or kind.mime not in ALLOWED_MIME_TYPES: return None
+    return kind
+
+def ocr_cache_key(digest):
+    """Aynı dosya farklı OCR ayarlarıyla farklı metin verebileceği için ayarlar da anahtara girer."""
+    return (f"{digest}:{OCR_LANG}:{OCR_DPI}:{OCR_MAX_PAGES}:{TEXT_LAYER_MIN_CHARS}:{TEXT_LAYER_MIN_ALNUM}:"
+            f"{int(OCR_PREPROCESS)}:{OCR_IMAGE_DPI}:{OCR_MAX_SKEW}")
+
+class UploadSpool:
+    """Form ayrıştırıcısının dosya kabı: gövde ağdan geldikçe yazılır. İlk SNIFF_BYTES'ta magic byte kontrolü yapılır
+    (izin verilmeyen tür diske hiç yazılmaz, kalan gövde atılır), boyut sayılır ve SHA-256 akışla hesaplanır.
+    IN_MEMORY_MAX'a kadar bellekte tutulur, aşınca UPLOAD_FOLDER'a yazmaya devam eder.
+    Dosyayı kuyruğa devralan keep() çağırmadıysa close() onu siler (werkzeug istek sonunda dosyaları kapatır)."""
+    SNIFF_BYTES = 8192  # filetype en fazla bu kadarına bakar
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.file_path = None
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.kind = None
+        self.rejected = False
+        self.kept = False
+
+    def write(self, data):
+        if self.rejected: return len(data)
+        self.size += len(data)
+        if self.size > MAX_FILE_SIZE:
+            self.discard()
+            raise RequestEntityTooLarge()
+        self.hasher.update(data)
+        if self.kind is None:
+            self.head += data[:self.SNIFF_BYTES]
+            if len(self.head) >= self.SNIFF_BYTES and not self.sniff(): return len(data)
+        if self.file_path is None and self.kind is not None and self.size > IN_MEMORY_MAX:
+            # Bellek sınırı aşıldı: o ana kadar okunanları diske yazıp akıtmaya devam et
+            self.file_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}.{self.kind.extension}")
+            memory, self.buffer = self.buffer, open(self.file_path, "w+b")
+            self.buffer.write(memory.getbuffer())
+        return self.buffer.write(data)
+
+    def sniff(self):
+        self.kind = sniff_type(self.head)
+        if self.kind is None: self.discard()
+        return self.kind is not None
+
+    def discard(self):
+        self.rejected = True
+        self.close()
+        self.buffer = io.BytesIO()  # ayrıştırıcı parça sonunda seek(0) çağırır
+
+    def finish(self):
+        """Gövde bittiğinde (kısa dosyalar SNIFF_BYTES'a ulaşmadan biter) tür kontrolünü tamamlar."""
+        if self.kind is None and not self.rejected: self.sniff()
+        return not self.rejected
+
+    def keep(self):
+        self.kept = True
+        self.buffer.close()
+        return self.file_path
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+    def seek(self, *args): return self.buffer.seek(*args)
+    def tell(self): return self.buffer.tell()
+    def read(self, *args): return self.buffer.read(*args)
+    def readline(self, *args): return self.buffer.readline(*args)
+
+    def close(self):
+        self.buffer.close()
+        if self.file_path and not self.kept and os.path.exists(self.file_path): os.remove(self.file_path)
+
+class UploadRequest(Request):
+    """Dosya parçalarını werkzeug'un varsayılan geçici dosyası yerine UploadSpool'a yazar:
+    tür ve boyut kontrolü gövde tamamen diske inmeden, ağdan geldikçe yapılır."""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadSpool()
+
+def receive_upload(file_storage):
+    """UploadRequest ile ayrıştırılmış yüklemeyi (ya da herhangi bir akışı parça parça UploadSpool'a kopyalayarak) alır.
+    IN_MEMORY_MAX altındaki dosyalar (PDF dahil) bellekte kalır, önbellekte varsa diske hiç yazılmaz.
+    Dönüş: {"result": ...} (önbellek), {"data"|"path": ..., "cache_key": ...} (OCR gerekli) veya hata dict."""
+    spool = file_storage.stream
+    try:
+        if not isinstance(spool, UploadSpool):
+            source, spool = spool, UploadSpool()
+            while not spool.rejected:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk: break
+                spool.write(chunk)
+    except RequestEntityTooLarge:
+        return dict(TOO_LARGE_ERROR)
+    except Exception as e:
+        spool.close()
+        logger.error(f"Dosya Kaydetme Hatası: {e}")
+        return dict(SYSTEM_ERROR)
+    if not spool.finish(): return dict(INVALID_FORMAT_ERROR)
+
+    cache_key = ocr_cache_key(spool.hasher.hexdigest())
+    cached = ocr_cache.get(cache_key)
+    if cached is not None:
+        spool.close()
+        return {"result": dict(cached, cached=True), "cache_key": cache_key}
+    if spool.file_path: return {"path": spool.keep(), "cache_key": cache_key}
+    data = spool.getvalue()
+    spool.close()
+    return {"data": data, "ext": spool.kind.extension, "cache_key": cache_key}
+
+def spool_upload(upload):
+    """Bellekteki yüklemeyi diske yazar (kalıcı iş kuyruğu dosya yolu ister). Dönüş: dosya yolu."""
+    if "path" in upload: return upload["path"]
+    file_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}.{upload['ext']}")
+    with open(file_path, "wb") as f: f.write(upload["data"])
+    return file_path
+
+def build_result(text_result, warning=None, ocr_pages=None, cache_key=None, timings=None):
+    # 4. Boş Metin Kontrolü
+    if not text_result.strip():
+        return {
+            "error": "Belgeden okunabilir bir metin çıkarılamadı.",
+            "suggestion": "Resim çok bulanık, karanlık veya el yazısı içeriyor olabilir. Lütfen daha net bir fotoğraf yükleyin veya metni elle yazın."
+        }
+
+    result = {"text": text_result.strip()}
+    if warning: result["warning"] = warning
+    if ocr_pages is not None: result["ocr_pages"] = ocr_pages
+    if timings:
+        # Sayfa başına OCR süresi (JSON anahtarları string olur)
+        result["ocr_timings"] = {str(page): round(seconds, 3) for page, seconds in sorted(timings.items())}
+        logger.info(f"OCR ({OCR_ENGINE}): {len(timings)} sayfa, toplam {sum(timings.values()):.2f} sn")
+    # Süre bütçesine takılmış (uyarılı) kısmi sonuçlar önbelleğe alınmaz
+    if cache_key and not warning: ocr_cache.set(cache_key, result)
+    return result
+
+def extract_text_from_bytes(data, cache_key=None):
+    """Bellekteki küçük resmi geçici dosya oluşturmadan OCR'lar."""
+    try:
+        text_result, seconds = ocr_image(io.BytesIO(data))
+    except UnidentifiedImageError:
+        return {"error": "Görüntü dosyası bozuk.", "suggestion": "Farklı bir formatta (JPG/PNG) tekrar deneyin."}
+    except Exception as e:
+        logger.error(f"Kritik OCR Hatası: {e}")
+        return dict(SYSTEM_ERROR)
+    return build_result(text_result, cache_key=cache_key, timings={1: seconds})
+
+def extract_text_from_path(file_path, cache_key=None):
+    """Kaydedilmiş ve doğrulanmış dosyayı OCR'lar; iş bitince dosyayı siler. Başarılı sonuç önbelleğe yazılır."""
+    try:
         text_result = ""
+        warning = None
+        ocr_pages = None
+        timings = None
         
         # 3. OCR İşlemi
         if file_path.endswith('.pdf'):
             try:
-                pages = convert_from_path(file_path)
-                for page in pages:
-                    text_result += pytesseract.image_to_string(page, lang='tur') + "\n"
+                text_result, warning, ocr_pages, timings = extract_pdf_text(file_path)
             except Exception as e:
                 logger.error(f"PDF Okuma Hatası: {e}")
                 # PDF bozuksa bile devam etme, hata dön
@@ -65,28 +488,26 @@ def extract_text_from_file(file_storage):
                 return {"error": "PDF dosyası okunamadı.", "suggestion": "Dosya şifreli veya bozuk olabilir. Ekran görüntüsü alıp yüklemeyi deneyin."}
         else:
             try:
-                text_result = pytesseract.image_to_string(Image.open(file_path), lang='tur')
+                text_result, seconds = ocr_image(file_path)
+                timings = {1: seconds}
             except UnidentifiedImageError:
                 if os.path.exists(file_path): os.remove(file_path)
                 return {"error": "Görüntü dosyası bozuk.", "suggestion": "Farklı bir formatta (JPG/PNG) tekrar deneyin."}
 
         # Temizlik
         if os.path.exists(file_path): os.remove(file_path)
-        
-        # 4. Boş Metin Kontrolü
-        if not text_result.strip():
-            return {
-                "error": "Belgeden okunabilir bir metin çıkarılamadı.",
-                "suggestion": "Resim çok bulanık, karanlık veya el yazısı içeriyor olabilir. Lütfen daha net bir fotoğraf yükleyin veya metni elle yazın."
-            }
-
-        return {"text": text_result.strip()}
+        return build_result(text_result, warning, ocr_pages, cache_key, timings)
 
     except Exception as e:
         # Beklenmeyen genel hata
         if os.path.exists(file_path): os.remove(file_path)
         logger.error(f"Kritik OCR Hatası: {e}")
-        return {
-            "error": "Sistem hatası oluştu.",
-            "suggestion": "Lütfen daha sonra tekrar deneyiniz veya teknik destek ile iletişime geçiniz."
-        }
\ No newline at end of file
+        return dict(SYSTEM_ERROR)
+
+def extract_text_from_file(file_storage):
+    upload = receive_upload(file_storage)
+    if "error" in upload: return upload
+    if "result" in upload: return upload["result"]
+    # PDF sayfaları havuz süreçlerinde dosya yolundan okunur; yalnızca resimler bellekten OCR'lanır
+    if "data" in upload and upload["ext"] != "pdf": return extract_text_from_bytes(upload["data"], upload["cache_key"])
+    return extract_text_from_path(spool_upload(upload), upload["cache_key"])
@@ -0,0 +1,152 @@
+import os
+import glob
+import queue
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from playwright.sync_api import sync_playwright
+
+logger = logging.getLogger(__name__)
+
+PDF_POOL_SIZE = int(os.getenv("PDF_POOL_SIZE", "2"))              # Aynı anda render eden tarayıcı sayısı
+PDF_QUEUE_SIZE = int(os.getenv("PDF_QUEUE_SIZE", "16"))           # Sırada bekleyebilecek en fazla istek
+PDF_QUEUE_TIMEOUT = float(os.getenv("PDF_QUEUE_TIMEOUT", "30"))   # Sıraya girmek + sonucu beklemek için süre (sn)
+PDF_MAX_RENDERS = int(os.getenv("PDF_MAX_RENDERS", "200"))        # Bu kadar render sonrası tarayıcı yenilenir (bellek)
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "pdf_cache")
+PDF_OPTIONS = {"format": "A4", "margin": {"top": "2.5cm", "right": "2.5cm", "bottom": "2.5cm", "left": "2.5cm"}}
+
+class PDFRenderError(Exception):
+    """PDF üretilemedi (kuyruk dolu, zaman aşımı veya tarayıcı hatası)."""
+
+# ==========================================
+# SICAK CHROMIUM HAVUZU
+# ==========================================
+def launch_chromium():
+    playwright = sync_playwright().start()
+    return playwright, playwright.chromium.launch(headless=True)
+
+class _BrowserWorker(threading.Thread):
+    """Kendi Playwright örneğine ve tek bir açık sayfaya sahip thread.
+    Playwright sync API thread'e bağlı olduğu için tarayıcı sadece bu thread'den kullanılır."""
+    def __init__(self, pool, index):
+        super().__init__(daemon=True, name=f"pdf-browser-{index}")
+        self.pool = pool
+        self.playwright = None
+        self.browser = None
+        self.page = None
+        self.renders = 0
+        self.launches = 0
+
+    def run(self):
+        while True:
+            job = self.pool.jobs.get()
+            if job is None: break
+            html, future = job
+            if not future.set_running_or_notify_cancel(): continue
+            try: future.set_result(self.render(html))
+            except Exception as e: future.set_exception(e)
+        self.shutdown()
+
+    def healthy(self):
+        try: return self.browser is not None and self.browser.is_connected() and not self.page.is_closed()
+        except Exception: return False
+
+    def launch(self):
+        self.shutdown()
+        self.playwright, self.browser = self.pool.launcher()
+        self.page = self.browser.new_page()
+        self.renders = 0
+        self.launches += 1
+
+    def shutdown(self):
+        for closer in (lambda: self.browser and self.browser.close(), lambda: self.playwright and self.playwright.stop()):
+            try: closer()
+            except Exception: pass
+        self.playwright = self.browser = self.page = None
+
+    def render(self, html):
+        # Sağlık kontrolü + yenileme politikası; çöken tarayıcıda bir kez yeniden başlatıp tekrar denenir
+        if not self.healthy() or self.renders >= self.pool.max_renders: self.launch()
+        for attempt in range(2):
+            try:
+                self.page.set_content(html)
+                pdf = self.page.pdf(**PDF_OPTIONS)
+                self.renders += 1
+                return pdf
+            except Exception as e:
+                logger.error(f"PDF tarayıcı hatası (deneme {attempt + 1}): {e}")
+                if attempt: raise PDFRenderError(str(e))
+                self.launch()
+
+class BrowserPool:
+    """Worker başına uzun ömürlü Chromium havuzu. Eşzamanlı indirmeler sınırlı kuyrukta bekler."""
+    def __init__(self, size=PDF_POOL_SIZE, queue_size=PDF_QUEUE_SIZE, max_renders=PDF_MAX_RENDERS, timeout=PDF_QUEUE_TIMEOUT,
+                 launcher=launch_chromium):
+        self.size = size
+        self.launcher = launcher  # () -> (playwright, browser); testlerde sahte tarayıcı verilebilir
+        self.max_renders = max_renders
+        self.timeout = timeout
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.workers = []
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        # gunicorn fork'undan sonra thread'ler kopyalanmaz; süreç değiştiyse havuz yeniden kurulur
+        with self.lock:
+            if self.pid == os.getpid() and all(w.is_alive() for w in self.workers): return
+            self.jobs = queue.Queue(maxsize=self.jobs.maxsize)
+            self.workers = [_BrowserWorker(self, i) for i in range(self.size)]
+            for w in self.workers: w.start()
+            self.pid = os.getpid()
+
+    def render(self, html):
+        self.start()
+        future = Future()
+        try: self.jobs.put((html, future), timeout=self.timeout)
+        except queue.Full: raise PDFRenderError("PDF kuyruğu dolu.")
+        try: return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PDFRenderError("PDF üretimi zaman aşımına uğradı.")
+
+    def stop(self):
+        with self.lock:
+            for _ in self.workers: self.jobs.put(None)
+            for w in self.workers: w.join(timeout=10)
+            self.workers, self.pid = [], None
+
+    def stats(self):
+        return {"size": self.size, "queued": self.jobs.qsize(),
+                "renders": sum(w.renders for w in self.workers), "launches": sum(w.launches for w in self.workers)}
+
+browser_pool = BrowserPool()
+
+def html_to_pdf(html_content):
+    return browser_pool.render(html_content)
+
+# ==========================================
+# RENDER EDİLMİŞ PDF ÖNBELLEĞİ (DİSK)
+# ==========================================
+def html_etag(html):
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()[:32]
+
+def cached_pdf(petition_id, html, cache_dir=None):
+    """Dilekçe id + HTML hash'i ile diskteki PDF yolunu döner; yoksa render edip yazar.
+    İçerik ya da imza tarihi değişince hash değişir, aynı dilekçenin eski dosyaları silinir."""
+    cache_dir = cache_dir or PDF_CACHE_DIR
+    etag = html_etag(html)
+    path = os.path.join(cache_dir, f"{int(petition_id)}-{etag}.pdf")
+    if os.path.exists(path): return path, etag
+
+    os.makedirs(cache_dir, exist_ok=True)
+    pdf = html_to_pdf(html)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f: f.write(pdf)
+    os.replace(tmp_path, path)
+    for old in glob.glob(os.path.join(cache_dir, f"{int(petition_id)}-*.pdf")):
+        if old != path:
+            try: os.remove(old)
+            except OSError: pass
+    return path, etag
@@ -1,7 +1,18 @@
+import os
 import unittest
 import time
+import shutil
+import tempfile
+import zlib
 from datetime import datetime, timedelta
-from logic_services import check_rules, search_legal_docs, vector_db
+# Testler birbirinden ve önceki çalıştırmalardan bağımsız olsun: önbellekler süreç içi (ortak depo test 31'de ayrıca denenir)
+os.environ.setdefault("SHARED_STATE_URL", "memory://")
+# Rota testleri app.py'yi içe aktarır: uygulama veritabanı ve LLM önbelleği çalışma dizini yerine geçici dizinde kurulur
+APP_TEST_DIR = tempfile.mkdtemp(prefix="hukuk_test_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{APP_TEST_DIR}/app.db")
+os.environ.setdefault("LLM_CACHE_PATH", f"{APP_TEST_DIR}/llm_cache.db")
+from logic_services import check_rules, search_legal_docs, vector_db, VectorDatabase, tokenize_tr, RuleEngine, AhoCorasick, chunk_document, assemble_context, estimate_tokens
+from benchmarks.stub_llm_server import StubLLMServer
 
 class TestHukukAI(unittest.TestCase):
 
@@ -68,6 +79,950 @@ class TestHukukAI(unittest.TestCase):
         self.assertGreaterEqual(doc_count, 10, f"Veritabanı eksik yüklendi! ({doc_count})")
         print("✅ BAŞARILI")
 
+def local_embedding(text, dim=64):
+    """Offline testler için basit kelime-hash embedding'i."""
+    vec = [0.0] * dim
+    for word in text.lower().split():
+        vec[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    return vec
+
+class TestPerformans(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        # Arka plan thread'leri silinen geçici veritabanını yoklamaya devam etmesin
+        if getattr(self, "queue", None): self.queue.stop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def app_client(self):
+        """app.py'yi içe aktarır; yeni kullanıcıyla giriş yapmış test istemcisi döner (hız sınırı test boyunca kapalı)."""
+        import uuid
+        import app as web
+        web.limiter.enabled = False
+        self.addCleanup(setattr, web.limiter, "enabled", True)
+        client = web.app.test_client()
+        username = f"test_{uuid.uuid4().hex[:8]}"
+        client.post("/register", data={"username": username, "password": "p12345678"})
+        client.post("/login", data={"username": username, "password": "p12345678"})
+        return web, client, username
+
+    def test_07_embedding_deposu_tekrar_kullanim(self):
+        """SENARYO: İkinci açılışta sadece değişen doküman parçası yeniden embed edilmeli."""
+        print("\n[TEST 7] Kalıcı Embedding Deposu")
+        docs_path = f"{self.tmp_dir}/mevzuat.txt"
+        shutil.copy("legal_docs/mevzuat.txt", docs_path)
+        calls = []
+        def embed(text):
+            calls.append(text)
+            return local_embedding(text)
+
+        db1 = VectorDatabase(docs_path, embed_fn=embed, embed_model="local", store_dir=f"{self.tmp_dir}/store")
+        self.assertEqual(len(calls), len(db1.chunks))
+
+        calls.clear()
+        VectorDatabase(docs_path, embed_fn=embed, embed_model="local", store_dir=f"{self.tmp_dir}/store")
+        self.assertEqual(len(calls), 0)
+
+        with open(docs_path, "a", encoding="utf-8") as f:
+            f.write("\nid: yeni_madde\nkategori: kira\nbaslik: TEST\nicerik: Yeni eklenen deneme maddesi.\n")
+        db3 = VectorDatabase(docs_path, embed_fn=embed, embed_model="local", store_dir=f"{self.tmp_dir}/store")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(db3.search("deneme maddesi", "kira")[0]["id"], "yeni_madde")
+        print("✅ BAŞARILI")
+
+    def test_08_vektorel_arama_kategori_dilimi(self):
+        """SENARYO: Matris araması kategori dilimine uymalı ve top-k sıralı dönmeli."""
+        print("\n[TEST 8] Vektörel Top-K Arama")
+        db = VectorDatabase("legal_docs/mevzuat.txt", embed_fn=local_embedding, embed_model="local", store_dir=f"{self.tmp_dir}/store")
+        query = "kiracı tahliye kira bedeli"
+        results = db.search(query, "kira", top_k=2)
+        self.assertLessEqual(len(results), 2)
+        self.assertTrue(all(d["kategori"] == "kira" for d in results))
+        full = db.search(query, "kira")
+        self.assertEqual([d["id"] for d in results], [d["id"] for d in full[:2]])
+        self.assertEqual(db.search(query, "olmayan_kategori"), [])
+        print("✅ BAŞARILI")
+
+    def test_09_bm25_turkce_normalizasyon(self):
+        """SENARYO: Büyük İ/I ve çekim ekleri aynı köke inmeli, BM25 sadece ilgili postingleri skorlamalı."""
+        print("\n[TEST 9] BM25 Ters İndeks")
+        self.assertEqual(tokenize_tr("KİRACI"), tokenize_tr("kiracının"))
+        db = VectorDatabase("legal_docs/mevzuat.txt", store_dir=f"{self.tmp_dir}/store")
+        db.embed_fn = None
+        results = db.search("Cayma hakkı kaç gün?", "tuketici_haklari", top_k=1)
+        self.assertEqual(results[0]["id"], "tuketici_cayma_hakki")
+        self.assertEqual(db.search("zzzz qqqq"), [])
+        print("✅ BAŞARILI")
+
+    def test_10_toplu_embedding_stub_sunucu(self):
+        """SENARYO: Korpus tek istekte değil batch'lerle embed edilmeli, 429 sonrası tekrar denenmeli."""
+        print("\n[TEST 10] Toplu Embedding (Stub Sunucu)")
+        from openai import OpenAI
+        from benchmarks.stub_embedding_server import StubEmbeddingServer
+        with StubEmbeddingServer(fail_first=1) as stub:
+            client = OpenAI(api_key="stub", base_url=stub.base_url, max_retries=0)
+            db = VectorDatabase("legal_docs/mevzuat.txt", client=client, store_dir=f"{self.tmp_dir}/store")
+        stats = db.ingest_stats
+        self.assertEqual(stats["embedded"], len(db.chunks))
+        self.assertEqual(stats["retries"], 1)
+        self.assertLess(stub.requests, len(db.chunks))
+        # Arama matrisi depodaki mmap'in kendisi olmalı (worker başına kopya yok)
+        import numpy as np
+        self.assertIsInstance(db.matrix, np.memmap)
+        self.assertEqual(len(db.matrix_docs), len(db.chunks))
+        print("✅ BAŞARILI")
+
+    def test_11_sorgu_embedding_onbellegi(self):
+        """SENARYO: Aynı/benzer şikayet tekrar gönderilince embedding isteği atlanmalı."""
+        print("\n[TEST 11] Sorgu Embedding LRU+TTL Önbelleği")
+        from cache_service import LRUCache
+        from logic_services import query_embedding_cache
+        calls = []
+        def embed(text):
+            calls.append(text)
+            return local_embedding(text)
+        db = VectorDatabase("legal_docs/mevzuat.txt", embed_fn=embed, embed_model="local-cache-test", store_dir=f"{self.tmp_dir}/store")
+        calls.clear()
+        db.search("Kiracı evden ÇIKMIYOR, tahliye!", "kira")
+        db.search("kiracı  evden çıkmıyor tahliye", "kira")
+        self.assertEqual(len(calls), 1)
+        self.assertGreaterEqual(query_embedding_cache.hits, 1)
+
+        cache = LRUCache(maxsize=2, ttl=0.05)
+        cache.set("a", 1); cache.set("b", 2); cache.set("c", 3)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.evictions, 1)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.expirations, 1)
+        print("✅ BAŞARILI")
+
+    def test_12_llm_yanit_onbellegi(self):
+        """SENARYO: Kanonik olarak aynı prompt önbellekten dönmeli, kapasite aşılınca en eski kayıt silinmeli."""
+        print("\n[TEST 12] LLM Yanıt Önbelleği")
+        from cache_service import LLMResponseCache
+        cache = LLMResponseCache(f"{self.tmp_dir}/llm.db", max_entries=2)
+        key = cache.make_key("gpt-4o-mini", 0.1, "KULLANICI: ayıplı  telefon\r\nOCR: ")
+        self.assertEqual(key, cache.make_key("gpt-4o-mini", 0.1, "KULLANICI: ayıplı telefon\nOCR:"))
+        self.assertNotEqual(key, cache.make_key("gpt-4o-mini", 0.7, "KULLANICI: ayıplı telefon\nOCR:"))
+
+        cache.set(key, {"status": "DILEKCE_HAZIR", "usage": {"total_tokens": 500}}, tokens=500, duration=4.2)
+        response, tokens, duration = cache.get(key)
+        self.assertEqual(response, {"status": "DILEKCE_HAZIR"})
+        self.assertEqual((tokens, duration), (500, 4.2))
+
+        time.sleep(0.01); cache.set("k2", {"status": "SORGU"})
+        time.sleep(0.01); cache.set("k3", {"status": "SORGU"})
+        self.assertIsNone(cache.get(key))
+        print("✅ BAŞARILI")
+
+    def test_13_llm_istemcisi_retry_ve_devre_kesici(self):
+        """SENARYO: 5xx sonrası tekrar denenmeli, bağlantı yeniden kullanılmalı; sürekli hata devreyi açmalı."""
+        print("\n[TEST 13] LLM İstemcisi (Keep-Alive + Retry + Circuit Breaker)")
+        from llm_service import LLMClient, CircuitBreaker, CircuitOpenError, LLMUnavailable
+        payload = {"model": "gpt-4o-mini", "messages": []}
+        with StubLLMServer(statuses=[503], retry_after=0) as stub:
+            client = LLMClient("stub", base_url=stub.base_url, max_retries=2)
+            self.assertEqual(client.chat(payload).status_code, 200)
+            client.chat(payload)
+            self.assertEqual(stub.requests, 3)
+            self.assertEqual(len(stub.connections), 1)
+
+        with StubLLMServer(statuses=[500] * 10, retry_after=0) as stub:
+            client = LLMClient("stub", base_url=stub.base_url, max_retries=0, breaker=CircuitBreaker(threshold=2, reset_timeout=60))
+            for _ in range(2):
+                with self.assertRaises(LLMUnavailable): client.chat(payload)
+            with self.assertRaises(CircuitOpenError): client.chat(payload)
+            self.assertEqual(stub.requests, 2)
+
+        # Half-open denemesinde beklenmeyen requests hatası deneme bayrağını takılı bırakmamalı
+        import requests
+        from unittest import mock
+        session = mock.Mock()
+        session.post.side_effect = requests.exceptions.ChunkedEncodingError("kopuk gövde")
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+        client = LLMClient("stub", max_retries=0, breaker=breaker, session=session)
+        for _ in range(3):
+            with self.assertRaises(LLMUnavailable): client.chat(payload)
+        self.assertFalse(breaker.half_open_probe)
+        self.assertEqual(session.post.call_count, 3)
+
+        # Toplam süre sınırı: denemelerin zaman aşımı kalan süreye kısaltılır, sınır dolunca yeni deneme yapılmaz
+        def slow_post(*args, timeout=None, **kwargs):
+            time.sleep(min(timeout[0], 0.2))
+            raise requests.ConnectTimeout("bağlantı zaman aşımı")
+        session = mock.Mock(post=mock.Mock(side_effect=slow_post))
+        client = LLMClient("stub", max_retries=10, connect_timeout=0.2, session=session, deadline=0.5)
+        start = time.monotonic()
+        with self.assertRaises(LLMUnavailable): client.chat(payload)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertLessEqual(max(call.kwargs["timeout"][1] for call in session.post.call_args_list), 0.5)
+
+        # Okuma zaman aşımı: completion tekrar gönderilmez (tokenlar iki kez faturalanmaz), devre hata saymaz
+        session = mock.Mock(post=mock.Mock(side_effect=requests.ReadTimeout("okuma zaman aşımı")))
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        client = LLMClient("stub", max_retries=3, session=session, breaker=breaker)
+        with self.assertRaises(LLMUnavailable): client.chat(payload)
+        self.assertEqual(session.post.call_count, 1)
+        self.assertEqual((breaker.failures, breaker.half_open_probe), (1, False))
+        self.assertEqual(client.timeout[1], LLMClient("stub").deadline)
+        print("✅ BAŞARILI")
+
+    def test_14_akisli_json_alan_cozumleyici(self):
+        """SENARYO: Parça parça gelen JSON'dan dilekçe metni, kaçış dizileri bölünse bile doğru çözülmeli."""
+        print("\n[TEST 14] Akışlı Dilekçe Metni (SSE)")
+        import json
+        import requests
+        from llm_service import JsonFieldStreamer, iter_chat_stream
+        raw = json.dumps({"status": "DILEKCE_HAZIR", "dilekce_metni": "KONU: İade\n\"Ayıplı\" mal 😀", "hukuki_oneriler": "x"})
+        field = JsonFieldStreamer("dilekce_metni")
+        text = "".join(field.feed(raw[i:i + 3]) for i in range(0, len(raw), 3))
+        self.assertEqual(text, "KONU: İade\n\"Ayıplı\" mal 😀")
+
+        with StubLLMServer() as stub:
+            r = requests.post(f"{stub.base_url}/chat/completions", json={"stream": True}, stream=True)
+            content = "".join(delta for delta, _ in iter_chat_stream(r))
+        self.assertEqual(json.loads(content)["status"], "DILEKCE_HAZIR")
+        self.assertIn("Ayıplı", json.loads(content)["dilekce_metni"])
+        print("✅ BAŞARILI")
+
+    def test_15_pdf_tarayici_havuzu(self):
+        """SENARYO: Tarayıcı her indirmede yeniden başlatılmamalı; limit dolunca ve çökünce yenilenmeli."""
+        print("\n[TEST 15] Sıcak Chromium Havuzu")
+        from pdf_service import BrowserPool
+
+        crashes = []
+
+        class FakePage:
+            def __init__(self, browser): self.browser = browser
+            def is_closed(self): return False
+            def set_content(self, html):
+                if html == "crash" and not crashes:
+                    crashes.append(1)
+                    self.browser.connected = False
+                    raise RuntimeError("Target crashed")
+            def pdf(self, **kw): return b"%PDF-fake"
+
+        class FakeBrowser:
+            def __init__(self): self.connected = True
+            def is_connected(self): return self.connected
+            def new_page(self): return FakePage(self)
+            def close(self): self.connected = False
+
+        launches = []
+        def launcher():
+            launches.append(1)
+            return None, FakeBrowser()
+
+        pool = BrowserPool(size=1, max_renders=3, launcher=launcher)
+        try:
+            for _ in range(3): self.assertEqual(pool.render("<p>x</p>"), b"%PDF-fake")
+            self.assertEqual(len(launches), 1)
+            pool.render("<p>x</p>")
+            self.assertEqual(len(launches), 2)
+            self.assertEqual(pool.render("crash"), b"%PDF-fake")
+            self.assertEqual(len(launches), 3)
+        finally:
+            pool.stop()
+        print("✅ BAŞARILI")
+
+    def test_16_pdf_onbellegi(self):
+        """SENARYO: Aynı dilekçe tekrar indirilince render edilmemeli; içerik/tarih değişince eski PDF silinmeli."""
+        print("\n[TEST 16] PDF Önbelleği")
+        import os
+        import pdf_service
+        renders = []
+        original = pdf_service.browser_pool.render
+        pdf_service.browser_pool.render = lambda html: renders.append(html) or b"%PDF-fake"
+        try:
+            path1, etag1 = pdf_service.cached_pdf(7, "<p>Tarih: 01.01.2026</p>", self.tmp_dir)
+            path2, etag2 = pdf_service.cached_pdf(7, "<p>Tarih: 01.01.2026</p>", self.tmp_dir)
+            self.assertEqual((path1, etag1), (path2, etag2))
+            self.assertEqual(len(renders), 1)
+            path3, etag3 = pdf_service.cached_pdf(7, "<p>Tarih: 02.01.2026</p>", self.tmp_dir)
+            self.assertNotEqual(etag1, etag3)
+            self.assertEqual(os.listdir(self.tmp_dir), [os.path.basename(path3)])
+        finally:
+            pdf_service.browser_pool.render = original
+        print("✅ BAŞARILI")
+
+    def test_17_ocr_sayfa_araliklari(self):
+        """SENARYO: Sayfalar çekirdeklere sırayla, boşluksuz ve parça sınırını aşmadan dağıtılmalı."""
+        print("\n[TEST 17] Paralel OCR Sayfa Aralıkları")
+        from ocr_service import page_chunks
+        self.assertEqual(page_chunks(20, workers=4, chunk=4), [(1, 4), (5, 8), (9, 12), (13, 16), (17, 20)])
+        self.assertEqual(page_chunks(3, workers=8, chunk=4), [(1, 1), (2, 2), (3, 3)])
+        chunks = page_chunks(29, workers=3, chunk=6)
+        self.assertEqual([p for a, b in chunks for p in range(a, b + 1)], list(range(1, 30)))
+        self.assertTrue(all(b - a + 1 <= 6 for a, b in chunks))
+        print("✅ BAŞARILI")
+
+    def test_18_pdf_metin_katmani_oncelikli(self):
+        """SENARYO: Metin katmanı olan sayfalar OCR'lanmamalı, sadece boş/zayıf sayfalar OCR'a gitmeli."""
+        print("\n[TEST 18] PDF Metin Katmanı Hızlı Yolu")
+        from unittest import mock
+        from concurrent.futures import ThreadPoolExecutor
+        import ocr_service
+        layer = "T.C. İSTANBUL VALİLİĞİ İl Emniyet Müdürlüğü trafik idari para cezası karar tutanağı."
+        with ThreadPoolExecutor(2) as pool, \
+             mock.patch.object(ocr_service, "pdfinfo_from_path", return_value={"Pages": 4}), \
+             mock.patch.object(ocr_service, "extract_text_layer", return_value=[layer, "", layer, "..  .. ~~"]), \
+             mock.patch.object(ocr_service, "get_ocr_pool", return_value=pool), \
+             mock.patch.object(ocr_service, "ocr_pdf_pages", side_effect=lambda fp, a, b, deadline=None: [(f"OCR-{p}", 0.1) for p in range(a, b + 1)]):
+            text, warning, ocr_pages, timings = ocr_service.extract_pdf_text("belge.pdf")
+        self.assertEqual(ocr_pages, [2, 4])
+        self.assertEqual(timings, {2: 0.1, 4: 0.1})
+        self.assertEqual(text.split("\n"), [layer, "OCR-2", layer, "OCR-4"])
+        self.assertIsNone(warning)
+        print("✅ BAŞARILI")
+
+    def test_19_ocr_is_kuyrugu(self):
+        """SENARYO: Yükleme iş id'si dönmeli, iş arka planda bitmeli; kullanıcı ve kuyruk limitleri uygulanmalı."""
+        print("\n[TEST 19] Asenkron OCR İş Kuyruğu")
+        import threading
+        from ocr_jobs import OCRJobQueue, QueueFullError
+        release = threading.Event()
+        def processor(path, cache_key=None):
+            release.wait(5)
+            return {"text": f"okundu:{path}"}
+        queue = self.queue = OCRJobQueue(f"{self.tmp_dir}/jobs.db", workers=1, max_depth=1, per_user=1, processor=processor)
+
+        job1 = queue.enqueue(1, "a.pdf")
+        with self.assertRaises(QueueFullError): queue.enqueue(1, "b.pdf")
+        self.assertIsNone(queue.status(job1, user_id=2))
+
+        release.set()
+        for _ in range(100):
+            job = queue.status(job1, user_id=1)
+            if job["status"] == "done": break
+            time.sleep(0.05)
+        self.assertEqual(job["text"], "okundu:a.pdf")
+        self.assertTrue(queue.enqueue(1, "c.pdf"))
+
+        # Çöken worker'dan 'running' kalan iş: kira dolunca yeniden sıraya girmeli, hak bitince hatayla kapanmalı
+        import sqlite3
+        queue.stop()
+        stale = OCRJobQueue(f"{self.tmp_dir}/stale.db", workers=0, per_user=1, lease=60, max_attempts=2, processor=processor)
+        upload = f"{self.tmp_dir}/d.pdf"
+        open(upload, "wb").close()
+        job = stale.enqueue(7, upload)
+        stale.claim()
+        with sqlite3.connect(stale.path) as conn: conn.execute("UPDATE ocr_jobs SET updated = ?", (time.time() - 120,))
+        with self.assertRaises(QueueFullError): OCRJobQueue(stale.path, per_user=1, lease=3600).enqueue(7, "e.pdf")
+        self.assertEqual(stale.claim()[0], job)  # kira dolmuş: tekrar alınabilir
+        with sqlite3.connect(stale.path) as conn: conn.execute("UPDATE ocr_jobs SET updated = ?", (time.time() - 120,))
+        self.assertIsNone(stale.claim())  # ikinci kez sahipsiz: deneme hakkı bitti
+        self.assertEqual(stale.status(job)["status"], "error")
+        self.assertFalse(os.path.exists(upload))  # kapatılan işin yüklemesi diskte kalmaz
+        self.assertTrue(stale.enqueue(7, "e.pdf"))
+        print("✅ BAŞARILI")
+
+    def test_20_ocr_sonuc_onbellegi(self):
+        """SENARYO: Aynı dosya ikinci kez yüklenince diske yazılmadan ve OCR çalışmadan önbellekten dönmeli."""
+        print("\n[TEST 20] OCR İçerik Hash Önbelleği")
+        import io, os
+        from unittest import mock
+        from PIL import Image
+        from werkzeug.datastructures import FileStorage
+        from cache_service import LRUCache
+        import ocr_service
+        image = io.BytesIO()
+        Image.new("RGB", (20, 20), "white").save(image, format="PNG")
+        upload = lambda: FileStorage(io.BytesIO(image.getvalue()), filename="ceza.png")
+        with mock.patch.object(ocr_service, "ocr_cache", LRUCache(8)), \
+             mock.patch.object(ocr_service, "UPLOAD_FOLDER", self.tmp_dir), \
+             mock.patch.object(ocr_service, "ocr_image", return_value=("Trafik cezası tutanağı", 0.2)) as ocr:
+            first = ocr_service.extract_text_from_file(upload())
+            second = ocr_service.receive_upload(upload())
+        self.assertEqual(ocr.call_count, 1)
+        self.assertNotIn("cached", first)
+        self.assertEqual(second["result"]["text"], "Trafik cezası tutanağı")
+        self.assertTrue(second["result"]["cached"])
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+        print("✅ BAŞARILI")
+
+    def test_21_yukleme_erken_red(self):
+        """SENARYO: Geçersiz tür ilk parçada, büyük dosya sınırı aştığı anda reddedilmeli; akış sonuna kadar okunmamalı."""
+        print("\n[TEST 21] Akışlı Yükleme ve Erken Red")
+        import io, os
+        from unittest import mock
+        from PIL import Image
+        from werkzeug.datastructures import FileStorage
+        from cache_service import LRUCache
+        import ocr_service
+
+        class CountingStream(io.RawIOBase):
+            def __init__(self, head, size):
+                self.head, self.size, self.read_bytes = head, size, 0
+            def read(self, n=-1):
+                n = min(n, self.size - self.read_bytes)
+                chunk = (self.head + b"\0" * n)[:n] if self.read_bytes == 0 else b"\0" * n
+                self.read_bytes += n
+                return chunk
+
+        with mock.patch.object(ocr_service, "UPLOAD_FOLDER", self.tmp_dir), \
+             mock.patch.object(ocr_service, "MAX_FILE_SIZE", 1024 * 1024):
+            junk = CountingStream(b"MZ\x90\x00", 50 * 1024 * 1024)
+            self.assertIn("error", ocr_service.receive_upload(FileStorage(junk, filename="x.pdf")))
+            self.assertEqual(junk.read_bytes, ocr_service.UPLOAD_CHUNK_SIZE)
+
+            big = CountingStream(b"%PDF-1.7\n", 50 * 1024 * 1024)
+            res = ocr_service.receive_upload(FileStorage(big, filename="x.pdf"))
+            self.assertEqual(res["error"], ocr_service.TOO_LARGE_ERROR["error"])
+            self.assertLess(big.read_bytes, 2 * 1024 * 1024)
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+
+            # IN_MEMORY_MAX altındaki PDF önbellek kontrolüne kadar bellekte kalır, üstü diske akıtılır
+            small = ocr_service.receive_upload(FileStorage(CountingStream(b"%PDF-1.7\n", 100 * 1024), filename="x.pdf"))
+            self.assertEqual((len(small["data"]), small["ext"]), (100 * 1024, "pdf"))
+            cache = LRUCache(8)
+            cache.set(small["cache_key"], {"text": "okunmuş"})
+            with mock.patch.object(ocr_service, "ocr_cache", cache):
+                hit = ocr_service.receive_upload(FileStorage(CountingStream(b"%PDF-1.7\n", 100 * 1024), filename="x.pdf"))
+            self.assertTrue(hit["result"]["cached"])
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+            with mock.patch.object(ocr_service, "IN_MEMORY_MAX", 128 * 1024):
+                pdf = ocr_service.receive_upload(FileStorage(CountingStream(b"%PDF-1.7\n", 200 * 1024), filename="x.pdf"))
+            self.assertTrue(pdf["path"].endswith(".pdf") and os.path.getsize(pdf["path"]) == 200 * 1024)
+            png = io.BytesIO()
+            Image.new("RGB", (20, 20), "white").save(png, format="PNG")
+            image = ocr_service.receive_upload(FileStorage(io.BytesIO(png.getvalue()), filename="foto.png"))
+            self.assertEqual(image["data"], png.getvalue())
+            self.assertEqual(os.listdir(self.tmp_dir), [os.path.basename(pdf["path"])])
+            os.remove(pdf["path"])
+
+            # Gerçek multipart gövde: werkzeug'un geçici dosyası yerine UploadSpool'a akar, tür ağdan gelirken denetlenir
+            from flask import Flask, request
+            web = Flask(__name__)
+            web.request_class = ocr_service.UploadRequest
+            seen = {}
+            @web.route("/yukle", methods=["POST"])
+            def yukle():
+                seen["spool"] = request.files["dosya"].stream
+                upload = ocr_service.receive_upload(request.files["dosya"])
+                return {"keys": sorted(upload), "error": upload.get("error")}
+            client = web.test_client()
+            junk = client.post("/yukle", data={"dosya": (io.BytesIO(b"MZ\x90\x00" + b"\0" * 900 * 1024), "x.pdf")}).get_json()
+            self.assertEqual(junk["error"], ocr_service.INVALID_FORMAT_ERROR["error"])
+            self.assertTrue(seen["spool"].rejected and seen["spool"].file_path is None)
+            with mock.patch.object(ocr_service, "IN_MEMORY_MAX", 128 * 1024):
+                big = client.post("/yukle", data={"dosya": (io.BytesIO(b"%PDF-1.7\n" + b"\0" * 2 * 1024 * 1024), "x.pdf")})
+            self.assertEqual(big.status_code, 413)
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+            small = client.post("/yukle", data={"dosya": (io.BytesIO(b"%PDF-1.7\n" + b"\0" * 600 * 1024), "x.pdf")}).get_json()
+            self.assertIn("data", small["keys"])
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+        print("✅ BAŞARILI")
+
+    def test_22_goruntu_on_isleme(self):
+        """SENARYO: Telefon fotoğrafı EXIF'e göre döndürülmeli, A4 @ hedef DPI'ya küçültülmeli, siyah-beyaz ve eğimsiz olmalı."""
+        print("\n[TEST 22] OCR Görüntü Ön İşleme")
+        import io
+        import numpy as np
+        from unittest import mock
+        import ocr_service
+        from benchmarks.ocr_preprocess_bench import make_sample
+        self.assertEqual(ocr_service.target_size((4000, 3000), dpi=100), (1169, 877))
+        self.assertEqual(ocr_service.target_size((800, 600), dpi=100), (800, 600))
+
+        data, _ = make_sample(0)
+        with mock.patch.object(ocr_service, "OCR_IMAGE_DPI", 150):
+            image = ocr_service.load_image(io.BytesIO(data))
+        self.assertEqual(image.mode, "L")
+        self.assertGreater(image.size[1], image.size[0])  # Yatay çekilmiş fotoğraf dikey sayfaya çevrildi
+        self.assertLessEqual(max(image.size), 1800)
+        self.assertEqual(set(np.unique(np.asarray(image))) - {0, 255}, set())
+        self.assertLessEqual(abs(ocr_service.estimate_skew(image, step=0.25)), 0.5)
+        print("✅ BAŞARILI")
+
+    def test_23_kalici_ocr_motoru(self):
+        """SENARYO: OCR motoru bir kez açılıp yeniden kullanılmalı; eşzamanlı thread'ler aynı motoru paylaşmamalı."""
+        print("\n[TEST 23] Kalıcı OCR Motoru Havuzu")
+        import threading
+        from unittest import mock
+        import ocr_service
+        created, active, overlap = [], set(), []
+        class FakeEngine:
+            def __init__(self, lang): created.append(self)
+            def image_to_string(self, image, timeout=None):
+                if self in active: overlap.append(self)
+                active.add(self); time.sleep(0.02); active.discard(self)
+                return f"metin:{image}"
+        with mock.patch.object(ocr_service, "create_engine", FakeEngine), \
+             mock.patch.object(ocr_service, "_engines", {}), mock.patch.object(ocr_service, "_engines_pid", None):
+            text, seconds = ocr_service.run_ocr("sayfa")
+            ocr_service.run_ocr("sayfa")
+            self.assertEqual((text, len(created)), ("metin:sayfa", 1))
+            self.assertGreater(seconds, 0)
+            threads = [threading.Thread(target=ocr_service.run_ocr, args=("x",)) for _ in range(4)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        self.assertLessEqual(len(created), 4)
+        self.assertEqual(overlap, [])
+        print("✅ BAŞARILI")
+
+    def test_24_derlenmis_kural_motoru(self):
+        """SENARYO: Aynı tarih/tutar metinde tekrarlansa da tek uyarı; anahtar kelimeler otomatla doğru bulunmalı."""
+        print("\n[TEST 24] Derlenmiş Kural Motoru")
+        import json
+        from benchmarks.rule_engine_bench import SAMPLE_RULES
+        with open(f"{self.tmp_dir}/rules.json", "w", encoding="utf-8") as f: json.dump(SAMPLE_RULES, f, ensure_ascii=False)
+        engine = RuleEngine(f"{self.tmp_dir}/rules.json")
+        old_date = (datetime.now() - timedelta(days=40)).strftime("%d.%m.%Y")
+        ocr = f"Tebliğ {old_date}. " * 50 + "Ürün 150.000 TL, iade 150.000 TL. " * 20
+
+        trafik = engine.check("trafik_cezasi", "İtiraz ediyorum.", ocr).splitlines()
+        self.assertEqual(len(trafik), 1)
+        self.assertIn(old_date, trafik[0])
+        tuketici = engine.check("tuketici_haklari", "Sipariş verdim.", ocr).splitlines()
+        self.assertEqual(sum("104000" in w for w in tuketici), 1)
+        self.assertIn("Cayma süresi (40 gün)", "\n".join(tuketici))
+        self.assertIn("Fatura veya sözleşme", engine.check("tuketici_haklari", "Ürün bozuk.", ""))
+        self.assertEqual(engine.check("bilinmeyen", ocr), "")
+
+        words = ["he", "she", "his", "hers", "garanti belgesi", "belge"]
+        self.assertEqual(AhoCorasick(words).find("ushers garanti belgesi"), {"he", "she", "hers", "garanti belgesi", "belge"})
+        print("✅ BAŞARILI")
+
+    def test_25_bilgi_bankasi_sicak_yenileme(self):
+        """SENARYO: Değişen dosya arka planda yeniden kurulup atomik değişmeli; sadece değişen madde embed edilmeli, bozuk kural dosyası yayınlanmamalı."""
+        print("\n[TEST 25] Kural ve Mevzuat Sıcak Yenileme")
+        import os, json
+        from unittest import mock
+        import logic_services
+        docs, rules = f"{self.tmp_dir}/mevzuat.txt", f"{self.tmp_dir}/rules.json"
+        def write_docs(extra):
+            with open(docs, "w", encoding="utf-8") as f:
+                f.write("id: a\nkategori: kira\nbaslik: KİRA\nicerik: kiracı tahliye\n\n"
+                        f"id: b\nkategori: is\nbaslik: İŞ\nicerik: kıdem tazminatı {extra}\n")
+        write_docs("")
+        with open(rules, "w", encoding="utf-8") as f: json.dump({"kira": {"zorunlu_kelimeler": ["sözleşme"], "eksik_belge_mesaji": "Eksik"}}, f)
+        old_db = VectorDatabase(docs, embed_fn=local_embedding, store_dir=f"{self.tmp_dir}/store")
+        old_rules = RuleEngine(rules)
+        with mock.patch.object(logic_services, "vector_db", old_db), mock.patch.object(logic_services, "expert_system", old_rules):
+            reloader = logic_services.KnowledgeReloader(docs, rules, interval=0)
+            self.assertEqual(reloader.reload(), [])
+
+            write_docs("ihbar")
+            os.utime(docs, ns=(time.time_ns(), time.time_ns() + 10**9))
+            self.assertEqual(reloader.reload(), ["mevzuat"])
+            self.assertIsNot(logic_services.vector_db, old_db)
+            self.assertEqual(reloader.last_reload["embedded"], 1)
+            self.assertNotIn("ihbar", old_db.docs[1]["icerik"])  # eski anlık görüntü değişmedi
+            self.assertIn("ihbar", logic_services.vector_db.docs[1]["icerik"])
+
+            with open(rules, "w", encoding="utf-8") as f: f.write("{bozuk")
+            os.utime(rules, ns=(time.time_ns(), time.time_ns() + 2 * 10**9))
+            self.assertEqual(reloader.reload(), [])
+            self.assertIs(logic_services.expert_system, old_rules)
+            self.assertIsNotNone(reloader.last_error)
+            self.assertEqual(reloader.stats()["version"], 2)
+
+            # Admin yenilemesi isteği bekletmez: ortak depoya yazılır, kurulum arka plan thread'inde yapılır
+            with open(rules, "w", encoding="utf-8") as f: json.dump({}, f)
+            reloader.request_reload()
+            for _ in range(100):
+                if reloader.stats()["version"] == 3: break
+                time.sleep(0.02)
+            self.assertEqual(reloader.stats()["version"], 3)
+            self.assertFalse(reloader.force_pending())  # aynı istek ikinci kez uygulanmaz
+            self.assertEqual(reloader.published()["pid"], os.getpid())
+
+        # Eşzamanlı kurulan iki anlık görüntü korpusu bir kez embed etmeli, depoda tek matris dosyası kalmalı
+        import threading
+        calls = []
+        def slow_batch(texts):
+            calls.extend(texts)
+            time.sleep(0.05)
+            return [local_embedding(t) for t in texts]
+        store = f"{self.tmp_dir}/shared_store"
+        dbs = []
+        threads = [threading.Thread(target=lambda: dbs.append(VectorDatabase(docs, embed_batch_fn=slow_batch, store_dir=store)))
+                   for _ in range(2)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(len(calls), len(dbs[0].chunks))
+        self.assertEqual([len(db.matrix_docs) for db in dbs], [len(dbs[0].chunks)] * 2)
+        self.assertEqual(len([n for n in os.listdir(store) if n.endswith(".npy")]), 1)
+        print("✅ BAŞARILI")
+
+    def test_26_mevzuat_parcalama(self):
+        """SENARYO: Uzun madde bentlerinden örtüşmeli parçalara bölünmeli; bağlam bütçeyi aşmamalı ve örtüşme tekrar etmemeli."""
+        print("\n[TEST 26] Mevzuat Parçalama ve Bütçeli Bağlam")
+        doc = {"id": "m1", "kategori": "kira", "baslik": "TEST KANUNU (Madde 1)",
+               "icerik": "Kiracı şu haklara sahiptir; " + " ".join(f"{c}) Bent {c} kapsamında kiracı tahliye ve bedel konusunda hak sahibidir." for c in "abcçdefg")}
+        chunks = chunk_document(doc, max_tokens=60, overlap=1)
+        self.assertGreater(len(chunks), 2)
+        self.assertTrue(all(c["id"] == "m1" and c["baslik"] == doc["baslik"] and c["chunk_count"] == len(chunks) for c in chunks))
+        self.assertTrue(all(estimate_tokens(c["icerik"]) <= 60 for c in chunks))
+        overlap = chunks[1]["icerik"][:chunks[1]["overlap_chars"] - 1]
+        self.assertTrue(overlap and chunks[0]["icerik"].endswith(overlap))
+
+        context = assemble_context(chunks, budget=10_000)
+        self.assertEqual(context.count("KANUN:"), 1)
+        self.assertEqual(context.count("Bent b kapsamında"), 1)
+        self.assertIn("Bent g kapsamında", context)
+        small = assemble_context(chunks, budget=70)
+        self.assertLess(estimate_tokens(small), estimate_tokens(context))
+
+        db = VectorDatabase("legal_docs/mevzuat.txt", store_dir=f"{self.tmp_dir}/store")
+        self.assertGreater(len(db.chunks), len(db.docs))
+        self.assertEqual(db.search("seçimlik haklar ücretsiz onarım", "tuketici_haklari", top_k=1)[0]["id"], "tuketici_secimlik_haklar")
+        print("✅ BAŞARILI")
+
+    def test_27_dashboard_keyset_sayfalama(self):
+        """SENARYO: Dashboard sayfaları eksiksiz/tekrarsız ilerlemeli, büyük metin kolonları listelemede yüklenmemeli."""
+        print("\n[TEST 27] Keyset Sayfalama ve Ertelenmiş Kolonlar")
+        from sqlalchemy import inspect
+        from models import db, User, Petition, petition_page, encode_cursor, decode_cursor
+        from benchmarks.dashboard_bench import build_app, seed
+        with build_app(f"{self.tmp_dir}/t.db").app_context():
+            seed(95, 1)
+            expected = [p.id for p in Petition.query.filter_by(user_id=1).order_by(Petition.date_created.desc(), Petition.id.desc())]
+            seen, cursor = [], None
+            while True:
+                rows, cursor = petition_page(1, decode_cursor(encode_cursor(cursor)), limit=20)
+                seen += [r.id for r in rows]
+                self.assertTrue(all(len(r.preview) <= 150 for r in rows))
+                if not cursor: break
+            self.assertEqual(seen, expected)
+            self.assertIsNone(decode_cursor("bozuk"))
+
+            db.session.expunge_all()
+            petition = db.session.get(Petition, expected[0])
+            self.assertTrue({"content", "advice", "ocr_data"} <= inspect(petition).unloaded)
+            self.assertTrue(petition.content)
+            self.assertFalse({"advice", "ocr_data"} & inspect(petition).unloaded)  # grup tek sorguda geldi
+            db.session.remove()
+        print("✅ BAŞARILI")
+
+    def test_28_metrik_ozet_tablosu(self):
+        """SENARYO: Dilekçe eklenirken özet satırı aynı transaction'da artmalı; backfill aynı sonucu üretmeli, p50/p95 hesaplanmalı."""
+        print("\n[TEST 28] Artımlı Metrik Özet Tablosu")
+        from datetime import datetime
+        from models import db, User, Petition, PetitionRollup, backfill_rollup, rollup_summary, histogram_quantile
+        from benchmarks.dashboard_bench import build_app
+        with build_app(f"{self.tmp_dir}/t.db").app_context():
+            db.create_all()
+            db.session.add(User(id=1, username="u", password="x"))
+            for i, sec in enumerate([0.5, 1.5, 3, 4, 8, 45]):
+                db.session.add(Petition(category="Kira" if i % 2 else "Tüketici", content="x", user_id=1,
+                                        processing_time=sec, token_count=100, cost_usd=0.01, cache_hit=(i == 0)))
+            db.session.commit()
+            db.session.add(Petition(category="Kira", content="y", user_id=1, processing_time=2, date_created=datetime(2024, 5, 1)))
+            db.session.rollback()  # geri alınan kayıt özete yansımamalı
+
+            live = rollup_summary()
+            self.assertEqual((live["total_petitions"], live["total_tokens"], live["cache_hits"]), (6, 600, 1))
+            self.assertEqual(live["categories"], {"Tüketici": 3, "Kira": 3})
+            self.assertAlmostEqual(live["avg_time"], 62 / 6)
+            self.assertTrue(2 <= live["p50"] <= 5 and 30 <= live["p95"] <= 60)
+            self.assertEqual(live["series"][-1][1], 6)
+
+            live_rows = sorted((r.day, r.category, r.count, r.le_5, r.le_60) for r in PetitionRollup.query)
+            self.assertEqual(backfill_rollup(), 2)
+            self.assertEqual(sorted((r.day, r.category, r.count, r.le_5, r.le_60) for r in PetitionRollup.query), live_rows)
+            self.assertEqual(histogram_quantile(0.5, [0, 0, 10, 0, 0, 0, 0, 0]), 3.5)
+            db.session.remove()
+        print("✅ BAŞARILI")
+
+    def test_29_veritabani_motor_ayarlari(self):
+        """SENARYO: SQLite bağlantıları WAL/NORMAL/busy_timeout ile açılmalı, eşzamanlı yazıcılar kilit hatası almamalı;
+        PostgreSQL adresleri havuz ayarlarıyla aynen kullanılabilmeli."""
+        print("\n[TEST 29] Veritabanı Motor Ayarları")
+        import threading
+        from sqlalchemy import text
+        from models import db, User, Petition, database_config, SQLITE_BUSY_TIMEOUT_MS
+        from benchmarks.dashboard_bench import build_app
+
+        uri, options = database_config("postgres://u:p@db.local/hukuk")
+        self.assertEqual(uri, "postgresql://u:p@db.local/hukuk")
+        self.assertTrue(options["pool_pre_ping"] and options["pool_size"] > 0)
+        self.assertEqual(database_config("sqlite://")[1], {})
+
+        app = build_app(f"{self.tmp_dir}/t.db")
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, username="u", password="x"))
+            db.session.commit()
+            pragmas = [db.session.execute(text(f"PRAGMA {name}")).scalar() for name in ("journal_mode", "synchronous", "busy_timeout")]
+            self.assertEqual(pragmas, ["wal", 1, SQLITE_BUSY_TIMEOUT_MS])
+            db.session.remove()
+
+        errors = []
+        def writer(n):
+            with app.app_context():
+                try:
+                    for i in range(20):
+                        db.session.add(Petition(category="Kira", content=f"{n}-{i}", user_id=1))
+                        db.session.commit()
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    db.session.remove()
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(errors, [])
+        with app.app_context():
+            self.assertEqual(Petition.query.count(), 80)
+            db.session.remove()
+        print("✅ BAŞARILI")
+
+    def test_30_asama_izleme_ve_metrikler(self):
+        """SENARYO: İzlenen view'in aşama süreleri histogramlara ve Server-Timing'e yazılmalı, /metrics Prometheus
+        biçiminde (kümülatif kovalar) dönmeli; profilleyici yavaş isteğin yığınlarını kaydetmeli."""
+        print("\n[TEST 30] Aşama İzleme ve Metrikler")
+        import os
+        import time
+        from flask import Flask
+        import tracing
+        from tracing import traced, stage, current_timings, Histogram, SlowRequestProfiler
+
+        web = Flask(__name__)
+        seen = {}
+        @web.route("/is")
+        @traced("test_is")
+        def work():
+            with stage("rules"): time.sleep(0.01)
+            with stage("rag"):
+                with stage("embedding"): time.sleep(0.02)
+            with stage("rules"): pass
+            seen.update(current_timings())
+            return "ok"
+
+        old_profiler, tracing.profiler = tracing.profiler, SlowRequestProfiler(0.01, interval_ms=2, out_dir=f"{self.tmp_dir}/prof")
+        try:
+            response = web.test_client().get("/is")
+        finally:
+            tracing.profiler = old_profiler
+        self.assertEqual(set(seen), {"rules", "rag", "embedding"})
+        self.assertTrue(seen["rag"] >= seen["embedding"] >= 0.02)
+        self.assertIn("embedding;dur=", response.headers["Server-Timing"])
+        self.assertIn("total;dur=", response.headers["Server-Timing"])
+        self.assertEqual(current_timings(), {})  # istek dışında iz yok
+        with stage("rules"): pass  # iz yokken sessizce çalışır
+
+        # İstek dışındaki iş (akışlı üretim thread'i) kendi izini açar, aşamaları aynı histograma düşer
+        import threading
+        def background():
+            with tracing.trace_context("test_arka", "POST"):
+                with stage("llm"): time.sleep(0.01)
+                seen["arka"] = current_timings()
+        worker = threading.Thread(target=background)
+        worker.start(); worker.join()
+        self.assertGreaterEqual(seen["arka"]["llm"], 0.01)
+
+        text = tracing.render_metrics()
+        self.assertIn('hukuk_stage_duration_seconds_count{route="test_arka",method="POST",stage="llm"} 1', text)
+        self.assertIn('hukuk_stage_duration_seconds_count{route="test_is",method="GET",stage="embedding"} 1', text)
+        self.assertIn('hukuk_request_duration_seconds_bucket{route="test_is",method="GET",le="+Inf"} 1', text)
+        profiles = os.listdir(f"{self.tmp_dir}/prof")
+        self.assertEqual(len(profiles), 1)
+        with open(f"{self.tmp_dir}/prof/{profiles[0]}", encoding="utf-8") as f: self.assertIn("tests.py:work", f.read())
+
+        h = Histogram("x_seconds", "x", ("stage",), buckets=(0.1, 1))
+        for v in (0.05, 0.1, 0.5, 3): h.observe(v, "ocr")
+        self.assertIn('x_seconds_bucket{stage="ocr",le="0.1"} 2', h.render())
+        self.assertIn('x_seconds_bucket{stage="ocr",le="1"} 3', h.render())
+        self.assertIn('x_seconds_count{stage="ocr"} 4', h.render())
+        self.assertTrue(tracing.render_info("x_info", "x", {"engine": "pytesseract"}).endswith('x_info{engine="pytesseract"} 1\n'))
+        print("✅ BAŞARILI")
+
+    def test_31_worker_arasi_ortak_durum(self):
+        """SENARYO: Aynı uygulamadan fork edilmiş 3 worker süreci tek bir hız sınırını paylaşmalı (toplamda 5 istek geçmeli)
+        ve bir worker'ın önbelleğe yazdığı sonuç diğerlerinde isabet olmalı; akış işi yalnızca bir worker tarafından alınabilmeli."""
+        print("\n[TEST 31] Worker'lar Arası Ortak Hız Sınırı ve Önbellek")
+        import multiprocessing as mp
+        from flask import Flask
+        from flask_limiter import Limiter
+        from flask_limiter.util import get_remote_address
+        from cache_service import SharedCache, get_backend
+
+        url = f"sqlite:///{self.tmp_dir}/shared_state.db"
+        web = Flask(__name__)
+        limiter = Limiter(get_remote_address, app=web, storage_uri=url)
+        cache = SharedCache("ocr_result", maxsize=8, ttl=60, backend=get_backend(url))
+        jobs = SharedCache("stream_jobs", maxsize=8, ttl=60, backend=get_backend(url))
+
+        @web.route("/dilekce")
+        @limiter.limit("5 per minute")
+        def dilekce(): return "ok"
+
+        ctx = mp.get_context("fork")  # gunicorn worker modeli: uygulama ana süreçte kurulur, worker'lar fork edilir
+        written, results = ctx.Event(), ctx.Queue()
+        def worker(i):
+            client = web.test_client()
+            codes = [client.get("/dilekce").status_code for _ in range(4)]
+            if i == 0:
+                cache.set("belge-hash", {"text": "Trafik cezası tutanağı"})
+                jobs.set("is-1", {"kategori": "trafik_cezasi"})
+                written.set()
+            written.wait(10)
+            results.put((i, codes, cache.get("belge-hash"), cache.hits, jobs.pop("is-1")))
+
+        procs = [ctx.Process(target=worker, args=(i,)) for i in range(3)]
+        for p in procs: p.start()
+        collected = [results.get(timeout=30) for _ in procs]
+        for p in procs: p.join(10)
+
+        codes = [c for _, worker_codes, *_ in collected for c in worker_codes]
+        self.assertEqual((codes.count(200), codes.count(429)), (5, 7))
+        for i, _, value, hits, _ in collected:
+            self.assertEqual(value, {"text": "Trafik cezası tutanağı"})
+            self.assertEqual(hits, 1)
+        self.assertEqual(sum(job is not None for *_, job in collected), 1)
+        self.assertEqual(len(cache), 1)
+        print("✅ BAŞARILI")
+
+    def test_32_ocr_havuzu_baslatma_ve_sure_siniri(self):
+        """SENARYO: OCR havuzu çok thread'li worker'dan fork ile değil forkserver/spawn ile açılmalı; süre bütçesi
+        dolunca worker kalan sayfaları atlamalı ve havuz yenilenmeli ki sonraki istekler eski işlerin arkasında beklemesin."""
+        print("\n[TEST 32] OCR Havuzu Başlatma Yöntemi ve Süre Sınırı")
+        from unittest import mock
+        import ocr_service
+        with mock.patch.object(ocr_service, "_ocr_pool", None), mock.patch.object(ocr_service, "_ocr_pool_pid", None):
+            pool = ocr_service.get_ocr_pool()
+            try:
+                self.assertNotEqual(pool._mp_context.get_start_method(), "fork")
+                self.assertEqual(pool.submit(ocr_service.page_chunks, 4, 2, 2).result(timeout=30), [(1, 2), (3, 4)])
+            finally:
+                ocr_service.recycle_ocr_pool(pool)
+            self.assertIsNot(ocr_service.get_ocr_pool(), pool)
+            ocr_service.recycle_ocr_pool(ocr_service._ocr_pool)
+
+        def slow_ocr(page, lang, timeout=None):
+            time.sleep(0.1)
+            return f"OCR-{page}", 0.1
+        with mock.patch.object(ocr_service, "convert_from_path", return_value=list(range(1, 11))), \
+             mock.patch.object(ocr_service, "run_ocr", side_effect=slow_ocr):
+            start = time.time()
+            pages = ocr_service.ocr_pdf_pages("belge.pdf", 1, 10, deadline=time.time() + 0.25)
+        self.assertTrue(1 <= len(pages) < 10)
+        self.assertLess(time.time() - start, 0.5)
+        print("✅ BAŞARILI")
+
+    def test_33_akis_rotasi(self):
+        """SENARYO: Akışlı form iş açmalı, /stream metni ve kayıt id'sini vermeli, Last-Event-ID ile kaldığı yerden sürmeli;
+        metin gönderildikten sonra kopan akış hata olayıyla bitmeli ve dilekçe kaydedilmemeli."""
+        print("\n[TEST 33] SSE Akış Rotası")
+        import re, json
+        from unittest import mock
+        web, client, _ = self.app_client()
+        text = "Sayın Mahkeme, talebimdir."
+        def fake_stream(*args):
+            yield "token", text[:15]
+            yield "token", text[15:]
+            yield "done", {"status": "DILEKCE_HAZIR", "hitap_makam": "MAKAM", "dilekce_metni": text, "hukuki_oneriler": "",
+                           "usage": {"total_tokens": 5, "processing_time": 0.1}}
+        def broken_stream(*args):
+            yield "token", text[:15]
+            yield "error", web.STREAM_BROKEN_MESSAGE
+        form = {"kategori": next(iter(web.CATEGORIES)), "aciklama": "Aldığım ürün bozuk çıktı, bedel iadesi istiyorum.", "stream": "1"}
+        def start(stream):
+            with mock.patch.object(web, "stream_llm", stream):
+                page = client.post("/", data=form).get_data(as_text=True)
+                job_id = re.search(r"/stream/([0-9a-f]{32})", page).group(1)
+                for _ in range(100):
+                    if web.stream_jobs.get(job_id)["state"] != "running": break
+                    time.sleep(0.02)
+            return job_id
+        with web.app.app_context(): before = web.Petition.query.count()
+
+        job_id = start(fake_stream)
+        body = client.get(f"/stream/{job_id}").get_data(as_text=True)
+        self.assertIn(f"data: {json.dumps(text, ensure_ascii=False)}", body)
+        done = json.loads(re.search(r"event: done\ndata: (.*)\n", body).group(1))
+        resumed = client.get(f"/stream/{job_id}", headers={"Last-Event-ID": "15"}).get_data(as_text=True)
+        self.assertIn(f"data: {json.dumps(text[15:], ensure_ascii=False)}", resumed)
+        with web.app.app_context(): self.assertEqual(web.db.session.get(web.Petition, done["petition_id"]).content, text)
+
+        body = client.get(f"/stream/{start(broken_stream)}").get_data(as_text=True)
+        self.assertIn("event: hata", body)
+        self.assertNotIn("event: done", body)
+        with web.app.app_context(): self.assertEqual(web.Petition.query.count(), before + 1)
+        self.assertEqual(client.get("/stream/yok").status_code, 404)
+        print("✅ BAŞARILI")
+
+    def test_34_pdf_etag_ve_dashboard_sayfalama(self):
+        """SENARYO: Kayıtlı dilekçenin PDF'i ETag ile dönmeli, If-None-Match 304 vermeli; dashboard imleç linkleri
+        kayıtları tekrarsız ve eksiksiz sayfalamalı."""
+        print("\n[TEST 34] PDF ETag ve Dashboard Sayfalama Rotaları")
+        import re, html
+        from unittest import mock
+        web, client, username = self.app_client()
+        with web.app.app_context():
+            user_id = web.User.query.filter_by(username=username).one().id
+            petitions = [web.Petition(category="Kira", content=f"Dilekce-{i}-son", advice="", user_id=user_id) for i in range(25)]
+            web.db.session.add_all(petitions)
+            web.db.session.commit()
+            ids = [p.id for p in petitions]
+
+        with mock.patch("pdf_service.html_to_pdf", return_value=b"%PDF-test") as render, \
+             mock.patch("pdf_service.PDF_CACHE_DIR", f"{self.tmp_dir}/pdf"):
+            first = client.get(f"/pdf?id={ids[-1]}")
+            self.assertEqual((first.status_code, first.data), (200, b"%PDF-test"))
+            again = client.get(f"/pdf?id={ids[-1]}", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(render.call_count, 1)
+
+        pages, url = [], "/dashboard"
+        while url:
+            page = client.get(url).get_data(as_text=True)
+            pages.append(set(re.findall(r"Dilekce-(\d+)-son", page)))
+            link = re.search(r'href="(/dashboard\?before=[^"]+)"', page)
+            url = html.unescape(link.group(1)) if link else None
+        self.assertEqual([len(p) for p in pages], [20, 5])
+        self.assertEqual(pages[0] | pages[1], {str(i) for i in range(25)})
+        print("✅ BAŞARILI")
+
+    def test_35_ocr_yukleme_rotasi(self):
+        """SENARYO: /ocr/upload resmi kuyruğa almalı, /ocr/status işi bitince metni vermeli; geçersiz tür 400 dönmeli."""
+        print("\n[TEST 35] Arka Plan OCR Rotaları")
+        import io
+        from unittest import mock
+        from PIL import Image
+        from cache_service import LRUCache
+        from ocr_jobs import OCRJobQueue
+        import ocr_service
+        web, client, _ = self.app_client()
+        self.queue = OCRJobQueue(f"{self.tmp_dir}/jobs.db", workers=1, processor=lambda path, cache_key=None: {"text": "okundu"})
+        png = io.BytesIO()
+        Image.new("RGB", (20, 20), "white").save(png, format="PNG")
+        with mock.patch.object(web, "ocr_queue", self.queue), mock.patch.object(ocr_service, "UPLOAD_FOLDER", self.tmp_dir), \
+             mock.patch.object(ocr_service, "ocr_cache", LRUCache(8)):
+            res = client.post("/ocr/upload", data={"dosya": (io.BytesIO(png.getvalue()), "foto.png")})
+            self.assertEqual(res.status_code, 202)
+            for _ in range(100):
+                job = client.get(f"/ocr/status/{res.get_json()['job_id']}").get_json()
+                if job["status"] == "done": break
+                time.sleep(0.02)
+            self.assertEqual(job["text"], "okundu")
+            bad = client.post("/ocr/upload", data={"dosya": (io.BytesIO(b"MZ\x90\x00" * 100), "x.png")})
+            self.assertEqual(bad.status_code, 400)
+            self.assertEqual(client.get("/ocr/status/yok").status_code, 404)
+        print("✅ BAŞARILI")
+
+    def test_36_metrics_erisimi(self):
+        """SENARYO: /metrics token yokken yalnızca localhost'a açık olmalı; token tanımlıysa Bearer başlığı istemeli."""
+        print("\n[TEST 36] /metrics Erişim Denetimi")
+        from unittest import mock
+        web, client, _ = self.app_client()
+        local = client.get("/metrics")
+        self.assertEqual(local.status_code, 200)
+        self.assertIn("hukuk_ocr_engine_info{engine=", local.get_data(as_text=True))
+        self.assertEqual(client.get("/metrics", environ_base={"REMOTE_ADDR": "203.0.113.5"}).status_code, 401)
+        with mock.patch.object(web, "METRICS_TOKEN", "gizli"):
+            self.assertEqual(client.get("/metrics").status_code, 401)
+            self.assertEqual(client.get("/metrics", headers={"Authorization": "Bearer gizli"}).status_code, 200)
+        print("✅ BAŞARILI")
+
+def tearDownModule():
+    shutil.rmtree(APP_TEST_DIR, ignore_errors=True)
+
 if __name__ == '__main__':
     print("=======================================================")
     print("🤖 HUKUK AI - SYSTEM INTEGRITY TESTS (v3.0)")
@@ -0,0 +1,201 @@
+# tracing.py — İstek başına aşama süreleri, Prometheus histogramları ve yavaş istek profilleyicisi
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from flask import request, make_response
+
+logger = logging.getLogger(__name__)
+
+# Kova üst sınırları (sn); OCR/LLM saniyeler, kural/RAG milisaniyeler sürdüğü için geniş tutulur
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "0"))  # Bu süreyi aşan isteklerin profili yazılır, 0 = kapalı
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_DEPTH = 64
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+# ==========================================
+# HİSTOGRAMLAR (PROMETHEUS)
+# ==========================================
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Histogram:
+    """Süreç içi histogram: etiket değerleri başına kova sayaçları, toplam ve adet.
+    Her gunicorn worker'ı kendi değerlerini tutar; Prometheus worker'ları ayrı hedef olarak toplar."""
+    def __init__(self, name, help_text, labels, buckets=STAGE_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            row = self.series.get(label_values)
+            if row is None: row = self.series[label_values] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            row["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            row["sum"] += value
+            row["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock: series = {k: dict(v, buckets=list(v["buckets"])) for k, v in self.series.items()}
+        for label_values, row in sorted(series.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, n in zip([f"{b:g}" for b in self.buckets] + ["+Inf"], row["buckets"]):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {row['sum']:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {row['count']}")
+        return "\n".join(lines)
+
+STAGE_SECONDS = Histogram("hukuk_stage_duration_seconds", "Dilekçe hattı aşama süresi (sn)", ("route", "method", "stage"))
+REQUEST_SECONDS = Histogram("hukuk_request_duration_seconds", "İzlenen isteklerin toplam süresi (sn)", ("route", "method"))
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def render_metrics():
+    return "\n".join(h.render() for h in (REQUEST_SECONDS, STAGE_SECONDS)) + "\n"
+
+def render_info(name, help_text, labels):
+    """Sabit değeri 1 olan bilgi göstergesi (ör. etkin OCR motoru); bilgi etiketlerde taşınır."""
+    values = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return f"# HELP {name} {help_text}\n# TYPE {name} gauge\n{name}{{{values}}} 1\n"
+
+# ==========================================
+# İSTEK İZİ VE AŞAMALAR
+# ==========================================
+class Trace:
+    def __init__(self, route, method):
+        self.route, self.method = route, method
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.total = None
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def timings(self):
+        return {name: round(seconds, 4) for name, seconds in self.stages.items()}
+
+    def server_timing(self):
+        """Server-Timing başlığı: tarayıcı geliştirici araçlarında aşama dökümü görünür."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        if self.total is not None: parts.append(f"total;dur={self.total * 1000:.1f}")
+        return ", ".join(parts)
+
+@contextmanager
+def stage(name):
+    """Aktif iz varsa bloğun süresini `name` aşamasına ekler (aynı aşama tekrar ederse toplanır, aşamalar iç içe olabilir).
+    İz yoksa (testler, CLI, arka plan thread'leri) hiçbir şey yapmaz."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try: yield
+    finally: trace.add(name, time.perf_counter() - start)
+
+def current_timings():
+    trace = _current_trace.get()
+    return trace.timings() if trace else {}
+
+@contextmanager
+def trace_context(route, method):
+    """Blok boyunca iz açar, bitişte aşamaları histogramlara yazar. İstek dışında çalışan işler
+    (ör. akışlı üretim thread'i) da aşamalarını bununla aynı histogramlara yazar."""
+    trace = Trace(route, method)
+    token = _current_trace.set(trace)
+    if profiler: profiler.attach()
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        finish_trace(trace)
+
+def traced(route):
+    """View dekoratörü: istek boyunca iz açar, bitişte aşamaları histogramlara yazar ve Server-Timing ekler."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with trace_context(route, request.method) as trace:
+                response = make_response(view(*args, **kwargs))
+            response.headers["Server-Timing"] = trace.server_timing()
+            return response
+        return wrapper
+    return decorator
+
+def finish_trace(trace):
+    trace.total = time.perf_counter() - trace.start
+    for name, seconds in trace.stages.items(): STAGE_SECONDS.observe(seconds, trace.route, trace.method, name)
+    REQUEST_SECONDS.observe(trace.total, trace.route, trace.method)
+    if profiler:
+        samples = profiler.detach()
+        if trace.total >= profiler.threshold and samples: profiler.dump(trace, samples)
+    return trace.total
+
+# ==========================================
+# YAVAŞ İSTEK PROFİLLEYİCİSİ (İSTEĞE BAĞLI)
+# ==========================================
+def collapse_stack(frame):
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SlowRequestProfiler:
+    """Tek daemon thread, izlenen istek thread'lerinin yığınını `interval_ms`'de bir örnekler (sys._current_frames).
+    İstek eşikten uzun sürerse örnekler 'collapsed stack' biçiminde yazılır (flamegraph.pl / speedscope ile açılır).
+    Hızlı isteklerin örnekleri atılır; izlenen istek yokken thread uyur."""
+    def __init__(self, threshold, interval_ms=PROFILE_INTERVAL_MS, out_dir=PROFILE_DIR):
+        self.threshold, self.interval, self.out_dir = threshold, interval_ms / 1000, out_dir
+        self.active = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def attach(self):
+        with self.lock:
+            self.active[threading.get_ident()] = Counter()
+            # Fork sonrası thread kopyalanmaz; her worker kendi örnekleyicisini başlatır
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, daemon=True, name="slow-request-profiler")
+                self.thread.start()
+        self.wake.set()
+
+    def detach(self):
+        with self.lock: return self.active.pop(threading.get_ident(), Counter())
+
+    def _run(self):
+        while True:
+            with self.lock: idle = not self.active
+            if idle:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, samples in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None: samples[collapse_stack(frame)] += 1
+
+    def dump(self, trace, samples):
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{trace.route}_{int(trace.total * 1000)}ms.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in samples.most_common(): f.write(f"{stack} {n}\n")
+        logger.warning(f"Yavaş istek: {trace.route} {trace.total:.2f} sn, aşamalar {trace.timings()}, profil: {path}")
+        return path
+
+profiler = SlowRequestProfiler(PROFILE_SLOW_SECONDS) if PROFILE_SLOW_SECONDS > 0 else None